@@ -13,7 +13,7 @@ config = {
     'version': tie.__version__,
     'author': 'Raphi',
     'author_email': 'r.gaziano@gmail.com',
-    'packages': ['tie'],
+    'packages': ['tie', 'tie.bench'],
     'scripts': [], # any script in the bin directory
     'url': 'https://github.com/raphigaziano/TIE.git',
     'download_url': None,
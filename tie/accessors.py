@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+Compiled context lookups.
+
+Lookup expressions such as ``user.address.city`` or ``items[0]['name']`` are
+parsed once into a chain of attribute and item getters, which is then reused
+for every render. Only plain names, attribute access and item access with
+integer or quoted string keys are supported; nothing is ever evaluated.
+
+Prefixes shared by several lookups (``user.address`` in ``user.address.city``
+and ``user.address.zip``) are resolved once per render when a memo scope is
+active (see :class:`MemoScope`).
+"""
+import re
+import threading
+
+from tie import utils
+from tie.exceptions import InvalidLookupError
+
+ATTR = 'attr'
+ITEM = 'item'
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+        \.\s*(?P<attr>[^\W\d]\w*)                   |  # .name
+        \[\s*(?P<int>-?\d+)\s*\]                    |  # [0]
+        \[\s*(?P<str>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")\s*\]  # ['key']
+    )""", re.VERBOSE | re.UNICODE)
+_ROOT = re.compile(r"\s*([^\W\d]\w*)", re.UNICODE)
+
+def parse(expr):
+    """
+    Parse the ``expr`` lookup expression and return a tuple
+    ``(root, path)``, where ``root`` is the name of the looked up context
+    variable and ``path`` a tuple of ``(kind, key)`` steps, ``kind`` being
+    either ATTR or ITEM.
+    Raise an InvalidLookupError if ``expr`` isn't a valid lookup.
+    """
+    m = _ROOT.match(expr)
+    if m is None:
+        raise InvalidLookupError("Invalid lookup expression: %s" % expr)
+    root, pos, path = m.group(1), m.end(), []
+    while pos < len(expr.rstrip()):
+        m = _TOKEN.match(expr, pos)
+        if m is None:
+            raise InvalidLookupError("Invalid lookup expression: %s" % expr)
+        if m.group('attr') is not None:
+            path.append((ATTR, m.group('attr')))
+        elif m.group('int') is not None:
+            path.append((ITEM, int(m.group('int'))))
+        else:
+            path.append((ITEM, _unquote(m.group('str'))))
+        pos = m.end()
+    return root, tuple(path)
+
+def _unquote(literal):
+    """Return the value of a quoted string literal"""
+    body = literal[1:-1]
+    if '\\' in body:
+        body = re.sub(r"\\(.)", r"\1", body)
+    return body
+
+
+class Accessor(object):
+    """
+    Compiled lookup expression.
+    Resolving it against a context dictionnary returns the same value as
+    evaluating the expression with the context as namespace would.
+    """
+    __slots__ = ('expr', 'root', 'path', 'prefixes')
+
+    def __init__(self, expr):
+        self.expr = expr
+        self.root, self.path = parse(expr)
+        # Canonical spelling of each intermediate prefix, used as memo keys
+        prefixes, key = [], self.root
+        for kind, step in self.path[:-1]:
+            key = (key, kind, step)
+            prefixes.append(key)
+        self.prefixes = tuple(prefixes)
+
+    def __repr__(self):
+        """Instance representation"""
+        return "<%s %r>" % (self.__class__.__name__, self.expr)
+
+    def resolve(self, context, memo=None):
+        """
+        Return the value pointed to by the expression in ``context``.
+        If a ``memo`` dictionnary is provided, intermediate values are looked
+        up from and stored into it, keyed on the identity of the root value.
+        Missing root variables raise a NameError; attribute or item lookup
+        errors are propagated unchanged.
+        """
+        try:
+            val = context[self.root]
+        except KeyError:
+            raise NameError("name '%s' is not defined" % self.root)
+        last = len(self.path) - 1
+        start = 0
+        if memo is not None:
+            # Prefixes are memoised per root value, which is kept alongside
+            # so that its id can't be reused while the memo lives
+            root, rid = val, id(val)
+            # Resume from the longest already resolved prefix
+            for i in range(last - 1, -1, -1):
+                entry = memo.get((rid, self.prefixes[i]))
+                if entry is not None and entry[0] is root:
+                    val, start = entry[1], i + 1
+                    break
+        for i in range(start, last + 1):
+            kind, step = self.path[i]
+            if kind is ATTR:
+                val = getattr(val, step)
+            else:
+                val = val[step]
+            if memo is not None and i < last:
+                memo[(rid, self.prefixes[i])] = (root, val)
+        return val
+
+_accessors = utils.LRUCache(maxsize=1024)
+
+def get_accessor(expr):
+    """Return the compiled Accessor for ``expr``, compiling it if needed."""
+    accessor = _accessors.get(expr)
+    if accessor is None:
+        accessor = _accessors[expr] = Accessor(expr)
+    return accessor
+
+### Memoisation ###
+
+_local = threading.local()
+
+def current_memo():
+    """Return the memo dictionnary of the active MemoScope, if any."""
+    return getattr(_local, 'memo', None)
+
+class MemoScope(object):
+    """
+    Context manager activating a lookup memo for its duration.
+    Renderers enter one per render, so that lookup prefixes are only resolved
+    once per context.
+    A fresh memo is used unless an existing ``memo`` dictionnary is passed.
+    """
+    __slots__ = ('_memo', '_previous')
+
+    def __init__(self, memo=None):
+        self._memo = {} if memo is None else memo
+
+    def __enter__(self):
+        self._previous = getattr(_local, 'memo', None)
+        _local.memo = self._memo
+        return self._memo
+
+    def __exit__(self, *exc_info):
+        _local.memo = self._previous
+        return False
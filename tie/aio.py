@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+asyncio rendering (Python 3 only).
+
+Tag processors may be coroutine functions (or return any awaitable). When
+rendering asynchronously, regular processors are called right away while all
+awaitable results of a render are awaited concurrently, so that a render takes
+as long as its slowest lookup instead of the sum of them.
+
+Use :func:`Template.render_async()<tie.template.Template.render_async>` rather
+than calling this module directly.
+"""
+import asyncio
+import inspect
+import logging
+
+from tie import utils, renderers, accessors
+
+LOGGER = logging.getLogger(__name__)
+
+def _start(slot, context):
+    """
+    Start processing ``slot``: return a ``(cache key, value)`` tuple, where
+    the value might be an awaitable to be resolved.
+    Cached results are looked up just like Tag.process_match would.
+    """
+    t = slot.tag
+    key = None
+    if t.cached:
+        key = t.cache_key(slot.match, context)
+        if key is not None:
+            val = t.cache.get(key, utils.MISSING)
+            if val is not utils.MISSING:
+                return None, val
+    val = t.processor(slot.match, **context)
+    if key is not None and not inspect.isawaitable(val):
+        t.cache[key] = val
+        key = None
+    return key, val
+
+async def _bounded(semaphore, awaitable):
+    """Await ``awaitable`` once ``semaphore`` allows it"""
+    async with semaphore:
+        return await awaitable
+
+async def render_async(template, context, limit=None):
+    """
+    Render ``template`` with the ``context`` dictionnary, awaiting all
+    asynchronous slot values concurrently, at most ``limit`` at a time
+    (defaults to the template's ``concurrency`` attribute; a limit of None or
+    0 means no limit).
+    Templates using a custom renderer, or tags redefining Tag.process, are
+    rendered synchronously.
+    """
+    compiled = template.compile()
+    if template.renderer is not renderers.default_renderer or \
+       not compiled.compilable:
+        return template.render(**context)
+    if limit is None:
+        limit = template.concurrency
+    parts = list(compiled.segments)
+    pending = []
+    with accessors.MemoScope():
+        for slot in compiled.slots:
+            key, val = _start(slot, context)
+            if inspect.isawaitable(val):
+                pending.append((slot, key, val))
+                continue
+            for i in slot.positions:
+                parts[i] = val
+    if pending:
+        LOGGER.debug("Awaiting %i slots", len(pending))
+        if limit:
+            semaphore = asyncio.Semaphore(limit)
+            awaitables = [_bounded(semaphore, aw) for _, _, aw in pending]
+        else:
+            awaitables = [aw for _, _, aw in pending]
+        values = await asyncio.gather(*awaitables)
+        for (slot, key, _), val in zip(pending, values):
+            if key is not None:
+                slot.tag.cache[key] = val
+            for i in slot.positions:
+                parts[i] = val
+    return ''.join(parts)
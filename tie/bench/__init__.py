@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+TIE benchmark suite.
+
+Reproducible scenarios measuring rendering throughput and latency over
+template size, tag count and lookup depth sweeps, DirectoryWatcher loads,
+batch rendering and multi-threaded rendering, along with ``string.Template``
+and ``str.format`` baselines. Reports record whether the interpreter runs
+with the GIL, so that thread scaling results of free-threaded CPython builds
+can be told apart.
+
+Run it with ``python -m tie.bench`` (see ``--help``); results can be saved
+as JSON and compared against a stored baseline, the command then failing if
+any result regressed beyond a given tolerance.
+"""
+from tie.bench.core import Scenario, measure, fit_exponent, complexity
+from tie.bench.scenarios import SCENARIOS, get_scenarios
+from tie.bench.report import make_report, save, load, compare
+
+def run(names=None, quick=False, **measure_args):
+    """
+    Run the built-in scenarios named in ``names`` (all of them by default)
+    and return their report (see :func:`tie.bench.report.make_report`).
+    ``quick`` runs reduced parameter sweeps.
+    """
+    results = []
+    for scenario in get_scenarios(names):
+        results.extend(scenario.run(quick=quick, **measure_args))
+    return make_report(results)
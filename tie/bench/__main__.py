@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+Command line entry point: ``python -m tie.bench``.
+"""
+import sys
+import argparse
+import warnings
+
+from tie import bench
+from tie.bench import report
+from tie.exceptions import ContextWarning
+
+def main(argv=None, stream=None):
+    """
+    Run the benchmarks, print their results to ``stream`` (defaults to
+    stdout) and return the process exit status.
+    """
+    parser = argparse.ArgumentParser(prog='python -m tie.bench',
+                                     description=bench.__doc__.strip())
+    parser.add_argument('scenarios', nargs='*',
+                        help="Scenarios to run (all by default): %s" %
+                             ', '.join(s.name for s in bench.SCENARIOS))
+    parser.add_argument('--quick', action='store_true',
+                        help="Run reduced parameter sweeps")
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help="Minimum time spent measuring each case, in "
+                             "seconds (default: %(default)s)")
+    parser.add_argument('--save', metavar='PATH',
+                        help="Save the results as JSON to PATH")
+    parser.add_argument('--compare', metavar='PATH',
+                        help="Compare the results to a saved baseline and "
+                             "fail on regressions")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="Allowed throughput drop when comparing, as a "
+                             "fraction of the baseline (default: "
+                             "%(default)s)")
+    args = parser.parse_args(argv)
+
+    try:
+        bench.get_scenarios(args.scenarios)
+    except KeyError as e:
+        parser.error("Unknown scenario: %s" % e.args[0])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', ContextWarning)
+        results = bench.run(args.scenarios, quick=args.quick,
+                            min_time=args.min_time)
+    report.write(report.format_report(results), stream)
+    if args.save:
+        report.save(results, args.save)
+    if args.compare:
+        rows = report.compare(report.load(args.compare), results,
+                              args.tolerance)
+        report.write('', stream)
+        report.write(report.format_comparison(rows), stream)
+        if any(r[-1] for r in rows):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
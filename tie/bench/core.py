@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+Benchmark measurement and running machinery.
+"""
+import gc
+import math
+import time
+import logging
+import contextlib
+
+from tie import tag
+
+LOGGER = logging.getLogger(__name__)
+
+timer = getattr(time, 'perf_counter', time.time)
+
+### Measurement ###
+
+def percentile(values, pct):
+    """
+    Return the ``pct`` percentile of the sorted ``values`` list, linearly
+    interpolated between closest ranks.
+    """
+    if not values:
+        raise ValueError("No values")
+    pos = (len(values) - 1) * pct / 100.0
+    low = int(math.floor(pos))
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (pos - low)
+
+def measure(op, min_time=0.2, min_samples=5, sample_time=0.001,
+            latency_time=None, max_latency_calls=100000):
+    """
+    Call the ``op`` callable repeatedly and return a dictionnary of
+    statistics about its run time (in seconds per call):
+    ``ops_per_sec``, ``mean``, ``p50``, ``p99``, ``samples``, ``calls`` and
+    ``latency_calls``.
+
+    ``op`` is run once to warm up, then in samples of as many calls as needed
+    to last at least ``sample_time`` seconds (so that very fast operations
+    aren't dominated by timing overhead), until at least ``min_samples``
+    samples were taken and ``min_time`` seconds were spent. Throughput and
+    mean times are computed over these samples.
+    Latency percentiles are computed over calls timed one by one, for at
+    least ``latency_time`` seconds (defaults to half of ``min_time``) and
+    ``min_samples`` calls, at most ``max_latency_calls`` calls.
+    """
+    if latency_time is None:
+        latency_time = min_time / 2.0
+    start = timer()
+    op()
+    elapsed = timer() - start
+    number = 1
+    if elapsed < sample_time:
+        number = int(sample_time / max(elapsed, 1e-9)) + 1
+    times, total = [], 0.0
+    latencies, latency_total = [], 0.0
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        while len(times) < min_samples or total < min_time:
+            start = timer()
+            for _ in range(number):
+                op()
+            elapsed = timer() - start
+            times.append(elapsed / number)
+            total += elapsed
+        while len(latencies) < max_latency_calls and \
+              (len(latencies) < min_samples or latency_total < latency_time):
+            start = timer()
+            op()
+            elapsed = timer() - start
+            latencies.append(elapsed)
+            latency_total += elapsed
+    finally:
+        if gc_enabled:
+            gc.enable()
+    latencies.sort()
+    mean = total / (len(times) * number)
+    return {
+        'ops_per_sec':   1.0 / mean if mean else float('inf'),
+        'mean':          mean,
+        'p50':           percentile(latencies, 50),
+        'p99':           percentile(latencies, 99),
+        'samples':       len(times),
+        'calls':         len(times) * number,
+        'latency_calls': len(latencies),
+    }
+
+def fit_exponent(points):
+    """
+    Return the exponent ``k`` of the power law ``time ~ param ** k`` best
+    fitting the ``(param, time)`` points (least squares over their
+    logarithms), or None if there are less than two usable points.
+    About 1 means linear, 0 constant, 2 quadratic...
+    """
+    logs = [(math.log(p), math.log(t)) for p, t in points if p > 0 and t > 0]
+    if len(logs) < 2:
+        return None
+    n = float(len(logs))
+    mean_x = sum(x for x, _ in logs) / n
+    mean_y = sum(y for _, y in logs) / n
+    var = sum((x - mean_x) ** 2 for x, _ in logs)
+    if not var:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in logs) / var
+
+### Scenarios ###
+
+@contextlib.contextmanager
+def null_fixture(param):
+    """Default scenario fixture: pass ``param`` along unchanged."""
+    yield param
+
+def data_fixture(func):
+    """
+    Return a scenario fixture providing ``func(param)`` as the cases' data.
+    """
+    @contextlib.contextmanager
+    def fixture(param):
+        yield func(param)
+    return fixture
+
+@contextlib.contextmanager
+def isolated_tags():
+    """
+    Run the enclosed block with a fresh global TagManager, restoring the
+    previous one afterwards.
+    """
+    previous = tag.get_manager()
+    tag.set_manager(tag.TagManager())
+    try:
+        yield tag.get_manager()
+    finally:
+        tag.set_manager(previous)
+
+
+class Scenario(object):
+    """
+    Benchmark scenario.
+
+    A scenario measures a set of cases (TIE code pathes and baselines) for
+    each value of its ``params`` sweep. Its ``fixture`` is a context manager
+    factory called with each param and providing the data shared by all
+    cases (defaults to the param itself). Cases are registered with the
+    :func:`case` decorator, as factories taking that data and returning the
+    operation to be measured. Each case is set up and measured with a fresh
+    global TagManager.
+    """
+    def __init__(self, name, description, params, quick_params=None,
+                 fixture=null_fixture):
+        self.name         = name
+        self.description  = description
+        self.params       = list(params)
+        self.quick_params = list(quick_params or self.params[:2])
+        self.fixture      = fixture
+        self.cases        = []
+
+    def __repr__(self):
+        """Instance representation"""
+        return "<%s %r>" % (self.__class__.__name__, self.name)
+
+    def case(self, name, baseline=False):
+        """
+        Decorator registering a case factory under ``name``.
+        Baselines (non-TIE implementations of the same work) are flagged
+        with ``baseline=True``.
+        """
+        def decorator(factory):
+            self.cases.append((name, factory, baseline))
+            return factory
+        return decorator
+
+    def run(self, quick=False, cases=None, **measure_args):
+        """
+        Measure every case (or only those named in ``cases``) for each param
+        and yield result dictionnaries (see :func:`measure`, with the added
+        ``scenario``, ``case``, ``param`` and ``baseline`` keys).
+        """
+        for param in (self.quick_params if quick else self.params):
+            with self.fixture(param) as data:
+                for name, factory, baseline in self.cases:
+                    if cases is not None and name not in cases:
+                        continue
+                    with isolated_tags():
+                        op = factory(data)
+                        LOGGER.info("Measuring %s/%s [%s]", self.name, name,
+                                    param)
+                        result = measure(op, **measure_args)
+                    result.update(scenario=self.name, case=name, param=param,
+                                  baseline=baseline)
+                    yield result
+
+def complexity(results):
+    """
+    Return a dictionnary mapping ``(scenario, case)`` pairs to the exponent
+    fitted over their results' mean times and params (see
+    :func:`fit_exponent`).
+    """
+    points = {}
+    for r in results:
+        points.setdefault((r['scenario'], r['case']), []).append(
+            (r['param'], r['mean']))
+    return dict((key, fit_exponent(pts)) for key, pts in points.items())
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+Benchmark results formatting, storage and comparison.
+"""
+import io
+import sys
+import json
+import time
+import platform
+import sysconfig
+
+import tie
+from tie import utils, parallel
+from tie.bench.core import complexity
+
+def make_report(results):
+    """
+    Return a JSON serializable dictionnary holding the ``results`` list,
+    their complexity curves and information about the running environment.
+    """
+    curves = complexity(results)
+    return {
+        'meta': {
+            'tie_version':    tie.__version__,
+            'python':         platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform':       platform.platform(),
+            'free_threaded':  bool(sysconfig.get_config_var(
+                                  'Py_GIL_DISABLED')),
+            'gil_enabled':    getattr(sys, '_is_gil_enabled', lambda: True)(),
+            'cpus':           parallel.default_workers(),
+            'time':           time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+        'curves': [{'scenario': s, 'case': c, 'exponent': k}
+                   for (s, c), k in sorted(curves.items())],
+    }
+
+def save(report, path):
+    """Write ``report`` to ``path`` as JSON"""
+    with io.open(path, 'w', encoding='utf-8') as f:
+        f.write(utils.unicode(json.dumps(report, indent=2, sort_keys=True)))
+
+def load(path):
+    """Read a report saved with :func:`save`"""
+    with io.open(path, encoding='utf-8') as f:
+        return json.loads(f.read())
+
+def _key(result):
+    """Key identifying a result across reports"""
+    return (result['scenario'], result['case'], result['param'])
+
+def compare(baseline, current, tolerance=0.1):
+    """
+    Compare the ``current`` report to the ``baseline`` one and return a list
+    of ``(scenario, case, param, baseline ops/sec, current ops/sec, ratio,
+    regressed)`` tuples for each result present in both.
+    Results whose throughput dropped by more than ``tolerance`` (a fraction
+    of the baseline's) are flagged as regressed.
+    """
+    previous = dict((_key(r), r) for r in baseline['results'])
+    rows = []
+    for r in current['results']:
+        old = previous.get(_key(r))
+        if old is None:
+            continue
+        ratio = float(r['ops_per_sec']) / old['ops_per_sec']
+        rows.append(_key(r) + (old['ops_per_sec'], r['ops_per_sec'], ratio,
+                               ratio < 1 - tolerance))
+    return rows
+
+def format_time(seconds):
+    """Return ``seconds`` formatted with a readable unit"""
+    for unit, scale in (('s', 1), ('ms', 1e3), ('us', 1e6)):
+        if seconds * scale >= 1:
+            return "%.3g%s" % (seconds * scale, unit)
+    return "%.3gns" % (seconds * 1e9)
+
+def format_table(rows, headers):
+    """Return ``rows`` of strings as a left aligned text table"""
+    widths = [max(len(h), *(len(r[i]) for r in rows)) if rows else len(h)
+              for i, h in enumerate(headers)]
+    lines = ['  '.join(h.ljust(w) for h, w in zip(headers, widths)),
+             '  '.join('-' * w for w in widths)]
+    for r in rows:
+        lines.append('  '.join(c.ljust(w) for c, w in zip(r, widths)))
+    return '\n'.join(l.rstrip() for l in lines)
+
+def format_report(report):
+    """Return a text summary of ``report``"""
+    meta = report.get('meta', {})
+    rows = []
+    for r in report['results']:
+        case = r['case'] + (' *' if r['baseline'] else '')
+        rows.append((r['scenario'], case, str(r['param']),
+                     "%.1f" % r['ops_per_sec'],
+                     format_time(r['p50']), format_time(r['p99'])))
+    out = []
+    if meta:
+        out.extend(["%s %s, GIL %s, %i CPUs" % (
+            meta['implementation'], meta['python'],
+            'enabled' if meta.get('gil_enabled', True) else 'disabled',
+            meta.get('cpus', 1)), ""])
+    out.extend([format_table(rows, ('scenario', 'case', 'param', 'ops/sec',
+                                    'p50', 'p99')),
+                "(* baseline)", ""])
+    rows = [(c['scenario'], c['case'],
+             'n/a' if c['exponent'] is None else "O(n^%.2f)" % c['exponent'])
+            for c in report['curves']]
+    out.append(format_table(rows, ('scenario', 'case', 'complexity')))
+    return '\n'.join(out)
+
+def format_comparison(rows):
+    """Return a text summary of :func:`compare`'s output"""
+    lines = []
+    for scenario, case, param, old, new, ratio, regressed in rows:
+        lines.append((scenario, case, str(param), "%.1f" % old, "%.1f" % new,
+                      "%+.1f%%" % ((ratio - 1) * 100),
+                      'REGRESSION' if regressed else ''))
+    return format_table(lines, ('scenario', 'case', 'param', 'baseline',
+                                'current', 'change', ''))
+
+def write(text, stream=None):
+    """Print ``text`` to ``stream`` (defaults to stdout)"""
+    (stream or sys.stdout).write(utils.unicode(text) + '\n')
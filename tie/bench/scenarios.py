@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+Built-in benchmark scenarios.
+
+Templates and contexts are generated deterministically, so that results are
+comparable between runs and machines.
+"""
+import os
+import string
+import shutil
+import tempfile
+import contextlib
+try:
+    from concurrent import futures
+except ImportError: # Python 2 without the futures backport
+    futures = None
+
+from tie import tag, renderers
+from tie.template import Template, DirectoryWatcher
+from tie.bench.core import Scenario, data_fixture
+
+VAR_PATTERN = r"{{(\w+)}}"
+FILLER = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. "
+NUM_VARS = 10
+
+def make_sources(size, spacing=40):
+    """
+    Return a dictionnary holding a template of about ``size`` characters in
+    TIE (``{{var}}``), string.Template (``$var``) and str.format (``{var}``)
+    syntaxes, with a variable every ``spacing`` characters, along with its
+    context.
+    """
+    tie_parts, st_parts, fmt_parts = [], [], []
+    length, i = 0, 0
+    while length < size:
+        filler = (FILLER * (spacing // len(FILLER) + 1))[:spacing]
+        name = "v%i" % (i % NUM_VARS)
+        tie_parts.append("%s{{%s}}" % (filler, name))
+        st_parts.append("%s${%s}" % (filler, name))
+        fmt_parts.append("%s{%s}" % (filler, name))
+        length += len(filler) + len(name) + 4
+        i += 1
+    return {
+        'tie':     ''.join(tie_parts),
+        'st':      ''.join(st_parts),
+        'fmt':     ''.join(fmt_parts),
+        'context': dict(("v%i" % n, "value%i" % n) for n in range(NUM_VARS)),
+    }
+
+def warm(template, context, renderer=None):
+    """Return an op rendering an already compiled ``template``"""
+    t = Template(template)
+    if renderer is not None:
+        t.renderer = renderer
+    t.render(**context)
+    return lambda: t.render(**context)
+
+### Template size ###
+
+template_size = Scenario(
+    'template_size', "Rendering templates of increasing size (characters)",
+    params=[1000, 10000, 100000], quick_params=[500, 2000],
+    fixture=data_fixture(make_sources))
+
+@template_size.case('tie')
+def _template_size_tie(data):
+    tag.register(VAR_PATTERN)
+    return warm(data['tie'], data['context'])
+
+@template_size.case('tie-codegen')
+def _template_size_tie_codegen(data):
+    tag.register(VAR_PATTERN)
+    return warm(data['tie'], data['context'], renderers.codegen_renderer)
+
+@template_size.case('tie-cold')
+def _template_size_tie_cold(data):
+    tag.register(VAR_PATTERN)
+    return lambda: Template(data['tie']).render(**data['context'])
+
+@template_size.case('string.Template', baseline=True)
+def _template_size_string_template(data):
+    st = string.Template(data['st'])
+    return lambda: st.substitute(data['context'])
+
+@template_size.case('str.format', baseline=True)
+def _template_size_str_format(data):
+    return lambda: data['fmt'].format(**data['context'])
+
+### Tag count ###
+
+def _tag_sources(num_tags, occurences=200):
+    """Template using ``num_tags`` distinct tags, and its baseline"""
+    tie_parts, fmt_parts = [], []
+    for i in range(occurences):
+        name = "v%i" % (i % NUM_VARS)
+        tie_parts.append("%s<t%i:%s>" % (FILLER[:20], i % num_tags, name))
+        fmt_parts.append("%s{%s}" % (FILLER[:20], name))
+    return {
+        'num_tags': num_tags,
+        'tie':      ''.join(tie_parts),
+        'fmt':      ''.join(fmt_parts),
+        'context':  dict(("v%i" % n, "value%i" % n) for n in range(NUM_VARS)),
+    }
+
+tag_count = Scenario(
+    'tag_count', "Rendering a template using an increasing number of tags",
+    params=[1, 4, 16, 64], quick_params=[1, 8],
+    fixture=data_fixture(_tag_sources))
+
+def _register_tags(num_tags):
+    for i in range(num_tags):
+        tag.register(r"<t%i:(\w+)>" % i)
+
+@tag_count.case('tie')
+def _tag_count_tie(data):
+    _register_tags(data['num_tags'])
+    return warm(data['tie'], data['context'])
+
+@tag_count.case('tie-cold')
+def _tag_count_tie_cold(data):
+    _register_tags(data['num_tags'])
+    return lambda: Template(data['tie']).render(**data['context'])
+
+@tag_count.case('tie-cold-regex')
+def _tag_count_tie_cold_regex(data):
+    # Leading groups hide the tags' literal prefixes, so that they are
+    # scanned with regular expressions instead of string searches
+    for i in range(data['num_tags']):
+        tag.register(r"(?:<t%i:)(\w+)>" % i)
+    return lambda: Template(data['tie']).render(**data['context'])
+
+@tag_count.case('str.format', baseline=True)
+def _tag_count_str_format(data):
+    return lambda: data['fmt'].format(**data['context'])
+
+### Dotted lookups ###
+
+class Node(object):
+    """Object graph node for lookups"""
+    def __init__(self, depth):
+        if depth:
+            self.a = Node(depth - 1)
+        for n in range(NUM_VARS):
+            setattr(self, "x%i" % n, "value%i" % n)
+
+def _lookup_sources(depth, occurences=50):
+    """Template looking up attributes ``depth`` levels deep"""
+    path = '.'.join(['obj'] + ['a'] * (depth - 1))
+    tie_parts, fmt_parts = [], []
+    for i in range(occurences):
+        expr = "%s.x%i" % (path, i % NUM_VARS)
+        tie_parts.append("%s{{%s}}" % (FILLER[:20], expr))
+        fmt_parts.append("%s{%s}" % (FILLER[:20], expr))
+    return {
+        'tie':     ''.join(tie_parts),
+        'fmt':     ''.join(fmt_parts),
+        'context': {'obj': Node(depth)},
+    }
+
+lookups = Scenario(
+    'lookups', "Rendering attribute lookups of increasing depth",
+    params=[1, 2, 4, 8], quick_params=[1, 3],
+    fixture=data_fixture(_lookup_sources))
+
+LOOKUP_PATTERN = r"{{([\w.]+)}}"
+
+@lookups.case('tie')
+def _lookups_tie(data):
+    tag.register(LOOKUP_PATTERN)
+    return warm(data['tie'], data['context'])
+
+@lookups.case('tie-codegen')
+def _lookups_tie_codegen(data):
+    tag.register(LOOKUP_PATTERN)
+    return warm(data['tie'], data['context'], renderers.codegen_renderer)
+
+@lookups.case('str.format', baseline=True)
+def _lookups_str_format(data):
+    return lambda: data['fmt'].format(**data['context'])
+
+### DirectoryWatcher loads ###
+
+@contextlib.contextmanager
+def template_dir(num_files):
+    """Temporary directory holding ``num_files`` 1KB templates"""
+    tmp = tempfile.mkdtemp(prefix='tie-bench-')
+    try:
+        source = make_sources(1000)['tie']
+        for i in range(num_files):
+            with open(os.path.join(tmp, "tmpl%i.txt" % i), 'w') as f:
+                f.write(source)
+        yield {
+            'dir':     tmp,
+            'names':   ["tmpl%i" % i for i in range(num_files)],
+            'context': make_sources(0)['context'],
+        }
+    finally:
+        shutil.rmtree(tmp)
+
+watcher = Scenario(
+    'watcher', "Loading and rendering every template of a watched directory",
+    params=[10, 100], quick_params=[5, 20], fixture=template_dir)
+
+def _render_all(templates, data):
+    for name in data['names']:
+        templates[name].render(**data['context'])
+
+@watcher.case('cold')
+def _watcher_cold(data):
+    tag.register(VAR_PATTERN)
+    return lambda: _render_all(DirectoryWatcher(data['dir']), data)
+
+@watcher.case('warm')
+def _watcher_warm(data):
+    tag.register(VAR_PATTERN)
+    templates = DirectoryWatcher(data['dir'])
+    _render_all(templates, data)
+    return lambda: _render_all(templates, data)
+
+### Batch rendering ###
+
+def _batch_data(num_rows):
+    """Columns and rows of ``num_rows`` contexts"""
+    src = make_sources(200)
+    columns = dict((name, ["%s-%i" % (val, row) for row in range(num_rows)])
+                   for name, val in src['context'].items())
+    rows = [dict((name, col[row]) for name, col in columns.items())
+            for row in range(num_rows)]
+    return dict(src, columns=columns, rows=rows)
+
+batch = Scenario(
+    'batch', "Rendering a template for an increasing number of contexts",
+    params=[10, 100, 1000], quick_params=[10, 100],
+    fixture=data_fixture(_batch_data))
+
+@batch.case('render_batch')
+def _batch_render_batch(data):
+    tag.register(VAR_PATTERN)
+    t = Template(data['tie'])
+    return lambda: t.render_batch(data['columns'])
+
+@batch.case('render-loop')
+def _batch_render_loop(data):
+    tag.register(VAR_PATTERN)
+    t = Template(data['tie'])
+    return lambda: [t.render(**row) for row in data['rows']]
+
+@batch.case('str.format-loop', baseline=True)
+def _batch_str_format_loop(data):
+    return lambda: [data['fmt'].format(**row) for row in data['rows']]
+
+### Multi-threaded rendering ###
+
+THREAD_RENDERS = 64
+
+@contextlib.contextmanager
+def thread_pool(num_threads):
+    """Pool of ``num_threads`` threads, along with template data"""
+    pool = futures.ThreadPoolExecutor(max_workers=num_threads)
+    try:
+        yield dict(make_sources(2000), threads=num_threads, pool=pool)
+    finally:
+        pool.shutdown()
+
+threads = Scenario(
+    'threads', "Rendering %i templates split over an increasing number of "
+    "threads" % THREAD_RENDERS,
+    params=[1, 2, 4, 8], quick_params=[1, 2], fixture=thread_pool)
+
+def _split(data, work):
+    """
+    Return an op calling ``work(thread index, renders)`` in each thread of
+    the data's pool, sharing THREAD_RENDERS renders between them.
+    """
+    num = data['threads']
+    shares = [THREAD_RENDERS // num] * num
+    return lambda: list(data['pool'].map(work, range(num), shares))
+
+@threads.case('shared')
+def _threads_shared(data):
+    # A single template and cached tag, shared by all threads
+    tag.register(tag.Tag(VAR_PATTERN, cached=True))
+    t = Template(data['tie'])
+    def work(index, renders):
+        for _ in range(renders):
+            t.render(**data['context'])
+    return _split(data, work)
+
+@threads.case('scoped')
+def _threads_scoped(data):
+    # Each thread renders its own template with its own TagManager
+    managers, templates = [], []
+    for _ in range(data['threads']):
+        manager = tag.TagManager()
+        manager.add(VAR_PATTERN)
+        managers.append(manager)
+        templates.append(Template(data['tie']))
+    def work(index, renders):
+        with tag.use_manager(managers[index]):
+            for _ in range(renders):
+                templates[index].render(**data['context'])
+    return _split(data, work)
+
+@threads.case('str.format', baseline=True)
+def _threads_str_format(data):
+    def work(index, renders):
+        for _ in range(renders):
+            data['fmt'].format(**data['context'])
+    return _split(data, work)
+
+SCENARIOS = [template_size, tag_count, lookups, watcher, batch]
+if futures is not None:
+    SCENARIOS.append(threads)
+
+def get_scenarios(names=None):
+    """
+    Return the built-in scenarios named in ``names`` (all of them by
+    default), in order. Raise a KeyError on unknown names.
+    """
+    if not names:
+        return list(SCENARIOS)
+    by_name = dict((s.name, s) for s in SCENARIOS)
+    return [by_name[n] for n in names]
@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+Persistent caches.
+
+:class:`CompiledCache` stores the layout of compiled templates on disk, much
+like Python's bytecode cache, so that freshly started processes can skip
+scanning their templates.
+
+:class:`DiskStore` stores rendered outputs, for the second tier of
+:class:`CachedRenderer<tie.renderers.CachedRenderer>`.
+"""
+import os
+import json
+import time
+import errno
+import hashlib
+import logging
+import tempfile
+
+from tie import utils, compiler
+
+LOGGER = logging.getLogger(__name__)
+
+def source_hash(source):
+    """Return a hex digest of the ``source`` template string."""
+    return hashlib.sha1(source.encode('utf-8', 'surrogatepass')).hexdigest()
+
+def tags_fingerprint(tags):
+    """
+    Return a hex digest of the patterns, flags and classes of ``tags``, in
+    order, or None if some of them don't use the default Tag.match method
+    (their hits could then not be reproduced from a stored layout).
+    """
+    digest = hashlib.sha1()
+    for t in tags:
+        if not compiler.is_plain_tag(t):
+            return None
+        cls = type(t)
+        pattern = t.regexp.pattern
+        if not isinstance(pattern, bytes):
+            pattern = pattern.encode('utf-8', 'surrogatepass')
+        digest.update(("%s.%s:%i:" % (cls.__module__, cls.__name__,
+                                      t.regexp.flags)).encode('utf-8'))
+        digest.update(pattern)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def stable_repr(value):
+    """
+    Return a representation of ``value`` which is the same in every process,
+    or None if there is none (``value`` being of an unsupported type).
+    Supported types are None, booleans, numbers, strings and bytes, and
+    tuples and frozensets of them. utils.MISSING is supported as well.
+    """
+    if value is None or value is utils.MISSING or \
+       isinstance(value, (bool, int, float, utils.unicode, bytes)):
+        if value is utils.MISSING:
+            return '<missing>'
+        return "%s:%r" % (type(value).__name__, value)
+    if isinstance(value, (tuple, frozenset)):
+        items = [stable_repr(v) for v in value]
+        if None in items:
+            return None
+        if isinstance(value, frozenset):
+            items.sort()
+        return "%s(%s)" % (type(value).__name__, ','.join(items))
+    # Python 2 longs
+    if type(value).__name__ == 'long':
+        return "int:%r" % int(value)
+    return None
+
+def atomic_write(path, data):
+    """
+    Write the ``data`` bytes to ``path`` through a temporary file renamed
+    over it, so that readers never see a partially written file.
+    """
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_f:
+            tmp_f.write(data)
+        getattr(os, 'replace', os.rename)(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class CompiledCache(object):
+    """
+    On-disk cache of compiled templates' layouts.
+
+    For each compiled template, the position and owning tag of each tag hit
+    is stored in ``directory``, under a key derived from a hash of the
+    template's source and a fingerprint of the registered tags. Loading a
+    layout only requires anchoring each tag's regex at the stored positions
+    instead of scanning the whole template.
+
+    Pass an instance to :func:`Template.from_file()
+    <tie.template.Template.from_file>` (``compiled_cache`` argument), set it
+    as a DirectoryWatcher's ``compiled_cache`` attribute, or set it on the
+    Template class itself to use it for every template.
+    """
+    # Bump whenever the stored format changes
+    format_version = 1
+
+    def __init__(self, directory):
+        """
+        Parameters:
+        directory: Cache directory. Will be created if needed.
+        """
+        self.directory = os.path.abspath(directory)
+        try:
+            os.makedirs(self.directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        self._fingerprints = (None, None)
+
+    def __repr__(self):
+        """Instance representation"""
+        return "<%s %r>" % (self.__class__.__name__, self.directory)
+
+    def _fingerprint(self, tags):
+        """Return tags_fingerprint(tags), remembering the last one."""
+        last_tags, fingerprint = self._fingerprints
+        if last_tags != tags:
+            fingerprint = tags_fingerprint(tags)
+            self._fingerprints = (tags, fingerprint)
+        return fingerprint
+
+    def get_path(self, source, tags):
+        """
+        Return the cache file path for ``source`` compiled with ``tags``, or
+        None if it can't be cached.
+        """
+        fingerprint = self._fingerprint(tags)
+        if fingerprint is None:
+            return None
+        return os.path.join(self.directory, "%s-%s.json" % (
+            source_hash(source), fingerprint[:16]))
+
+    def load(self, source, tags):
+        """
+        Return the list of ``(tag, match)`` hits of ``source`` for ``tags``,
+        or None if they aren't cached (or the cached entry is invalid).
+        """
+        path = self.get_path(source, tags)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as cache_f:
+                data = json.loads(cache_f.read().decode('utf-8'))
+        except (IOError, OSError, ValueError):
+            return None
+        if data.get('version') != self.format_version:
+            return None
+        hits = []
+        try:
+            for i, start, end in data['hits']:
+                m = tags[i].regexp.match(source, start)
+                if m is None or m.end() != end:
+                    raise ValueError("Stale hit")
+                hits.append((tags[i], m))
+        except (KeyError, IndexError, TypeError, ValueError):
+            LOGGER.warning("Ignoring invalid cache entry %s", path)
+            return None
+        LOGGER.debug("Loaded %i cached hits from %s", len(hits), path)
+        return hits
+
+    def store(self, source, tags, hits):
+        """
+        Store the ``(tag, match)`` hits of ``source`` compiled with ``tags``.
+        Errors are logged and otherwise ignored.
+        """
+        path = self.get_path(source, tags)
+        if path is None:
+            return
+        index = dict((id(t), i) for i, t in enumerate(tags))
+        data = {
+            'version': self.format_version,
+            'hits': [(index[id(t)], m.start(), m.end()) for t, m in hits],
+        }
+        try:
+            atomic_write(path, json.dumps(data).encode('utf-8'))
+        except (IOError, OSError):
+            LOGGER.warning("Couldn't write cache entry %s", path,
+                           exc_info=True)
+
+    def clear(self):
+        """Remove all cached entries."""
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+
+class DiskStore(object):
+    """
+    Persistent store of strings on the local disk, one file per key.
+
+    Entries older than ``ttl`` seconds (if set) are discarded on access.
+    When the total size of stored entries exceeds ``max_bytes``, the oldest
+    ones are removed until it falls back under 90% of the budget. Sizes are
+    tracked approximately when several processes share the directory, and
+    recomputed on each pruning.
+    """
+    suffix = '.out'
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, ttl=None):
+        """
+        Parameters:
+        directory: Store directory. Will be created if needed.
+        max_bytes: Size budget, in bytes.
+        ttl:       Optional lifetime of entries, in seconds.
+        """
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.ttl       = ttl
+        try:
+            os.makedirs(self.directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        self._size = sum(size for _, _, size in self._entries())
+
+    def __repr__(self):
+        """Instance representation"""
+        return "<%s %r>" % (self.__class__.__name__, self.directory)
+
+    def _path(self, key):
+        """Return the file path of ``key``"""
+        return os.path.join(self.directory, key + self.suffix)
+
+    def _entries(self):
+        """Yield ``(path, mtime, size)`` for each stored entry"""
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            yield path, st.st_mtime, st.st_size
+
+    def get(self, key):
+        """Return the string stored under ``key``, or None"""
+        path = self._path(key)
+        try:
+            if self.ttl is not None and \
+               os.stat(path).st_mtime + self.ttl <= time.time():
+                self._remove(path)
+                return None
+            with open(path, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError):
+            return None
+        return data.decode('utf-8', 'surrogatepass')
+
+    def set(self, key, value):
+        """
+        Store the ``value`` string under ``key``.
+        Errors are logged and otherwise ignored.
+        """
+        data = value.encode('utf-8', 'surrogatepass')
+        try:
+            atomic_write(self._path(key), data)
+        except (IOError, OSError):
+            LOGGER.warning("Couldn't write store entry %s", key, exc_info=True)
+            return
+        self._size += len(data)
+        if self._size > self.max_bytes:
+            self.prune()
+
+    def prune(self):
+        """Remove the oldest entries until the store fits in its budget."""
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        size = sum(e[2] for e in entries)
+        target = self.max_bytes * 0.9
+        for path, _, entry_size in entries:
+            if size <= target:
+                break
+            if self._remove(path):
+                size -= entry_size
+        LOGGER.debug("Pruned %s down to %i bytes", self, size)
+        self._size = size
+
+    def remove_prefix(self, prefix):
+        """Remove all entries whose key starts with ``prefix``"""
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix) and name.endswith(self.suffix):
+                self._remove(os.path.join(self.directory, name))
+
+    def clear(self):
+        """Remove all entries"""
+        self.remove_prefix('')
+        self._size = 0
+
+    def _remove(self, path):
+        """Remove the ``path`` entry file, returning True on success"""
+        try:
+            os.remove(path)
+        except OSError:
+            return False
+        return True
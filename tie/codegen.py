@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+Python code generation for compiled templates.
+
+A compiled template can be turned into the source of a dedicated render
+function, in which literal segments are inlined as constants and plain
+:func:`processors.sub<tie.processors.sub>` substitutions become direct
+context lookups. Other slots still call their tag's processor.
+
+Use :func:`renderers.codegen_renderer<tie.renderers.codegen_renderer>` rather
+than calling this module directly.
+"""
+import logging
+import warnings
+
+from tie import tag, utils, helpers, accessors, processors
+from tie.exceptions import ContextWarning, InvalidLookupError
+
+LOGGER = logging.getLogger(__name__)
+
+def _missing(name):
+    """Warn about the ``name`` context variable missing and return ''"""
+    warnings.warn("No context variable matched the tag %s" % name,
+                  ContextWarning)
+    return ''
+
+def _is_inlinable(slot):
+    """
+    Return True if ``slot`` is a plain substitution whose value can be
+    looked up without calling its tag's processor.
+    """
+    t = slot.tag
+    return (t.processor is processors.sub and not t.cached and
+            utils.method_func(t, 'process_match') is
+            utils.method_func(tag.Tag, 'process_match'))
+
+def generate(compiled):
+    """
+    Return a ``(source code, namespace)`` tuple defining a ``render``
+    function, which takes a context dictionnary and returns the same string as
+    :func:`CompiledTemplate.render()<tie.compiler.CompiledTemplate.render>`.
+    """
+    namespace = {
+        '_str':        utils.unicode,
+        '_MISSING':    utils.MISSING,
+        '_missing':    _missing,
+        '_MemoScope':  accessors.MemoScope,
+    }
+    body, parts = [], list(map(repr, compiled.segments))
+    uses_memo, uses_scope = False, False
+    for i, slot in enumerate(compiled.slots):
+        var = "v%i" % i
+        name, accessor = None, None
+        if _is_inlinable(slot):
+            name = helpers.get_single_group(slot.match)
+            if processors._LOOKUP.search(name):
+                try:
+                    accessor = accessors.get_accessor(name)
+                except InvalidLookupError:
+                    # Let sub raise it on render
+                    name = None
+        if name is None:
+            namespace['_t%i' % i] = slot.tag
+            namespace['_m%i' % i] = slot.match
+            body.append("%s = _t%i.process_match(_m%i, **context)"
+                        % (var, i, i))
+            uses_scope = True
+        elif accessor is None:
+            body.extend([
+                "%s = context.get(%r, _MISSING)" % (var, name),
+                "%s = _missing(%r) if %s is _MISSING else _str(%s)"
+                % (var, name, var, var),
+            ])
+        else:
+            namespace['_a%i' % i] = accessor
+            body.extend([
+                "if %r in context:" % name,
+                "    %s = _str(context[%r])" % (var, name),
+                "else:",
+                "    %s = _str(_a%i.resolve(context, memo))" % (var, i),
+                "    if not %s:" % var,
+                "        %s = _missing(%r)" % (var, name),
+            ])
+            uses_memo = True
+        for pos in slot.positions:
+            parts[pos] = var
+    body.append("return ''.join([%s])" % ', '.join(parts))
+    if uses_scope:
+        body = ["with _MemoScope(memo):"] + ["    " + l for l in body]
+    if uses_memo or uses_scope:
+        body.insert(0, "memo = {}")
+    lines = ["def render(context):"] + ["    " + l for l in body]
+    return '\n'.join(lines) + '\n', namespace
+
+def build_render_function(compiled, name=''):
+    """
+    Generate and compile the render function of ``compiled`` (see
+    :func:`generate`) and return it.
+    ``name`` is only used to label the generated code in tracebacks.
+    """
+    code, namespace = generate(compiled)
+    filename = "<tie-codegen%s>" % (name and ' ' + name)
+    exec(compile(code, filename, 'exec'), namespace)
+    LOGGER.debug("Generated render function %s (%i lines)", filename,
+                 code.count('\n'))
+    return namespace['render']
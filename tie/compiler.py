@@ -0,0 +1,723 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+Template compilation.
+
+A compiled template is the template string split once and for all into a flat
+list of literal segments and tag slots. Rendering it only requires evaluating
+the processors bound to each slot and joining the resulting list, instead of
+re-scanning the whole template string on every render.
+"""
+import re
+import hashlib
+import logging
+import threading
+
+from tie import tag, utils, helpers, accessors, processors, codegen, metrics
+from tie.exceptions import TemplateError
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+LOGGER = logging.getLogger(__name__)
+
+class Slot(object):
+    """
+    A distinct tag occurence within a compiled template.
+    Repeated occurences of the same matched text by the same tag share a single
+    slot, so that their processor is only called once per render.
+    """
+    __slots__ = ('tag', 'match', 'positions')
+
+    def __init__(self, tag_obj, match):
+        self.tag       = tag_obj
+        self.match     = match
+        self.positions = []
+
+    def __repr__(self):
+        """Instance representation"""
+        return "<%s %r %r>" % (self.__class__.__name__, self.tag,
+                               self.match.group(0))
+
+    def evaluate(self, **context):
+        """Process the slot's match and return its value"""
+        return self.tag.process_match(self.match, **context)
+
+    def depends(self):
+        """
+        Return the names of the context variables the slot's value depends
+        on, or None if unknown (see the Tag's ``depends`` attribute).
+        """
+        deps = self.tag.depends
+        if deps is None:
+            return None
+        if callable(deps):
+            deps = deps(self.match)
+        return tuple(deps)
+
+
+class CompiledTemplate(object):
+    """
+    Compiled form of a template string.
+
+    ``segments`` is a flat list of strings, in which the items located at the
+    positions recorded by each of the ``slots`` are placeholders to be filled
+    with the slot's value on render.
+    ``includes`` lists the ``(include tag, template name, compiled form)``
+    of each template inlined into this one.
+    ``compilable`` is False if some of the ``tags`` redefine Tag.process,
+    which slots can't honour: renderers then fall back to
+    :func:`substitution_renderer<tie.renderers.substitution_renderer>`.
+    """
+    def __init__(self, source, segments, slots, manager, tags, includes=(),
+                 version=utils.MISSING):
+        self.source   = source
+        self.segments = segments
+        self.slots    = slots
+        self.manager  = manager
+        self.tags     = tags
+        self.includes = includes
+        self.compilable = all(is_compilable_tag(t) for t in tags)
+        if version is utils.MISSING:
+            version = manager_version(manager)
+        self.version  = version
+        self._slot_at = None
+        self._render_function = None
+        self._variables = utils.MISSING
+        self._digest    = None
+
+    def is_valid(self, manager):
+        """
+        Return True if the compiled form still reflects the tags registered
+        in ``manager`` and the current version of included templates.
+        Managers without a trusted ``version`` (see :func:`manager_version`)
+        have their tags compared one by one.
+        """
+        if manager is not self.manager:
+            return False
+        if self.version is not None:
+            if manager.version != self.version:
+                return False
+        elif tuple(manager) != self.tags:
+            return False
+        for include_tag, name, compiled in self.includes:
+            try:
+                # Through the include stack, so that cycles introduced by
+                # changed templates are detected
+                current = _compile_include(include_tag, name, manager)
+            except TemplateError:
+                return False
+            if current is not compiled:
+                return False
+        return True
+
+    @property
+    def variables(self):
+        """
+        Frozenset of the names of the context variables the template reads
+        (including lookup expressions such as ``user.name``, which
+        :func:`processors.sub<tie.processors.sub>` tries as plain names
+        first), or None if some tag's processor doesn't declare its
+        dependencies (see the Tag's ``depends`` attribute).
+        """
+        variables = self._variables
+        if variables is utils.MISSING:
+            names = set()
+            for slot in self.slots:
+                deps = slot.depends()
+                if deps is None:
+                    names = None
+                    break
+                names.update(deps)
+            variables = self._variables = (None if names is None
+                                           else frozenset(names))
+        return variables
+
+    @property
+    def digest(self):
+        """
+        Hex digest identifying the template's content: its source, the
+        patterns, classes and processors of the tags it was compiled with,
+        and the digests of the templates it includes.
+        Processors are identified by name only, so changes to their code
+        aren't reflected.
+        """
+        digest = self._digest
+        if digest is None:
+            h = hashlib.sha1(self.source.encode('utf-8', 'surrogatepass'))
+            for t in self.tags:
+                h.update(("\0%s\0%s\0%r\0%i\0%s" % (
+                    _qualname(type(t)), t.cached, t.regexp.pattern,
+                    t.regexp.flags, _qualname(t.processor))).encode(
+                        'utf-8', 'surrogatepass'))
+            for _, name, compiled in self.includes:
+                h.update(("\0%s\0%s" % (name, compiled.digest)).encode(
+                    'utf-8', 'surrogatepass'))
+            digest = self._digest = h.hexdigest()
+        return digest
+
+    def render(self, **context):
+        """Evaluate each slot and return the rendered string"""
+        if metrics.enabled:
+            self._count_matches()
+        parts = list(self.segments)
+        with accessors.MemoScope():
+            for slot in self.slots:
+                val = slot.evaluate(**context)
+                for i in slot.positions:
+                    parts[i] = val
+        return ''.join(parts)
+
+    def render_function(self):
+        """
+        Return a generated Python function rendering the template from a
+        context dictionnary (see :mod:`tie.codegen`), building it on first
+        call.
+        """
+        func = self._render_function
+        if func is None:
+            func = self._render_function = codegen.build_render_function(self)
+        return func
+
+    def render_iter(self, context, chunk_size=16384):
+        """
+        Evaluate slots against the ``context`` dictionnary and yield the
+        rendered string in chunks of roughly ``chunk_size``
+        characters (longer literal segments or slot values are yielded
+        whole).
+        Slots are evaluated lazily, once each, in order of first appearance.
+        """
+        if metrics.enabled:
+            self._count_matches()
+        slot_at = self._slot_positions()
+        values, memo = {}, {}
+        buf, size = [], 0
+        for i, part in enumerate(self.segments):
+            slot = slot_at.get(i)
+            if slot is not None:
+                try:
+                    part = values[slot]
+                except KeyError:
+                    with accessors.MemoScope(memo):
+                        part = values[slot] = slot.evaluate(**context)
+            buf.append(part)
+            size += len(part)
+            if size >= chunk_size:
+                yield ''.join(buf)
+                buf, size = [], 0
+        if buf:
+            yield ''.join(buf)
+
+    def render_batch(self, columns, context):
+        """
+        Render the template once per row of the column-oriented ``columns``
+        data (a dictionnary mapping context variable names to sequences or
+        NumPy arrays of equal length), on top of the shared ``context``
+        dictionnary, and yield each row's output.
+
+        Slots whose value doesn't depend on any column are evaluated once;
+        plain substitutions of a column have the whole column converted to
+        strings in bulk; any other slot is evaluated row by row.
+        """
+        lengths = set(len(col) for col in columns.values())
+        if len(lengths) > 1:
+            raise ValueError("Batch columns must all have the same length")
+        num_rows = lengths.pop() if lengths else 0
+        if metrics.enabled:
+            self._count_matches(num_rows)
+        parts = list(self.segments)
+        row_slots = []
+        memo = {}
+        for slot in self.slots:
+            column = self._slot_column(slot, columns)
+            if column is None:
+                deps = slot.depends()
+                if deps is not None and not any(n in columns for n in deps):
+                    with accessors.MemoScope(memo):
+                        val = slot.evaluate(**context)
+                    for i in slot.positions:
+                        parts[i] = val
+                    continue
+            row_slots.append((slot, column))
+        rows = None
+        if any(column is None for _, column in row_slots):
+            # Slots evaluated row by row read every column; NumPy arrays
+            # yield NumPy scalars, just as indexing them would
+            rows = dict((name, list(col)) for name, col in columns.items())
+        for row in range(num_rows):
+            row_context = None
+            for slot, column in row_slots:
+                if column is not None:
+                    val = column[row]
+                else:
+                    if row_context is None:
+                        row_context = dict(context)
+                        for name, col in rows.items():
+                            row_context[name] = col[row]
+                    val = slot.evaluate(**row_context)
+                for i in slot.positions:
+                    parts[i] = val
+            yield ''.join(parts)
+
+    @staticmethod
+    def _slot_column(slot, columns):
+        """
+        Return the column values of ``slot``, converted to strings, if it is a
+        plain substitution of one of the ``columns``. Return None otherwise.
+        """
+        if slot.tag.processor is not processors.sub:
+            return None
+        name = helpers.get_single_group(slot.match)
+        if name not in columns:
+            return None
+        return _column_strings(columns[name])
+
+    def _count_matches(self, renders=1):
+        """Record the tag matches of ``renders`` renders in the metrics"""
+        counts = {}
+        for slot in self.slots:
+            counts[slot.tag] = counts.get(slot.tag, 0) + len(slot.positions)
+        for include_tag, _, _ in self.includes:
+            counts[include_tag] = counts.get(include_tag, 0) + 1
+        for tag_obj, num in counts.items():
+            metrics.count_matches(tag_obj, num * renders)
+
+    def _slot_positions(self):
+        """Return a dictionnary mapping segment positions to their slot"""
+        slot_at = self._slot_at
+        if slot_at is None:
+            slot_at = self._slot_at = dict(
+                (i, slot) for slot in self.slots for i in slot.positions)
+        return slot_at
+
+
+def _qualname(obj):
+    """Return the qualified name of the ``obj`` class or function"""
+    name = getattr(obj, '__qualname__', None) or \
+           getattr(obj, '__name__', None) or type(obj).__name__
+    return "%s.%s" % (getattr(obj, '__module__', ''), name)
+
+def _is_array(col):
+    """Return True if ``col`` is a NumPy array"""
+    return numpy is not None and isinstance(col, numpy.ndarray)
+
+def _column_strings(col):
+    """Return the values of ``col`` converted to unicode strings"""
+    if _is_array(col) and col.dtype.kind in 'biufU':
+        return col.astype(utils.unicode).tolist()
+    return [utils.unicode(v) for v in col]
+
+
+class Scanner(object):
+    """
+    Multi-tag scanning engine.
+
+    Tags whose pattern starts with a literal string (see
+    :func:`scan_prefix`) are located with plain string searches for that
+    prefix, each candidate position being confirmed by an anchored match of
+    the tag's regex.
+    Patterns of the other tags are fused into a single alternation of named
+    groups, so that the template string is walked only once whatever the
+    number of such tags. Each hit is then re-matched (anchored at its
+    position) by the owning tag's own regex, so that processors receive
+    exactly the same match objects as they would from
+    :func:`Tag.match()<tie.tag.Tag.match>`.
+
+    Tags which can't be fused (custom match method, numbered backreferences,
+    group names used by a previous tag, global inline flags...) are scanned
+    separately and merged with the other hits, as are those matching the
+    empty string, whose empty hits would otherwise hide the hits of later
+    alternatives at the same position.
+    """
+    def __init__(self, tags):
+        self.tags      = tuple(tags)
+        self.separate  = []
+        self.delimited = []
+        self.fused     = []
+        self.regexp    = None
+        alternatives   = []
+        group_names    = set()
+        for i, t in enumerate(self.tags):
+            prefix = scan_prefix(t)
+            if prefix:
+                self.delimited.append((i, prefix))
+                continue
+            alt = self._fused_pattern(i, t)
+            names = set(t.regexp.groupindex)
+            if alt is None or t.regexp.match('') is not None or \
+               names & group_names:
+                # Group names must be unique within the fused regex
+                self.separate.append(i)
+            else:
+                alternatives.append((i, alt))
+                group_names |= names
+        if alternatives:
+            try:
+                self.regexp = re.compile('|'.join(a for _, a in alternatives))
+            except re.error:
+                LOGGER.debug("Couldn't fuse tag patterns, scanning them "
+                             "separately")
+                self.separate = sorted(self.separate +
+                                       [i for i, _ in alternatives])
+            else:
+                self.fused = [i for i, _ in alternatives]
+        LOGGER.debug("Scanner: %i delimited tags, %i fused, %i separate",
+                     len(self.delimited),
+                     len(self.tags) - len(self.delimited) -
+                     len(self.separate), len(self.separate))
+
+    @staticmethod
+    def _fused_pattern(index, tag_obj):
+        """
+        Return ``tag_obj``'s pattern wrapped in a named group for fusion,
+        or None if it can't be fused.
+        """
+        if not is_plain_tag(tag_obj):
+            return None
+        regexp = tag_obj.regexp
+        if not isinstance(regexp.pattern, utils.unicode) or \
+           _NUMBERED_REFS.search(regexp.pattern):
+            return None
+        pattern = regexp.pattern
+        flags = ''.join(c for f, c in _INLINE_FLAGS if regexp.flags & f)
+        if flags:
+            pattern = "(?%s:%s)" % (flags, pattern)
+        alt = "(?P<%s%i>%s)" % (_GROUP_PREFIX, index, pattern)
+        try:
+            re.compile(alt)
+        except re.error:
+            return None
+        return alt
+
+    def _fused_hit(self, source, m):
+        """
+        Return the ``(start, tag index, match)`` hit for the ``m`` match of
+        the fused regex, or None.
+        Patterns which can only match the empty string at some positions
+        (lookarounds...) aren't told apart when fusing: after such an empty
+        hit, the following fused tags are tried one by one at its position.
+        """
+        start = m.start()
+        i = int(m.lastgroup[len(_GROUP_PREFIX):])
+        if m.end() == start:
+            for j in self.fused[self.fused.index(i) + 1:]:
+                tag_match = self.tags[j].regexp.match(source, start)
+                if tag_match is not None and tag_match.end() > start:
+                    return start, j, tag_match
+            return None
+        tag_match = self.tags[i].regexp.match(source, start)
+        if tag_match is not None:
+            return start, i, tag_match
+        return None
+
+    def _fused_hits(self, source):
+        """Yield ``(start, tag index, match)`` for each fused hit"""
+        if self.regexp is None:
+            return
+        pos = 0
+        for m in self.regexp.finditer(source):
+            if m.start() < pos:
+                # Already yielded after an empty hit at that position
+                continue
+            hit = self._fused_hit(source, m)
+            if hit is not None:
+                pos = hit[2].end()
+                yield hit
+
+    def _next_fused(self, source, pos):
+        """Return the first fused hit at or after ``pos``, or None"""
+        search = self.regexp.search
+        while True:
+            m = search(source, pos)
+            if m is None:
+                return None
+            hit = self._fused_hit(source, m)
+            if hit is not None:
+                return hit
+            if m.end() == m.start():
+                # Skip empty hits, past the end of source if need be
+                if m.start() >= len(source):
+                    return None
+                pos = m.start() + 1
+            else:
+                pos = m.end()
+
+    def _delimited_finder(self, index, prefix):
+        """
+        Return a function returning the first hit of the ``index``-th tag
+        at or after a given position of a source string, or None.
+        """
+        match = self.tags[index].regexp.match
+        def next_hit(source, pos):
+            find = source.find
+            start = find(prefix, pos)
+            while start != -1:
+                m = match(source, start)
+                if m is not None:
+                    return start, index, m
+                start = find(prefix, start + 1)
+            return None
+        return next_hit
+
+    def _separate_finder(self, index, source):
+        """
+        Return a function returning the first hit of the ``index``-th tag
+        (found by its own match method) at or after a given position.
+        """
+        hits = [(m.start(), index, m) for m in self.tags[index].match(source)
+                if m.end() > m.start()]
+        state = [0]
+        def next_hit(source, pos):
+            k = state[0]
+            while k < len(hits) and hits[k][0] < pos:
+                k += 1
+            state[0] = k
+            return hits[k] if k < len(hits) else None
+        return next_hit
+
+    def scan(self, source):
+        """
+        Yield ``(tag, match)`` pairs for each tag occurence in ``source``, in
+        order of appearance.
+        Overlapping matches are resolved in favor of the leftmost one, then of
+        the first tag in registration order. Empty matches are ignored.
+        """
+        if not self.separate and not self.delimited:
+            for _, i, m in self._fused_hits(source):
+                yield self.tags[i], m
+            return
+        finders = [self._delimited_finder(i, p) for i, p in self.delimited]
+        finders.extend(self._separate_finder(i, source)
+                       for i in self.separate)
+        if self.regexp is not None:
+            finders.append(self._next_fused)
+        if len(finders) == 1:
+            next_hit, = finders
+            hit = next_hit(source, 0)
+            while hit is not None:
+                yield self.tags[hit[1]], hit[2]
+                hit = next_hit(source, hit[2].end())
+            return
+        # Lazily merge the next hit of each finder, looking past the end of
+        # the last yielded match whenever a finder's hit overlaps it.
+        heads = [f(source, 0) for f in finders]
+        pos = 0
+        while True:
+            best = None
+            for k, head in enumerate(heads):
+                if head is not None and head[0] < pos:
+                    head = heads[k] = finders[k](source, pos)
+                if head is not None and \
+                   (best is None or head[:2] < best[:2]):
+                    best = head
+            if best is None:
+                return
+            pos = best[2].end()
+            yield self.tags[best[1]], best[2]
+
+_GROUP_PREFIX  = '_tie_tag'
+_INLINE_FLAGS  = ((re.I, 'i'), (re.M, 'm'), (re.S, 's'), (re.X, 'x'),
+                  (getattr(re, 'A', 0), 'a'))
+# Numbered backreferences and conditionals wouldn't survive fusion
+_NUMBERED_REFS = re.compile(r"(?<!\\)(?:\\\\)*\\[1-9]|\(\?\(\d")
+
+def is_plain_tag(tag_obj):
+    """
+    Return True if ``tag_obj`` finds its matches with the default
+    Tag.match method, i.e. by searching its regex.
+    """
+    return utils.method_func(tag_obj, 'match') is \
+           utils.method_func(tag.Tag, 'match')
+
+def scan_prefix(tag_obj):
+    """
+    Return the literal string every match of ``tag_obj`` starts with, if the
+    Scanner should look it up with plain string searches. Return None
+    otherwise.
+    That is the opening delimiter of :class:`DelimitedTag<tie.tag.DelimitedTag>`
+    instances, or the literal prefix of other plain tags' patterns when it is
+    at least ``MIN_PREFIX`` characters long (shorter ones are likely too
+    frequent in templates to beat a regex scan).
+    """
+    if not is_plain_tag(tag_obj):
+        return None
+    regexp = tag_obj.regexp
+    if not isinstance(regexp.pattern, utils.unicode) or \
+       regexp.flags & (re.I | re.X):
+        return None
+    if isinstance(tag_obj, tag.DelimitedTag):
+        return tag_obj.opening or None
+    prefix = literal_prefix(regexp.pattern)
+    if len(prefix) < MIN_PREFIX:
+        return None
+    return prefix
+
+MIN_PREFIX = 2
+
+_QUANTIFIER = re.compile(r"[*+?]|\{\d*,?\d*\}")
+
+def literal_prefix(pattern):
+    """
+    Return the literal string every match of the ``pattern`` regex (compiled
+    without the IGNORECASE or VERBOSE flags) starts with. It may be empty.
+    """
+    # Any top-level alternative would void the prefix
+    depth, in_class, i = 0, False, 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            i += 1
+        elif in_class:
+            in_class = c != ']'
+        elif c == '[':
+            in_class = True
+            if pattern[i + 1:i + 2] == ']':
+                i += 1
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c == '|' and depth == 0:
+            return ''
+        i += 1
+    chars, i = [], 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            nxt = pattern[i + 1:i + 2]
+            if not nxt or nxt.isalnum() or nxt == '_':
+                break
+            chars.append(nxt)
+            i += 2
+        elif c in '.^$*+?[]|()' or (c == '{' and
+                                    _QUANTIFIER.match(pattern, i)):
+            break
+        else:
+            chars.append(c)
+            i += 1
+        if _QUANTIFIER.match(pattern, i):
+            # The last character is optional or repeated
+            chars.pop()
+            break
+    return ''.join(chars)
+
+def is_compilable_tag(tag_obj):
+    """
+    Return True if ``tag_obj`` processes templates with the default
+    Tag.process method, i.e. one match at a time, so that compiled templates
+    can evaluate it slot by slot.
+    """
+    return utils.method_func(tag_obj, 'process') is \
+           utils.method_func(tag.Tag, 'process')
+
+def manager_version(manager):
+    """
+    Return the ``version`` of ``manager``, or None if it can't be trusted to
+    change along its tags: managers redefining how the built-in ones store
+    their tags may not bump it (see :class:`TagManager<tie.tag.TagManager>`),
+    and have their tags compared one by one instead.
+    """
+    version = getattr(manager, 'version', None)
+    if version is None:
+        return None
+    for name in ('add', 'clear', '__iter__'):
+        func = utils.method_func(manager, name)
+        if not any(func is utils.method_func(cls, name)
+                   for cls in (tag.TagManager, tag.PriorityTagManager)):
+            return None
+    return version
+
+_scanner = None
+_local   = threading.local()
+
+def get_scanner(tags):
+    """
+    Return a Scanner for ``tags``, reusing the last one built if the tags
+    didn't change.
+    """
+    global _scanner
+    tags = tuple(tags)
+    scanner = _scanner
+    if scanner is None or scanner.tags != tags:
+        scanner = _scanner = Scanner(tags)
+    return scanner
+
+def compile_template(source, manager=None, cache=None):
+    """
+    Compile the ``source`` template string against the tags registered in
+    ``manager`` (defaults to the current global TagManager) and return a
+    CompiledTemplate instance.
+    If a ``cache`` is provided (see :class:`tie.cache.CompiledCache`), tag
+    hits are loaded from it when available instead of scanning ``source``,
+    and stored into it otherwise.
+    Templates included through :class:`IncludeTag<tie.tag.IncludeTag>` hits
+    are compiled (or their compiled form reused) and inlined. Including a
+    template from itself, directly or not, raises a TemplateError.
+    """
+    if manager is None:
+        manager = tag.get_manager()
+    # Read the version first, so that tags registered concurrently can only
+    # make the compiled template look outdated
+    version = manager_version(manager)
+    tags = tuple(manager)
+    hits = None
+    if cache is not None:
+        hits = cache.load(source, tags)
+    if hits is None:
+        hits = list(get_scanner(tags).scan(source))
+        if cache is not None:
+            cache.store(source, tags, hits)
+    segments, slots, index, includes = [], [], {}, []
+    pos = 0
+    for t, m in hits:
+        if m.start() > pos:
+            segments.append(source[pos:m.start()])
+        pos = m.end()
+        if isinstance(t, tag.IncludeTag):
+            name = t.template_name(m)
+            included = _compile_include(t, name, manager)
+            includes.append((t, name, included))
+            offset = len(segments)
+            segments.extend(included.segments)
+            for inc_slot in included.slots:
+                slot = _get_slot(index, slots, inc_slot.tag, inc_slot.match)
+                slot.positions.extend(offset + i for i in inc_slot.positions)
+            continue
+        slot = _get_slot(index, slots, t, m)
+        slot.positions.append(len(segments))
+        segments.append(m.group(0))
+    if pos < len(source):
+        segments.append(source[pos:])
+    LOGGER.debug("Compiled %i segments, %i slots", len(segments), len(slots))
+    return CompiledTemplate(source, segments, slots, manager, tags,
+                            tuple(includes), version)
+
+def _get_slot(index, slots, tag_obj, match):
+    """
+    Return the slot for ``match`` of ``tag_obj`` from the ``index``
+    dictionnary, or create it and append it to ``slots``.
+    """
+    key = (id(tag_obj), match.group(0))
+    slot = index.get(key)
+    if slot is None:
+        slot = index[key] = Slot(tag_obj, match)
+        slots.append(slot)
+    return slot
+
+def _compile_include(include_tag, name, manager):
+    """
+    Return the compiled form of the ``name`` template included through
+    ``include_tag``, keeping track of the templates being included in the
+    current thread to detect cycles.
+    """
+    stack = getattr(_local, 'includes', ())
+    if name in stack:
+        raise TemplateError("Include cycle: %s" %
+                            ' -> '.join(stack + (name,)))
+    _local.includes = stack + (name,)
+    try:
+        return include_tag.get_template(name).compile(manager)
+    finally:
+        _local.includes = stack
@@ -21,6 +21,10 @@ class InvalidTagError(TagError):
     """Invalid value to register a Tag object"""
     pass
 
+class InvalidLookupError(TagError):
+    """Unsupported attribute or item lookup expression in a tag"""
+    pass
+
 ### Template Errors ###
 
 class TemplateError(TIEError):
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+Incremental rendering.
+
+A :class:`LiveTemplate` renders the same template over and over with
+slightly different contexts, only re-evaluating the slots whose referenced
+variables changed since the previous render, and reports which spans of the
+output changed.
+"""
+import logging
+from collections import namedtuple
+
+from tie import tag, utils, accessors, renderers
+from tie.template import Template
+
+LOGGER = logging.getLogger(__name__)
+
+class Change(namedtuple('Change', 'start end old_start old_end value')):
+    """
+    A changed span of a LiveTemplate's output: ``value`` is found between the
+    ``start`` and ``end`` offsets of the new output, and replaces what was
+    found between ``old_start`` and ``old_end`` in the previous one.
+    """
+    __slots__ = ()
+
+def _same(old, new):
+    """Return True if the ``old`` and ``new`` values tuples are equal"""
+    if old is None or len(old) != len(new):
+        return False
+    for a, b in zip(old, new):
+        if a is b:
+            continue
+        try:
+            if not bool(a == b):
+                return False
+        except Exception:
+            return False
+    return True
+
+
+class LiveTemplate(object):
+    """
+    Stateful template, re-rendered incrementally.
+
+    Each call to :func:`update` compares the values of the context variables
+    each slot depends on (see the Tag's ``depends`` attribute) with those of
+    the previous call, and only re-evaluates the slots for which they
+    changed. Slots whose dependencies are unknown are always re-evaluated.
+
+    Values are compared by equality: objects mutated in place aren't seen as
+    changed, unless passed to :func:`mark_dirty`.
+    The whole output is reported as changed on first update, and whenever
+    the template is recompiled. Templates using tags which redefine
+    Tag.process are rendered whole on each update.
+    """
+    def __init__(self, template, manager=None):
+        """
+        Parameters:
+        template: Template instance or template string.
+        manager:  TagManager to compile the template against. Defaults to
+                  the current global one.
+        """
+        if not isinstance(template, Template):
+            template = Template(template)
+        self.template = template
+        self.manager  = manager
+        self.reset()
+
+    def __repr__(self):
+        """Instance representation"""
+        return "<%s %r>" % (self.__class__.__name__, self.template)
+
+    def reset(self):
+        """Forget the previous render"""
+        self.output    = None
+        self._compiled = None
+        self._deps     = None
+        self._inputs   = None
+        self._values   = None
+        self._parts    = None
+        self._offsets  = None
+        self._dirty    = set()
+
+    def mark_dirty(self, *names):
+        """
+        Have the slots depending on the ``names`` context variables
+        re-evaluated on next update, whatever their values.
+        """
+        self._dirty.update(names)
+
+    def update(self, **context):
+        """
+        Render the template with ``context`` and return a tuple of the new
+        output and the list of :class:`Change` spans, in order.
+        """
+        compiled = self.template.compile(self.manager)
+        if not compiled.compilable:
+            return self._substitute(compiled, context)
+        if compiled is not self._compiled:
+            return self._render_all(compiled, context)
+        dirty, self._dirty = self._dirty, set()
+        changed = []
+        with accessors.MemoScope():
+            for i, slot in enumerate(compiled.slots):
+                deps = self._deps[i]
+                inputs = None
+                if deps is not None:
+                    inputs = tuple(context.get(n, utils.MISSING)
+                                   for n in deps)
+                    if _same(self._inputs[i], inputs) and \
+                       not dirty.intersection(deps):
+                        continue
+                self._inputs[i] = inputs
+                val = slot.evaluate(**context)
+                if val != self._values[i]:
+                    self._values[i] = val
+                    changed.append(i)
+        if not changed:
+            return self.output, []
+        LOGGER.debug("%i slots changed", len(changed))
+        parts, old_offsets = self._parts, self._offsets
+        old_lengths = {}
+        for i in changed:
+            for p in compiled.slots[i].positions:
+                old_lengths[p] = len(parts[p])
+                parts[p] = self._values[i]
+        self.output, self._offsets = self._join(parts)
+        changes = []
+        for p in sorted(old_lengths):
+            start = self._offsets[p]
+            changes.append(Change(start, start + len(parts[p]),
+                                  old_offsets[p],
+                                  old_offsets[p] + old_lengths[p], parts[p]))
+        return self.output, changes
+
+    def _render_all(self, compiled, context):
+        """Evaluate every slot of ``compiled`` and reset the state."""
+        previous = self.output
+        self._compiled = compiled
+        self._deps     = [slot.depends() for slot in compiled.slots]
+        self._inputs   = [None] * len(compiled.slots)
+        self._values   = [None] * len(compiled.slots)
+        self._dirty    = set()
+        parts = list(compiled.segments)
+        with accessors.MemoScope():
+            for i, slot in enumerate(compiled.slots):
+                deps = self._deps[i]
+                if deps is not None:
+                    self._inputs[i] = tuple(context.get(n, utils.MISSING)
+                                            for n in deps)
+                val = self._values[i] = slot.evaluate(**context)
+                for p in slot.positions:
+                    parts[p] = val
+        self._parts = parts
+        self.output, self._offsets = self._join(parts)
+        old_end = 0 if previous is None else len(previous)
+        return self.output, [Change(0, len(self.output), 0, old_end,
+                                    self.output)]
+
+    def _substitute(self, compiled, context):
+        """Render the whole template with the substitution renderer."""
+        previous = self.output
+        self.reset()
+        self._compiled = compiled
+        with tag.use_manager(compiled.manager):
+            self.output = renderers.substitution_renderer(self.template,
+                                                          **context)
+        if self.output == previous:
+            return self.output, []
+        old_end = 0 if previous is None else len(previous)
+        return self.output, [Change(0, len(self.output), 0, old_end,
+                                    self.output)]
+
+    @staticmethod
+    def _join(parts):
+        """Return the joined ``parts`` and the offset of each of them"""
+        offsets, pos = [], 0
+        for part in parts:
+            offsets.append(pos)
+            pos += len(part)
+        return ''.join(parts), offsets
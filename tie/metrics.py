@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+Opt-in performance counters.
+
+Once enabled (see :func:`enable` or :func:`collect`), TIE records for each
+Tag the number of its matches in rendered templates (counted on every render,
+whether the template was compiled before or not), processor calls and their
+cumulative and maximum duration, and cache hits and misses; and for each
+Template the number and duration of its renders. Use
+:func:`snapshot` to read them and :func:`reset` to start over.
+
+When disabled, instrumented code pathes only pay for a check of the module's
+``enabled`` flag. The codegen renderer falls back to the compiled template's
+regular render method while metrics are enabled, so that inlined
+substitutions are recorded too. Asynchronous renders are not recorded.
+Counters are updated under a lock, so that concurrent renders don't lose
+any.
+"""
+import time
+import weakref
+import threading
+import contextlib
+
+from tie import utils
+
+# Checked by instrumented code, use enable/disable to change it
+enabled = False
+
+timer = getattr(time, 'perf_counter', time.time)
+
+_tag_stats      = weakref.WeakKeyDictionary()
+_template_stats = weakref.WeakKeyDictionary()
+_lock           = threading.Lock()
+
+class TagStats(object):
+    """Counters of a single Tag"""
+    __slots__ = ('matches', 'calls', 'total_time', 'max_time', 'cache_hits',
+                 'cache_misses')
+
+    def __init__(self):
+        self.matches      = 0
+        self.calls        = 0
+        self.total_time   = 0.0
+        self.max_time     = 0.0
+        self.cache_hits   = 0
+        self.cache_misses = 0
+
+    def as_dict(self):
+        """Return the counters as a dictionnary"""
+        out = dict((name, getattr(self, name)) for name in self.__slots__)
+        out['mean_time'] = self.total_time / self.calls if self.calls else 0.0
+        return out
+
+
+class TemplateStats(object):
+    """Counters of a single Template"""
+    __slots__ = ('renders', 'total_time', 'max_time')
+
+    def __init__(self):
+        self.renders    = 0
+        self.total_time = 0.0
+        self.max_time   = 0.0
+
+    def as_dict(self):
+        """Return the counters as a dictionnary"""
+        out = dict((name, getattr(self, name)) for name in self.__slots__)
+        out['mean_time'] = (self.total_time / self.renders
+                            if self.renders else 0.0)
+        return out
+
+### Switches ###
+
+def enable():
+    """Start recording metrics"""
+    global enabled
+    enabled = True
+
+def disable():
+    """Stop recording metrics. Recorded values are kept."""
+    global enabled
+    enabled = False
+
+@contextlib.contextmanager
+def collect(reset_first=True):
+    """
+    Context manager recording metrics for the duration of its block (after
+    clearing previous ones, unless ``reset_first`` is False).
+    """
+    previous = enabled
+    if reset_first:
+        reset()
+    enable()
+    try:
+        yield
+    finally:
+        if not previous:
+            disable()
+
+def reset():
+    """Discard all recorded metrics"""
+    with _lock:
+        _tag_stats.clear()
+        _template_stats.clear()
+
+### Recording ###
+
+def tag_stats(tag_obj):
+    """
+    Return the TagStats of ``tag_obj``, creating them if needed.
+    Callers updating them must hold the module's lock.
+    """
+    stats = _tag_stats.get(tag_obj)
+    if stats is None:
+        stats = _tag_stats[tag_obj] = TagStats()
+    return stats
+
+def template_stats(template):
+    """
+    Return the TemplateStats of ``template``, creating them if needed.
+    Callers updating them must hold the module's lock.
+    """
+    stats = _template_stats.get(template)
+    if stats is None:
+        stats = _template_stats[template] = TemplateStats()
+    return stats
+
+def count_matches(tag_obj, num=1):
+    """Record ``num`` matches of ``tag_obj``"""
+    with _lock:
+        tag_stats(tag_obj).matches += num
+
+def count_cache(tag_obj, hit):
+    """Record a cache hit (or miss, if ``hit`` is False) of ``tag_obj``"""
+    with _lock:
+        stats = tag_stats(tag_obj)
+        if hit:
+            stats.cache_hits += 1
+        else:
+            stats.cache_misses += 1
+
+def call_processor(tag_obj, match, context):
+    """Call the processor of ``tag_obj`` and record its duration"""
+    start = timer()
+    try:
+        return tag_obj.processor(match, **context)
+    finally:
+        elapsed = timer() - start
+        with _lock:
+            stats = tag_stats(tag_obj)
+            stats.calls += 1
+            stats.total_time += elapsed
+            if elapsed > stats.max_time:
+                stats.max_time = elapsed
+
+def render(template, context):
+    """Render ``template`` and record the duration"""
+    start = timer()
+    try:
+        return template._render(context)
+    finally:
+        elapsed = timer() - start
+        with _lock:
+            stats = template_stats(template)
+            stats.renders += 1
+            stats.total_time += elapsed
+            if elapsed > stats.max_time:
+                stats.max_time = elapsed
+
+### Reporting ###
+
+def snapshot():
+    """
+    Return the current metrics as a dictionnary holding ``tags`` and
+    ``templates`` lists of counters dictionnaries, each labelled by a
+    ``tag`` (or ``template``) key and sorted by decreasing total time.
+    Times are in seconds.
+    """
+    tags, templates = [], []
+    with _lock:
+        tag_items = [(t, s.as_dict()) for t, s in list(_tag_stats.items())]
+        template_items = [(t, s.as_dict())
+                          for t, s in list(_template_stats.items())]
+    for tag_obj, d in tag_items:
+        d['tag'] = utils.unicode(tag_obj)
+        tags.append(d)
+    for template, d in template_items:
+        d['template'] = template.name or repr(template)
+        templates.append(d)
+    tags.sort(key=lambda d: -d['total_time'])
+    templates.sort(key=lambda d: -d['total_time'])
+    return {'tags': tags, 'templates': templates}
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+Parallel rendering of many contexts over a process pool.
+
+Templates, registered tags and the shared base context are shipped to each
+worker process once, when it starts; only the per-render contexts and the
+rendered strings travel afterwards. Tags (and their processors) must be
+picklable for that, unless a ``setup`` callable is provided to register them
+again in each worker (typically by importing the module defining them).
+"""
+import os
+import logging
+import multiprocessing
+
+from tie import tag
+
+LOGGER = logging.getLogger(__name__)
+
+# Worker processes' state, set by _init_worker
+_templates    = None
+_base_context = None
+
+def _init_worker(templates, tags, setup, base_context):
+    """Process pool initializer: register tags and store shared state."""
+    global _templates, _base_context
+    manager = tag.TagManager()
+    tag.set_manager(manager)
+    if setup is not None:
+        setup()
+    else:
+        for t in tags:
+            manager.add(t)
+    _templates    = templates
+    _base_context = base_context
+
+def _render_job(job):
+    """Render a single ``(template key, context)`` job in a worker."""
+    key, context = job
+    if _base_context:
+        merged = dict(_base_context)
+        merged.update(context)
+        context = merged
+    return _templates[key].render(**context)
+
+def default_workers():
+    """Return the default number of worker processes (the CPU count)."""
+    try:
+        return os.cpu_count() or 1
+    except AttributeError: # Python 2
+        return multiprocessing.cpu_count()
+
+def render_many(templates, jobs, workers=None, chunksize=None, setup=None,
+                base_context=None):
+    """
+    Render each ``(template key, context)`` pair of ``jobs`` with the
+    matching template of the ``templates`` dictionnary and return the list of
+    outputs, in order.
+
+    Parameters:
+    workers:      Number of worker processes. Defaults to the CPU count.
+                  With a single worker, everything is rendered in the current
+                  process.
+    chunksize:    Number of jobs sent to a worker at once. Defaults to
+                  splitting the jobs in about four chunks per worker.
+    setup:        Optional callable, run in each worker to register tags
+                  instead of shipping the currently registered ones.
+    base_context: Context dictionnary shared by all jobs, sent once to each
+                  worker. Jobs' contexts take precedence over it.
+    """
+    jobs = list(jobs)
+    if workers is None:
+        workers = default_workers()
+    base_context = base_context or {}
+    if workers <= 1 or len(jobs) <= 1:
+        out = []
+        for key, context in jobs:
+            merged = dict(base_context)
+            merged.update(context)
+            out.append(templates[key].render(**merged))
+        return out
+    if chunksize is None:
+        chunksize = max(1, len(jobs) // (workers * 4))
+    tags = None if setup is not None else tuple(tag.get_manager())
+    LOGGER.info("Rendering %i jobs over %i processes", len(jobs), workers)
+    pool = multiprocessing.Pool(workers, initializer=_init_worker,
+                                initargs=(templates, tags, setup, base_context))
+    try:
+        out = pool.map(_render_job, jobs, chunksize)
+    except BaseException:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+    return out
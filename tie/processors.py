@@ -13,22 +13,33 @@ __call__ method) and must accept the following arguments:
 
 After any processing is done, they should return the value to be injected as
 a unicode string.
+
+Processors may also define a ``depends`` attribute, listing the names of the
+context variables they read (or a callable returning them for a given match
+object). Cached tags use it to key their results on the relevant context
+values only.
 """
 import re
 import warnings
 
-from tie import utils, helpers
-from tie.exceptions import ContextWarning
+from tie import utils, helpers, accessors
+from tie.exceptions import ContextWarning, InvalidLookupError
+
+_LOOKUP = re.compile(r"\[.+\]|\.")
 
 def sub(match, **context):
     """
     Default tag processor.
     Returns the appropriate value from **context for a matched tag.
+    Attribute and item lookups (``user.name``, ``items[0]``) are resolved
+    through compiled accessors (see :mod:`tie.accessors`).
     """
     tag = helpers.get_single_group(match)
-    if re.search(r"\[.+\]|\.", tag):
+    if tag not in context and _LOOKUP.search(tag):
         # Attribute/Indice lookup
-        val = utils.unicode(eval(tag, {"__builtins__": None}, context))
+        val = accessors.get_accessor(tag).resolve(context,
+                                                  accessors.current_memo())
+        val = utils.unicode(val)
     else:
         # Straight value
         val = utils.unicode(context.get(tag, "")) # TODO: Error check
@@ -38,3 +49,15 @@ def sub(match, **context):
             ContextWarning
         )
     return val
+
+def _sub_depends(match):
+    """Names of the context variables read by sub for ``match``"""
+    tag = helpers.get_single_group(match)
+    if _LOOKUP.search(tag):
+        try:
+            return (tag, accessors.get_accessor(tag).root)
+        except InvalidLookupError:
+            pass
+    return (tag,)
+
+sub.depends = _sub_depends
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+Background reloading of DirectoryWatcher templates.
+
+Two backends are available:
+
+- ``stat``: polls the loaded templates' files every ``interval`` seconds and
+  reloads those which changed.
+- ``inotify``: (Linux only) waits for file system events on the watched
+  directories, reloads modified templates and reindexes the watcher when
+  files are created, removed or renamed.
+
+Changed templates are reloaded and recompiled in the background thread, so
+that renders keep using the previous version until the new one is ready.
+
+Use :func:`DirectoryWatcher.start_reloading()
+<tie.template.DirectoryWatcher.start_reloading>` rather than instanciating
+these classes directly.
+"""
+import os
+import sys
+import errno
+import select
+import struct
+import logging
+import threading
+import ctypes
+import ctypes.util
+
+LOGGER = logging.getLogger(__name__)
+
+class StatReloader(threading.Thread):
+    """Reloader thread polling loaded templates' files."""
+
+    def __init__(self, watcher, interval=1.0):
+        super(StatReloader, self).__init__(name="tie-reloader")
+        self.daemon   = True
+        self.watcher  = watcher
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        """Poll for changes until stopped."""
+        while not self._stopped.wait(self.interval):
+            self.poll()
+
+    def poll(self):
+        """Reload all changed templates."""
+        try:
+            self.watcher.reload_changed()
+        except Exception:
+            LOGGER.exception("Error while reloading templates")
+
+    def stop(self, timeout=None):
+        """Stop the thread and wait for it to terminate."""
+        self._stopped.set()
+        if self.is_alive():
+            self.join(timeout)
+
+### inotify ###
+
+IN_MODIFY      = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_ISDIR       = 0x40000000
+IN_IGNORED     = 0x00008000
+IN_CLOEXEC     = 0o2000000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+              IN_DELETE | IN_DELETE_SELF)
+
+_EVENT = struct.Struct('iIII')
+
+_libc = None
+
+def _get_libc():
+    """Return the C library, with its inotify functions, or None."""
+    global _libc
+    if _libc is None:
+        _libc = False
+        if sys.platform.startswith('linux'):
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library('c') or
+                                   'libc.so.6', use_errno=True)
+                libc.inotify_init1
+                libc.inotify_add_watch
+            except (OSError, AttributeError):
+                pass
+            else:
+                _libc = libc
+    return _libc or None
+
+def inotify_available():
+    """Return True if the inotify backend can be used on this system."""
+    return _get_libc() is not None
+
+
+class InotifyReloader(StatReloader):
+    """
+    Reloader thread waiting for inotify events on the watched directories.
+    ``interval`` is only used as a timeout to check whether the thread was
+    stopped.
+    """
+    def __init__(self, watcher, interval=1.0):
+        super(InotifyReloader, self).__init__(watcher, interval)
+        self._libc = _get_libc()
+        if self._libc is None:
+            raise OSError("inotify is not available on this system")
+        self._fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._wds = {}
+        for d in watcher.dirs:
+            self._add_tree(d)
+
+    def _add_watch(self, path):
+        """Watch a single directory"""
+        wd = self._libc.inotify_add_watch(
+            self._fd, path.encode(sys.getfilesystemencoding()), WATCH_MASK)
+        if wd < 0:
+            LOGGER.warning("Couldn't watch %s: %s", path,
+                           os.strerror(ctypes.get_errno()))
+            return
+        self._wds[wd] = path
+
+    def _add_tree(self, path):
+        """Watch a directory and, if needed, its sub directories"""
+        self._add_watch(path)
+        if self.watcher.recursive:
+            for root, dirs, _ in os.walk(path):
+                for d in dirs:
+                    self._add_watch(os.path.join(root, d))
+
+    def run(self):
+        """Wait for events until stopped."""
+        try:
+            while not self._stopped.is_set():
+                try:
+                    ready, _, _ = select.select([self._fd], [], [],
+                                                self.interval)
+                except (OSError, select.error) as e:
+                    if e.args[0] == errno.EINTR:
+                        continue
+                    raise
+                if ready:
+                    self.handle(os.read(self._fd, 64 * 1024))
+        finally:
+            os.close(self._fd)
+
+    def handle(self, data):
+        """Process a buffer of raw inotify events."""
+        changed, reindex = set(), False
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, pos)
+            pos += _EVENT.size
+            name = data[pos:pos + length].rstrip(b'\0')
+            pos += length
+            if mask & IN_IGNORED:
+                self._wds.pop(wd, None)
+                continue
+            directory = self._wds.get(wd)
+            if directory is None:
+                continue
+            path = os.path.join(directory,
+                                name.decode(sys.getfilesystemencoding()))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and self.watcher.recursive:
+                    self._add_tree(path)
+                reindex = True
+            elif mask & (IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO):
+                reindex = True
+                changed.add(path)
+            else:
+                changed.add(path)
+        try:
+            if reindex:
+                self.watcher.reindex()
+            if changed:
+                self.watcher.reload_changed(changed)
+        except Exception:
+            LOGGER.exception("Error while reloading templates")
+
+BACKENDS = {
+    'stat':    StatReloader,
+    'inotify': InotifyReloader,
+}
+
+def get_reloader(watcher, backend='auto', interval=1.0):
+    """
+    Return a reloader thread (not started yet) for ``watcher``.
+    ``backend`` is one of 'stat', 'inotify' or 'auto' (inotify when
+    available, stat otherwise).
+    """
+    if backend == 'auto':
+        backend = 'inotify' if inotify_available() else 'stat'
+    try:
+        cls = BACKENDS[backend]
+    except KeyError:
+        raise ValueError("Unknown reloader backend: %s" % backend)
+    return cls(watcher, interval)
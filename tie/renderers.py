@@ -14,20 +14,177 @@ After any processing is done, they should return the rendered template as a
 unicode string.
 """
 import re
-from tie import tag
+import hashlib
+import weakref
+
+from tie import tag, utils, metrics, cache
+
+# Compiled substitution regexes, keyed on the set of substituted strings
+_substitution_cache = utils.LRUCache(maxsize=128)
 
 def default_renderer(template, **context):
     """
     Default template renderer. 
-    Process each registered Tag and returns the whole processed string.
+    Compile the template on first use (see
+    :func:`Template.compile()<tie.template.Template.compile>`), then evaluate
+    each of its tag slots and return the whole processed string.
+    Templates are rendered with :func:`substitution_renderer` if some of the
+    registered tags redefine Tag.process.
+    """
+    compiled = template.compile()
+    if not compiled.compilable:
+        return substitution_renderer(template, **context)
+    return compiled.render(**context)
+
+def codegen_renderer(template, **context):
+    """
+    Code generating template renderer.
+    Like the default renderer, but the compiled template is further turned
+    into a dedicated Python function on first use (see :mod:`tie.codegen`),
+    with literal segments inlined and plain substitutions looked up straight
+    from the context. Fastest option for templates rendered many times.
+    While metrics are enabled (see :mod:`tie.metrics`), or if some of the
+    registered tags redefine Tag.process, templates are rendered like with
+    the default renderer.
+    """
+    if metrics.enabled or not template.compile().compilable:
+        return default_renderer(template, **context)
+    return template.compile().render_function()(context)
+
+def substitution_renderer(template, **context):
+    """
+    Process each registered Tag over the whole template string and return it
+    with all matched tags substituted in a single pass.
+    Much slower than the default renderer, since nothing is kept between
+    renders, but it will honour Tag subclasses redefining Tag.process.
     """
     out = template.template
     vals = {}
     for t in tag.get_manager():
         vals.update(t.process(out, **context))
     if vals:
-        rgx = re.compile('|'.join(vals.keys()))
+        rgx = substitution_regex(vals.keys())
         return rgx.sub(lambda m: vals[m.group(0)], out)
     else: 
         return out
 
+def substitution_regex(strings):
+    """
+    Return a compiled regex matching any of the literal ``strings``.
+    Longer strings are tried first, so that a string is never shadowed by one
+    of its prefixes.
+    Regexes are cached (with bounded eviction) on the set of passed strings.
+    """
+    key = frozenset(strings)
+    rgx = _substitution_cache.get(key)
+    if rgx is None:
+        ordered = sorted(key, key=lambda s: (-len(s), s))
+        rgx = re.compile('|'.join(re.escape(s) for s in ordered))
+        _substitution_cache[key] = rgx
+    return rgx
+
+
+class CachedRenderer(object):
+    """
+    Renderer caching rendered outputs in memory and, optionally, on the local
+    disk, so that they survive restarts.
+
+    Outputs are keyed on the template's content (see
+    :attr:`CompiledTemplate.digest<tie.compiler.CompiledTemplate.digest>`)
+    and the values of the context variables it references (see
+    :attr:`Template.variables<tie.template.Template.variables>`), or of the
+    whole context if they can't be known, along with their types. Only
+    contexts made of simple immutable values (see
+    :func:`cache.stable_repr<tie.cache.stable_repr>`) are cached, both in
+    memory and on disk.
+
+    Use :func:`watch` to invalidate the outputs of templates reloaded by a
+    DirectoryWatcher.
+    """
+    def __init__(self, renderer=default_renderer, maxsize=1024, ttl=None,
+                 directory=None, max_bytes=64 * 1024 * 1024, disk_ttl=None):
+        """
+        Parameters:
+        renderer:  Renderer actually rendering templates on cache misses.
+        maxsize:   Maximum number of outputs kept in memory.
+        ttl:       Optional lifetime of outputs, in seconds.
+        directory: Directory of the disk store. Outputs are only kept in
+                   memory if not set.
+        max_bytes: Size budget of the disk store, in bytes.
+        disk_ttl:  Lifetime of outputs on disk. Defaults to ``ttl``.
+        """
+        self.renderer = renderer
+        self.memory   = utils.LRUCache(maxsize=maxsize, ttl=ttl)
+        self.disk     = None
+        if directory is not None:
+            self.disk = cache.DiskStore(
+                directory, max_bytes, ttl if disk_ttl is None else disk_ttl)
+        # Last seen content digest of each template, for invalidation
+        self._digests = weakref.WeakKeyDictionary()
+
+    def __call__(self, template, **context):
+        compiled = template.compile()
+        digest = compiled.digest
+        self._digests[template] = digest
+        names = compiled.variables
+        if names is None:
+            names = context
+        values = tuple((n, context.get(n, utils.MISSING))
+                       for n in sorted(names))
+        values_repr = cache.stable_repr(values)
+        if values_repr is None:
+            return self.renderer(template, **context)
+        key = (digest, values_repr)
+        out = self.memory.get(key, utils.MISSING)
+        if out is not utils.MISSING:
+            return out
+        disk_key = None
+        if self.disk is not None:
+            disk_key = self.disk_key(digest, values)
+            out = self.disk.get(disk_key)
+            if out is not None:
+                self.memory[key] = out
+                return out
+        out = self.renderer(template, **context)
+        self.memory[key] = out
+        if disk_key is not None:
+            self.disk.set(disk_key, out)
+        return out
+
+    @staticmethod
+    def disk_key(digest, values):
+        """
+        Return the disk store key for the ``digest`` template content and
+        ``values`` context values, or None if they can't be stored.
+        """
+        values_repr = cache.stable_repr(values)
+        if values_repr is None:
+            return None
+        return "%s-%s" % (digest[:16], hashlib.sha1(
+            values_repr.encode('utf-8', 'surrogatepass')).hexdigest())
+
+    def invalidate(self, template=None):
+        """
+        Discard the cached outputs of ``template`` (as last rendered), or all
+        cached outputs if no template is passed.
+        """
+        if template is None:
+            self.memory.clear()
+            if self.disk is not None:
+                self.disk.clear()
+            return
+        digest = self._digests.pop(template, None)
+        if digest is None:
+            return
+        for key in self.memory.keys():
+            if key[0] == digest:
+                self.memory.pop(key)
+        if self.disk is not None:
+            self.disk.remove_prefix(digest[:16] + '-')
+
+    def watch(self, watcher):
+        """
+        Invalidate the outputs of templates whenever ``watcher`` (a
+        DirectoryWatcher) reloads them.
+        """
+        watcher.reload_callbacks.append(self.invalidate)
@@ -9,10 +9,16 @@ of the Tag or TagManager classes.
 """
 import re
 import logging
+import threading
+import contextlib
+try:
+    import contextvars
+except ImportError: # Python < 3.7
+    contextvars = None
 
 from tie import processors
-from tie import utils
-from tie.exceptions import InvalidTagError
+from tie import utils, helpers, metrics
+from tie.exceptions import InvalidTagError, TemplateError
 
 LOGGER = logging.getLogger(__name__)
 
@@ -29,15 +35,23 @@ class Tag(object):
     """
 
     def __init__(self, pattern, flags=0, processor=processors.sub,
-                 cached=False): 
+                 cached=False, cache_size=128, cache_ttl=None, depends=None): 
         """
         Parameters:
-        pattern:   Regular expression used for tag matching.
-                   Can be either a string or an already compiled regex object.
-        flags:     re module's flags for pattern compilation.
-                   Pass them just as you would when using the re.compile 
-                   function.
-        processor: Tag processing callback. 
+        pattern:    Regular expression used for tag matching.
+                    Can be either a string or an already compiled regex 
+                    object.
+        flags:      re module's flags for pattern compilation.
+                    Pass them just as you would when using the re.compile 
+                    function.
+        processor:  Tag processing callback. 
+        cached:     Memoise processing results (see process_match).
+        cache_size: Maximum number of cached results.
+        cache_ttl:  Optional lifetime of cached results, in seconds.
+        depends:    Names of the context variables read by the processor,
+                    or a callable returning them for a given match object.
+                    Defaults to the processor's own ``depends`` attribute if
+                    it has one, else to the whole context.
         """
         try:
             self.regexp = re.compile(pattern, flags=flags)
@@ -48,8 +62,12 @@ class Tag(object):
             )
         self.processor = processor
 
+        self.depends = depends
+        if depends is None:
+            self.depends = getattr(processor, 'depends', None)
+
         self.cached = cached
-        self.cache  = {}
+        self.cache  = utils.LRUCache(maxsize=cache_size, ttl=cache_ttl)
 
     def __str__(self):
         """To string"""
@@ -59,6 +77,13 @@ class Tag(object):
         """Instance representation"""
         return self.__str__()
 
+    def __getstate__(self):
+        """Cached results aren't shipped along pickled tags."""
+        state = self.__dict__.copy()
+        state['cache'] = utils.LRUCache(maxsize=self.cache.maxsize,
+                                        ttl=self.cache.ttl)
+        return state
+
     def match(self, template):
         """
         Find all matches in ``template`` and return them as an generator
@@ -74,26 +99,166 @@ class Tag(object):
         Return a dictionnary mapping the matched tags from the template with
         their corresponding values.
         """
-        if self.cached and self.cache:
-            return self.cache
         out = {}
         num_matches = 0
+        debug = LOGGER.isEnabledFor(logging.DEBUG)
         for m in self.match(template):
             num_matches += 1
             src_tag = m.group(0)
-            LOGGER.debug("%s matched %s", self, src_tag)
+            if debug:
+                LOGGER.debug("%s matched %s", self, src_tag)
             if src_tag not in out:
-                val = self.processor(m, **context)
-                LOGGER.debug("Substituting %s for %s", val, src_tag)
-                out[src_tag] = val
+                out[src_tag] = self.process_match(m, **context)
         LOGGER.debug("Found %i matches for %s", num_matches, self)
-        if self.cached:
-            self.cache = out
+        if metrics.enabled:
+            metrics.count_matches(self, num_matches)
         return out
 
+    def process_match(self, match, **context):
+        """
+        Process a single match object using the instance's own processor
+        function and return the resulting value.
+        Cached tags look their results up by template, matched string and
+        values of the context variables the processor depends on, and only
+        call their processor on cache misses. Results depending on unhashable
+        context values are never cached.
+        """
+        if not self.cached:
+            if metrics.enabled:
+                return metrics.call_processor(self, match, context)
+            return self.processor(match, **context)
+        key = self.cache_key(match, context)
+        if key is not None:
+            val = self.cache.get(key, utils.MISSING)
+            if metrics.enabled:
+                metrics.count_cache(self, val is not utils.MISSING)
+            if val is not utils.MISSING:
+                return val
+        if metrics.enabled:
+            val = metrics.call_processor(self, match, context)
+        else:
+            val = self.processor(match, **context)
+        LOGGER.debug("Substituting %s for %s", val, match.group(0))
+        if key is not None:
+            self.cache[key] = val
+        return val
+
+    def cache_key(self, match, context):
+        """
+        Return the cache key for processing ``match`` with ``context``, or
+        None if it can't be cached.
+        """
+        depends = self.depends
+        if depends is None:
+            names = sorted(context)
+        elif callable(depends):
+            names = depends(match)
+        else:
+            names = depends
+        values = []
+        for n in names:
+            val = context.get(n, utils.MISSING)
+            # Equal values of different types (1, 1.0, True) render apart
+            values.append((n, type(val), val))
+        key = (match.string, match.group(0), tuple(values))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
     def clear_cache(self):
         """Clear the tag's internal cache"""
-        self.cache = {}
+        self.cache.clear()
+
+
+class DelimitedTag(Tag):
+    """
+    Tag enclosed between fixed opening and closing delimiters, such as
+    ``{{ name }}``.
+    The delimiters are literal strings, escaped when building the tag's
+    pattern. Compiled templates are scanned for the opening delimiter with
+    plain string searches rather than regular expressions (see
+    :class:`Scanner<tie.compiler.Scanner>`), which is much faster when
+    several tags are registered.
+    """
+    def __init__(self, opening, closing, inner=r"\s*(\S+?)\s*", flags=0,
+                 **kwargs):
+        """
+        Parameters:
+        opening: Opening delimiter.
+        closing: Closing delimiter.
+        inner:   Regular expression matching the tag's content, between its
+                 delimiters. Defaults to a single word, captured in the first
+                 group, optionnaly surrounded by whitespace.
+        Other keyword arguments are passed to Tag.
+        """
+        strings = (str, utils.unicode)
+        if not isinstance(opening, strings) or \
+           not isinstance(closing, strings) or not opening:
+            raise InvalidTagError(
+                    "Invalid tag delimiters %r and %r" % (opening, closing))
+        self.opening = opening
+        self.closing = closing
+        pattern = re.escape(opening) + inner + re.escape(closing)
+        super(DelimitedTag, self).__init__(pattern, flags, **kwargs)
+
+
+class IncludeTag(Tag):
+    """
+    Tag including another template.
+    The first group of the tag's pattern (or the whole match if it has none)
+    is the name of the included template, looked up in ``templates`` (usually
+    a TemplateManager or DirectoryWatcher).
+
+    Compiled templates inline the compiled form of the templates they include
+    (see :func:`compile_template()<tie.compiler.compile_template>`), and are
+    recompiled whenever one of them changes. Other renderers render the
+    included template with the same context.
+    """
+    def __init__(self, pattern, templates, flags=0, **kwargs):
+        """
+        Parameters:
+        pattern:   Regular expression used for tag matching.
+        templates: Mapping of template names to Template objects.
+        Other keyword arguments are passed to Tag.
+        """
+        self.templates = templates
+        kwargs.setdefault('processor', self.render_include)
+        super(IncludeTag, self).__init__(pattern, flags, **kwargs)
+
+    def __getstate__(self):
+        """
+        The default processor is rebound on unpickling, since Python 2 can't
+        pickle bound methods.
+        """
+        state = super(IncludeTag, self).__getstate__()
+        if state['processor'] == self.render_include:
+            state['processor'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.processor is None:
+            self.processor = self.render_include
+
+    def template_name(self, match):
+        """Return the name of the template included by ``match``"""
+        return helpers.get_single_group(match).strip()
+
+    def get_template(self, name):
+        """
+        Return the included template named ``name``.
+        Raise a TemplateError if there is none.
+        """
+        try:
+            return self.templates[name]
+        except KeyError:
+            raise TemplateError("No template named %s to include" % name)
+
+    def render_include(self, match, **context):
+        """Default processor: render the included template"""
+        return self.get_template(self.template_name(match)).render(**context)
 
 ### Managers ###
 ################
@@ -107,23 +272,40 @@ class TagManager(object):
     Tags are stored in a simple list. Eventual subclasses will need to
     redefine their access and __iter__ method if they decide to use another
     data structure.
+
+    The ``version`` attribute is incremented each time the registered tags
+    change, so that anything derived from them (such as compiled templates)
+    can cheaply check whether it is still up to date. Subclasses should call
+    :func:`_changed` whenever they alter their tags, holding the manager's
+    ``_lock`` so that concurrent changes aren't lost.
     """
     def __init__(self):
         self._tag_list = []
+        self.version   = 0
+        self._lock     = threading.RLock()
 
     def add(self, tag):
         """
         Register a new tag.
         Override this method to accomodate a different internal data strucutre.
         """
-        self._tag_list.append(self._check_tag(tag))
+        tag = self._check_tag(tag)
+        with self._lock:
+            self._tag_list.append(tag)
+            self._changed()
 
     def clear(self):
         """
         Clear the internal tag list.
         Override to accomodate a different internal data strucutre.
         """
-        self._tag_list = []
+        with self._lock:
+            self._tag_list = []
+            self._changed()
+
+    def _changed(self):
+        """Bump the manager's version after its tags changed."""
+        self.version += 1
 
     def __iter__(self):
         """
@@ -158,10 +340,13 @@ class PriorityTagManager(TagManager):
     """
     TagManager that keeps a priority value along its tags and yields them
     in that order.
+    Tags are stored in a dictionnary of lists keyed by priority, along with
+    a flat, ordered tuple of all tags rebuilt on each change.
     """
     def __init__(self):
         super(PriorityTagManager, self).__init__()
         self._tag_list = {}
+        self._ordered  = ()
 
     def add(self, tag):
         """
@@ -174,27 +359,66 @@ class PriorityTagManager(TagManager):
         except TypeError:
             tag_obj, priority = tag, 0
         tag_obj = self._check_tag(tag_obj)
-        self._tag_list.setdefault(priority, []).append(tag_obj)
+        with self._lock:
+            self._tag_list.setdefault(priority, []).append(tag_obj)
+            self._changed()
 
     def clear(self):
         """Clear the internal tag list."""
-        self._tag_list = {}
+        with self._lock:
+            self._tag_list = {}
+            self._changed()
+
+    def _changed(self):
+        """Rebuild the ordered tag tuple and bump the manager's version."""
+        self._ordered = tuple(tag for i in sorted(self._tag_list.keys())
+                                  for tag in self._tag_list[i])
+        super(PriorityTagManager, self)._changed()
 
     def __iter__(self):
         """Yield contained tags."""
-        for i in sorted(self._tag_list.keys()):
-            for tag in self._tag_list[i]:
-                yield tag
+        return iter(self._ordered)
+
+    def __len__(self):
+        return len(self._ordered)
 
 # "Global" manager instance.
 _manager = TagManager()
 
+class _ThreadVar(object):
+    """Thread-local stand-in for contextvars.ContextVar (Python < 3.7)"""
+    def __init__(self):
+        self._local = threading.local()
+
+    def get(self):
+        return getattr(self._local, 'value', None)
+
+    def set(self, value):
+        token = self.get()
+        self._local.value = value
+        return token
+
+    def reset(self, token):
+        self._local.value = token
+
+# Manager of the current context, overriding the global one (see use_manager)
+if contextvars is not None:
+    _context_manager = contextvars.ContextVar('tie_tag_manager', default=None)
+else:
+    _context_manager = _ThreadVar()
+
 ### Module Level Utils ###
 ##########################
 
 def get_manager():
-    """Return the global TagManager"""
-    return _manager
+    """
+    Return the TagManager of the current context (see :func:`use_manager`),
+    or the global one.
+    """
+    manager = _context_manager.get()
+    if manager is None:
+        return _manager
+    return manager
 
 def set_manager(manager):
     """
@@ -205,6 +429,23 @@ def set_manager(manager):
     LOGGER.info("New Tag manager: %s", manager)
     _manager = manager
 
+@contextlib.contextmanager
+def use_manager(manager):
+    """
+    Context manager making ``manager`` the current TagManager for the
+    duration of its block, in the current context only: other threads and
+    asyncio tasks keep using their own (or the global one). Tasks and
+    callbacks started from the block inherit it, but new threads don't
+    (use contextvars.copy_context to carry it over).
+    Falls back to thread-local scoping on Python versions without the
+    contextvars module.
+    """
+    token = _context_manager.set(manager)
+    try:
+        yield manager
+    finally:
+        _context_manager.reset(token)
+
 def register(*tag_list):
     """Register a sequence of tags."""
     manager = get_manager()
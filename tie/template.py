@@ -5,9 +5,14 @@ Template classes and utilities.
 
 """
 import os
+import time
+import mmap
+import codecs
+import locale
 import logging
 
-from tie import renderers
+from tie import tag, utils, cache, renderers, parallel, reloader, metrics
+from tie.compiler import compile_template
 from tie.exceptions import TemplateError
 from tie.helpers import list_files, path_to_tmpl_name
 
@@ -21,6 +26,16 @@ class Template(object):
     Basic customization can be achieved by providing a custom rendering
     callback.
     """
+    # Approximate size of the chunks yielded by render_iter
+    chunk_size = 16384
+    # Maximum number of concurrently awaited tags in render_async
+    concurrency = 16
+    # Optional tie.cache.CompiledCache instance used by compile
+    compiled_cache = None
+    # Number of rendered outputs memoised by render (0 disables the memo).
+    # Only renders whose variables hold simple immutable values are memoised.
+    memo_size = 0
+
     def __init__(self, tmpl, name='', renderer=renderers.default_renderer):
         """ 
         Parameters:
@@ -31,6 +46,17 @@ class Template(object):
         self.template = tmpl
         self.name     = name
         self.renderer = renderer
+        self._memo    = None
+
+    @property
+    def template(self):
+        """Template string. Setting it discards the compiled template."""
+        return self._template
+
+    @template.setter
+    def template(self, tmpl):
+        self._template = tmpl
+        self._compiled = None
     
     def __call__(self, **context):
         """
@@ -47,7 +73,185 @@ class Template(object):
         """
         LOGGER.info("Rendering template %s", self)
         LOGGER.debug("Context vars: %s", context)
-        return self.renderer(self, **context)
+        if metrics.enabled:
+            return metrics.render(self, context)
+        return self._render(context)
+
+    def _render(self, context):
+        """
+        Render with the template's renderer, through the output memo if
+        enabled (see :func:`memo_key`).
+        """
+        if not self.memo_size:
+            return self.renderer(self, **context)
+        compiled = self.compile()
+        key = self.memo_key(context, compiled)
+        if key is None:
+            return self.renderer(self, **context)
+        memo = self._memo
+        if memo is None or memo[0] is not compiled or \
+           memo[1].maxsize != self.memo_size:
+            memo = self._memo = (compiled,
+                                 utils.LRUCache(maxsize=self.memo_size))
+        out = memo[1].get(key, utils.MISSING)
+        if out is utils.MISSING:
+            out = memo[1][key] = self.renderer(self, **context)
+        return out
+
+    @property
+    def variables(self):
+        """
+        Frozenset of the names of the context variables referenced by the
+        template, or None if they can't be known (see
+        :attr:`CompiledTemplate.variables
+        <tie.compiler.CompiledTemplate.variables>`).
+        """
+        return self.compile().variables
+
+    def memo_key(self, context, compiled=None):
+        """
+        Return the output memo key for rendering ``context``: the values of
+        the referenced variables only, so that contexts differing in other
+        variables share their output. Return None if the output can't be
+        memoised (unknown variables, or values of other types than those
+        supported by :func:`cache.stable_repr<tie.cache.stable_repr>`).
+
+        Values are keyed along with their type, so that equal values
+        rendering differently (``1``, ``1.0`` and ``True``) don't share
+        their output. Only immutable values are supported, since objects
+        mutated between renders would otherwise get stale outputs.
+        Memoised outputs are reused as long as the compiled form doesn't
+        change; the renderer and tag processors are assumed to only depend on
+        the template and the variables they declare.
+        """
+        if compiled is None:
+            compiled = self.compile()
+        names = compiled.variables
+        if names is None:
+            return None
+        key = []
+        for n in sorted(names):
+            value_repr = cache.stable_repr(context.get(n, utils.MISSING))
+            if value_repr is None:
+                return None
+            key.append((n, value_repr))
+        return tuple(key)
+
+    def render_iter(self, **context):
+        """
+        Process the template & yield the result in successive chunks of
+        about ``Template.chunk_size`` characters, so that the whole output
+        never has to be held in memory.
+        Only the default renderer supports streaming; templates using a
+        custom renderer, or tags redefining Tag.process, yield their whole
+        output at once.
+        """
+        if self.renderer is not renderers.default_renderer or \
+           not self.compile().compilable:
+            yield self.render(**context)
+            return
+        LOGGER.info("Rendering template %s", self)
+        LOGGER.debug("Context vars: %s", context)
+        for chunk in self.compile().render_iter(context, self.chunk_size):
+            yield chunk
+
+    def render_to(self, stream, **context):
+        """
+        Process the template & write the result to ``stream``, chunk by
+        chunk (see :func:`render_iter()<tie.template.Template.render_iter>`).
+        ``stream`` can be any object with a ``write`` method accepting
+        unicode strings (for sockets, use ``socket.makefile``).
+        Return the number of characters written.
+        """
+        written = 0
+        for chunk in self.render_iter(**context):
+            stream.write(chunk)
+            written += len(chunk)
+        return written
+
+    def render_batch(self, columns, **context):
+        """
+        Render the template once per row of column-oriented data and return
+        the list of outputs.
+        ``columns`` maps context variable names to sequences (or NumPy
+        arrays) of equal length, each row being rendered with the row's
+        values on top of the shared ``context`` keyword variables.
+        This is much faster than calling
+        :func:`render()<tie.template.Template.render>` for each row, since
+        the template is only processed once and columns are converted to
+        strings in bulk.
+        """
+        return list(self.render_batch_iter(columns, **context))
+
+    def render_batch_iter(self, columns, **context):
+        """
+        Same as :func:`render_batch()<tie.template.Template.render_batch>`,
+        but yield each row's output instead of returning them all at once.
+        """
+        LOGGER.info("Batch rendering template %s", self)
+        if self.renderer is not renderers.default_renderer or \
+           not self.compile().compilable:
+            names = list(columns)
+            for values in zip(*[columns[n] for n in names]):
+                row_context = dict(context)
+                row_context.update(zip(names, values))
+                yield self.render(**row_context)
+            return
+        for out in self.compile().render_batch(columns, context):
+            yield out
+
+    def render_async(self, **context):
+        """
+        Return a coroutine processing the template & returning the result.
+        Tag processors may be coroutine functions: all of a render's
+        asynchronous tag evaluations are awaited concurrently, at most
+        ``Template.concurrency`` at a time (see :mod:`tie.aio`).
+        Python 3 only.
+        """
+        from tie import aio
+        LOGGER.info("Rendering template %s asynchronously", self)
+        return aio.render_async(self, context)
+
+    def render_many(self, contexts, workers=None, chunksize=None, setup=None,
+                    **context):
+        """
+        Render the template once for each of the ``contexts`` dictionnaries,
+        spreading the work over ``workers`` processes (defaults to the CPU
+        count), and return the list of outputs in order.
+        The template, the registered tags and the shared ``context`` keyword
+        variables are only sent once to each worker. See
+        :func:`tie.parallel.render_many` for the other parameters.
+        """
+        LOGGER.info("Rendering template %s over a process pool", self)
+        return parallel.render_many({'': self},
+                                    (('', c) for c in contexts),
+                                    workers=workers, chunksize=chunksize,
+                                    setup=setup, base_context=context)
+
+    def __getstate__(self):
+        """Compiled forms aren't picklable, and are rebuilt on demand."""
+        state = self.__dict__.copy()
+        state['_compiled'] = None
+        state['_memo'] = None
+        return state
+
+    def compile(self, manager=None):
+        """
+        Split the template string into literal segments and tag slots, using
+        the tags registered in ``manager`` (defaults to the current global
+        TagManager), and return the resulting
+        :class:`CompiledTemplate<tie.compiler.CompiledTemplate>`.
+        The compiled form is kept and reused as long as the registered tags
+        don't change, so this is only done once, on first render.
+        """
+        if manager is None:
+            manager = tag.get_manager()
+        compiled = self._compiled
+        if compiled is None or not compiled.is_valid(manager):
+            LOGGER.debug("Compiling template %s", self)
+            compiled = self._compiled = compile_template(
+                self.template, manager, self.compiled_cache)
+        return compiled
 
     @classmethod
     def from_file(cls, tmpl_path, name='', *args, **kwargs):
@@ -55,13 +259,132 @@ class Template(object):
         Alternative constructor -> Creates a template from a file.
         If `name` is not proveded, the template's name attribute will default
         to the file's basename, without extension.
+        Pass ``lazy=True`` to get a :class:`FileTemplate`, which will only
+        read the file when first needed, and ``compiled_cache`` to have the
+        template's compiled form stored on disk (see
+        :class:`CompiledCache<tie.cache.CompiledCache>`).
+        """
+        compiled_cache = kwargs.pop('compiled_cache', None)
+        if kwargs.pop('lazy', False):
+            template = FileTemplate(tmpl_path, name, *args, **kwargs)
+        else:
+            with open(tmpl_path, 'r') as tmpl_f:
+                template_string = tmpl_f.read()
+            if not name:
+                name = path_to_tmpl_name(tmpl_path)
+            template = cls(template_string, name=name, *args, **kwargs)
+        if compiled_cache is not None:
+            template.compiled_cache = compiled_cache
+        return template
+
+
+class FileTemplate(Template):
+    """
+    Lazily loaded file template.
+    The file is only read on first access to the template string (usually on
+    first render): it is then memory-mapped and decoded straight from the
+    mapping, without any intermediate copy.
+    Use :func:`Template.from_file()<tie.template.Template.from_file>` with
+    ``lazy=True`` to get one.
+    """
+    def __init__(self, tmpl_path, name='', renderer=renderers.default_renderer,
+                 encoding=None):
+        """
+        Parameters:
+        tmpl_path: Template file's path. 
+                   Must point to an existing file.
+        name:      Template name. Defaults to the file's basename, without 
+                   extension.
+        renderer:  Rendering callback.
+        encoding:  File encoding. Defaults to the locale's preferred encoding,
+                   just like the builtin open function.
+        """
+        if not os.path.isfile(tmpl_path):
+            raise IOError("No such file: %s" % tmpl_path)
+        self.path     = tmpl_path
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        super(FileTemplate, self).__init__(
+            None, name or path_to_tmpl_name(tmpl_path), renderer)
+
+    @property
+    def template(self):
+        """Template string, loaded from the file on first access."""
+        if self._template is None:
+            self._template = self._load()
+        return self._template
+
+    @template.setter
+    def template(self, tmpl):
+        self._template = tmpl
+        self._compiled = None
+
+    @property
+    def loaded(self):
+        """True once the file has been read."""
+        return self._template is not None
+
+    def is_stale(self):
+        """
+        Return True if the file changed on disk since it was loaded.
+        Templates whose file was removed are not considered stale, so that
+        they keep their last loaded version.
+        """
+        if self._template is None:
+            return False
+        try:
+            return file_signature(self.path) != self._signature
+        except OSError:
+            return False
+
+    def reload(self, manager=None):
+        """
+        Read the template file again. If the template was already compiled,
+        it is recompiled against ``manager`` (defaults to the current global
+        TagManager) before the new version replaces the old one, so that
+        concurrent renders never have to wait for it.
+        If that compilation fails, the new version is kept uncompiled (so
+        that the error is raised again on next compile) and the error is
+        raised.
         """
-        with open(tmpl_path, 'r') as tmpl_f:
-            template_string = tmpl_f.read()
-        if not name:
-            name = path_to_tmpl_name(tmpl_path)
-        return cls(template_string, name=name, *args, **kwargs)
+        LOGGER.info("Reloading template %s", self)
+        tmpl = self._load()
+        compiled = None
+        if self._compiled is not None:
+            if manager is None:
+                manager = tag.get_manager()
+            try:
+                compiled = compile_template(tmpl, manager, self.compiled_cache)
+            except TemplateError:
+                self._template, self._compiled = tmpl, None
+                raise
+        self._template, self._compiled = tmpl, compiled
+
+    def _load(self):
+        """Memory-map the template file and return its decoded contents."""
+        LOGGER.debug("Loading template file %s", self.path)
+        self._signature = file_signature(self.path)
+        with open(self.path, 'rb') as tmpl_f:
+            try:
+                mapped = mmap.mmap(tmpl_f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError: # Empty file
+                return ''
+        try:
+            tmpl = codecs.decode(mapped, self.encoding)
+        finally:
+            mapped.close()
+        # Universal newlines, like a text mode read
+        if '\r' in tmpl:
+            tmpl = tmpl.replace('\r\n', '\n').replace('\r', '\n')
+        return tmpl
         
+def file_signature(path):
+    """
+    Return a value changing whenever the file at ``path`` is modified or
+    replaced.
+    """
+    st = os.stat(path)
+    return (getattr(st, 'st_mtime_ns', st.st_mtime), st.st_size, st.st_ino)
+
 ### Managers ###
 ################
 
@@ -71,26 +394,66 @@ class TemplateManager(object):
     Iterating over it will yield each contained template in order of their 
     insertion.
 
-    Templates are stored in a simple list. Eventual subclasses will need to
-    redefine their access and __iter__ method if they decide to use another
-    data structure.
+    Contained templates can be accessed by name, either as attributes or
+    like in a dictionnary (``manager['name']``, ``'name' in manager``,
+    ``manager.get('name')``).
+    Adding a template with the same name as an already registered one
+    replaces it (at the same position in the iteration order). Unnamed
+    templates are only reachable through iteration.
+
+    Templates are stored in a simple list, along with a dictionnary indexing
+    them by name. Eventual subclasses will need to redefine their access and
+    __iter__ method if they decide to use another data structure.
     """
     def __init__(self):
-        self._template_list = []
+        self._template_list  = []
+        self._template_index = {}
 
     def add(self, template):
         """
         Register a new template.
         Override this method to accomodate a different internal data strucutre.
         """
-        self._template_list.append(self._check_template(template))
+        template = self._check_template(template)
+        name = template.name
+        previous = self._template_index.get(name) if name else None
+        if previous is not None:
+            LOGGER.info("Replacing template %s", name)
+            self._template_list[self._template_list.index(previous)] = template
+        else:
+            self._template_list.append(template)
+        if name:
+            self._template_index[name] = template
 
     def clear(self):
         """
         Clear the internal template list.
         Override to accomodate a different internal data strucutre.
         """
-        self._template_list = []
+        self._template_list  = []
+        self._template_index = {}
+
+    def get(self, name, default=None):
+        """
+        Return the template named `name`, or `default` if there is none.
+        """
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def __getitem__(self, name):
+        """
+        Return the template named `name`.
+        Raises a KeyError if none is found.
+        """
+        return self._template_index[name]
+
+    def __contains__(self, name):
+        return name in self._template_index
+
+    def __len__(self):
+        return len(self._template_list)
 
     def __iter__(self):
         """
@@ -105,10 +468,32 @@ class TemplateManager(object):
         Try and return a contained template whose name matches the key arg.
         Raises an AttributeError if none is found.
         """
-        for template in self._template_list:
-            if template.name == key:
-                return template
-        raise AttributeError("Invalid attribute or template name: %s" % key)
+        # Avoid infinite recursion if called before __init__ (unpickling...)
+        try:
+            return self.__dict__['_template_index'][key]
+        except KeyError:
+            raise AttributeError("Invalid attribute or template name: %s" %
+                                 key)
+
+    def render_many(self, jobs, workers=None, chunksize=None, setup=None,
+                    **context):
+        """
+        Render each ``(template name, context)`` pair of ``jobs`` over a
+        pool of ``workers`` processes and return the list of outputs, in
+        order.
+        Only the templates named in ``jobs`` are sent to the workers, once
+        each, along with the registered tags and the shared ``context``
+        keyword variables. See :func:`tie.parallel.render_many` for the
+        other parameters.
+        """
+        jobs = list(jobs)
+        templates = {}
+        for name, _ in jobs:
+            if name not in templates:
+                templates[name] = getattr(self, name)
+        return parallel.render_many(templates, jobs, workers=workers,
+                                    chunksize=chunksize, setup=setup,
+                                    base_context=context)
 
     @staticmethod
     def _check_template(template, cls=Template):
@@ -127,6 +512,17 @@ class DirectoryWatcher(TemplateManager):
     """ 
     Template Manager that dynamically loads templates from one or several
     watched directories.
+    Templates are loaded as lazy :class:`FileTemplate` objects, unless the
+    ``lazy`` attribute is set to False. Set the ``compiled_cache`` attribute
+    to a :class:`CompiledCache<tie.cache.CompiledCache>` to have their
+    compiled forms stored on disk.
+
+    Loaded templates are kept until :func:`clear` is called, unless changes
+    detection is enabled: set the ``check_interval`` attribute (in seconds)
+    to have templates checked for changes on access, at most once per
+    interval, and/or call :func:`start_reloading` to have changed templates
+    reloaded by a background thread. Callables appended to the
+    ``reload_callbacks`` list are called with each reloaded template.
     """
     def __init__(self, *dirs):
         """
@@ -136,11 +532,24 @@ class DirectoryWatcher(TemplateManager):
         """
         super(DirectoryWatcher, self).__init__()
 
+        self._index      = None
+        self._index_key  = None
+        self._indexed_at = 0
+
         self.dirs = []
         for d in dirs:
             self.add_directory(d)
 
-        self.recursive = True
+        self.recursive      = True
+        self.extensions     = None
+        self.lazy           = True
+        self.check_interval = None
+        self.compiled_cache = None
+
+        self.reload_callbacks = []
+
+        self._checked  = {}
+        self._reloader = None
 
     def add_directory(self, dir_, index=None):
         """ 
@@ -164,45 +573,172 @@ class DirectoryWatcher(TemplateManager):
         to True (which it is by default).
         Pathes will be absolute, unless the `basenames` argument is set to
         True, in which case only the files' base names will be returned.
+        If the `extensions` attribute is set (to a file extension or a
+        sequence of extensions, such as ``('.txt', '.html')``), only files
+        with those extensions will be listed.
         """
         for d in self.dirs:
-            for t_path in  list_files(d, recursive=self.recursive):
+            for t_path in list_files(d, recursive=self.recursive,
+                                     suffixes=self.extensions):
                 if basenames:
                     yield path_to_tmpl_name(t_path)
                 else:
                     yield t_path
 
+    def get_index(self):
+        """
+        Return a dictionnary mapping the names of all watched templates to
+        their path.
+        The index is built on first use and kept until the watched directories
+        (or the `recursive` and `extensions` attributes) change, or until
+        :func:`reindex` is called.
+        When several files share the same name, the one from the first
+        watched directory wins.
+        """
+        key = (tuple(self.dirs), self.recursive, self.extensions)
+        if self._index is None or self._index_key != key:
+            indexed_at = time.time()
+            index = {}
+            for t_path in self.list_watched_templates():
+                index.setdefault(path_to_tmpl_name(t_path), t_path)
+            LOGGER.debug("Indexed %i templates", len(index))
+            self._index, self._index_key = index, key
+            self._indexed_at = indexed_at
+        return self._index
+
+    def reindex(self):
+        """
+        Discard the template index, so that files added or removed on disk
+        since it was built are taken into account.
+        """
+        self._index = None
+
+    def names(self):
+        """Return the sorted list of all watched templates' names."""
+        return sorted(self.get_index())
+
     def _load_template(self, tmpl_name):
         """
         Load the `tmpl_name` template from disk, add it to the internal managed
         list and return it.
         Will raise a TemplateError if no template matched.
         """
-        for t_f in self.list_watched_templates():
-            t_n = path_to_tmpl_name(t_f)
-            if t_n == tmpl_name:
-                template = Template.from_file(t_f, t_n)
-                self.add(template)
-                return template
-        raise TemplateError('No template named %s' % tmpl_name)
+        t_f = self.get_index().get(tmpl_name)
+        if t_f is None and self.check_interval is not None and \
+           time.time() - self._indexed_at >= self.check_interval:
+            # Might be a new file
+            self.reindex()
+            t_f = self.get_index().get(tmpl_name)
+        if t_f is None:
+            raise TemplateError('No template named %s' % tmpl_name)
+        template = FileTemplate(t_f, tmpl_name)
+        if self.compiled_cache is not None:
+            template.compiled_cache = self.compiled_cache
+        if not self.lazy:
+            template.template
+        self._checked[tmpl_name] = time.time()
+        self.add(template)
+        return template
+
+    def reload_changed(self, pathes=None):
+        """
+        Reload all loaded templates whose file changed on disk (only those
+        among `pathes`, if provided), and return them.
+        """
+        reloaded = []
+        for template in list(self._template_list):
+            if not isinstance(template, FileTemplate):
+                continue
+            if pathes is not None and template.path not in pathes:
+                continue
+            if template.is_stale():
+                self._reload(template)
+                reloaded.append(template)
+        return reloaded
+
+    def _reload(self, template):
+        """Reload ``template`` and notify the reload callbacks"""
+        template.reload()
+        for callback in self.reload_callbacks:
+            callback(template)
+
+    def start_reloading(self, backend='auto', interval=1.0):
+        """
+        Start a background thread reloading changed templates.
+        `backend` can be either 'stat' (check loaded templates every
+        `interval` seconds), 'inotify' (Linux only, react to file system
+        events) or 'auto' (inotify if available, stat otherwise).
+        """
+        self.stop_reloading()
+        self._reloader = reloader.get_reloader(self, backend, interval)
+        self._reloader.start()
+        LOGGER.info("Started %s", self._reloader)
+
+    def stop_reloading(self):
+        """Stop the background reloading thread, if any."""
+        if self._reloader is not None:
+            self._reloader.stop()
+            self._reloader = None
+
+    def _check(self, template):
+        """
+        Reload `template` if it changed on disk, unless it was already
+        checked less than `check_interval` seconds ago.
+        """
+        now = time.time()
+        if now - self._checked.get(template.name, 0) < self.check_interval:
+            return
+        self._checked[template.name] = now
+        if isinstance(template, FileTemplate) and template.is_stale():
+            self._reload(template)
 
     def __getattr__(self, tmpl_name):
         """
         Try and return a contained template whose name matches the key arg.
-        Raises an AttributeError if none is found.
+        Raises a TemplateError if none is found.
         The template will be loaded from disk if not already present in the
-        internal list of managed templates.
+        internal list of managed templates (or if it changed on disk, when
+        `check_interval` is set).
+        """
+        if '_template_index' not in self.__dict__: # Not initialized yet
+            raise AttributeError(tmpl_name)
+        return self._get_template(tmpl_name)
+
+    def __getitem__(self, tmpl_name):
+        """
+        Same as attribute access, but raises a KeyError if no template is
+        found.
         """
         try:
-            return super(DirectoryWatcher, self).__getattr__(tmpl_name)
-        except AttributeError:
+            return self._get_template(tmpl_name)
+        except TemplateError:
+            raise KeyError(tmpl_name)
+
+    def _get_template(self, tmpl_name):
+        """
+        Return the `tmpl_name` template, loading or checking it as needed.
+        """
+        template = self._template_index.get(tmpl_name)
+        if template is None:
             return self._load_template(tmpl_name)
+        if self.check_interval is not None:
+            self._check(template)
+        return template
+
+    def __contains__(self, tmpl_name):
+        """
+        Return True if `tmpl_name` is loaded or available in the watched
+        directories.
+        """
+        return super(DirectoryWatcher, self).__contains__(tmpl_name) or \
+               tmpl_name in self.get_index()
 
     def __iter__(self):
         """
         Yield contained templates.
-        This will cause all available templates to be loaded from disk and
-        instanciated.
+        This will cause all available templates to be instanciated (their
+        files will only be read on first use, unless the `lazy` attribute
+        is False).
         """
-        for t_name in self.list_watched_templates(basenames=True):
+        for t_name in self.names():
             yield getattr(self, t_name)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+asyncio rendering test cases, imported by test_aio on interpreters
+supporting the async syntax.
+"""
+import asyncio
+import unittest
+
+from tie import tag
+from tie import template
+
+def run(coro):
+    """ Run ``coro`` to completion in a new event loop """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+class TestRenderAsync(unittest.TestCase):
+
+    def setUp(self):
+        tag.register(r"{{ (\w+) }}")
+    def tearDown(self):
+        tag.get_manager().clear()
+
+    def render(self, t, **context):
+        """ Helper """
+        return run(t.render_async(**context))
+
+    def test_sync_processors(self):
+        """ Rendering asynchronously with regular processors """
+        t = template.Template("{{ foo }} and {{ bar }}")
+        self.assertEqual(t.render(foo=1, bar=2), self.render(t, foo=1, bar=2))
+
+    def test_async_processors(self):
+        """ Asynchronous processors are awaited concurrently """
+        running = []
+        peak = []
+        async def lookup(match, **context):
+            running.append(1)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+            return match.group(1).upper()
+        tag.register(tag.Tag(r"%(\w+)%", processor=lookup))
+        t = template.Template("%a% %b% %c% {{ d }} %a%")
+        self.assertEqual("A B C x A", self.render(t, d="x"))
+        self.assertEqual(3, max(peak))
+
+    def test_concurrency_limit(self):
+        """ At most Template.concurrency tags are awaited at once """
+        running = []
+        peak = []
+        async def lookup(match, **context):
+            running.append(1)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+            return match.group(1)
+        tag.register(tag.Tag(r"%(\w+)%", processor=lookup))
+        t = template.Template("%a% %b% %c% %d%")
+        t.concurrency = 2
+        self.assertEqual("a b c d", self.render(t))
+        self.assertEqual(2, max(peak))
+
+    def test_limit_variable(self):
+        """ Context variables named limit are rendered, not used as limits """
+        t = template.Template("n={{ limit }}")
+        self.assertEqual("n=3", self.render(t, limit=3))
+
+    def test_async_cached(self):
+        """ Results of cached asynchronous tags are cached, not coroutines """
+        calls = []
+        async def lookup(match, **context):
+            calls.append(match)
+            return context["foo"]
+        tag.register(tag.Tag(r"%(\w+)%", processor=lookup, cached=True,
+                             depends=("foo",)))
+        t = template.Template("%a%")
+        self.assertEqual("x", self.render(t, foo="x"))
+        self.assertEqual("x", self.render(t, foo="x"))
+        self.assertEqual("y", self.render(t, foo="y"))
+        self.assertEqual(2, len(calls))
+
+    def test_custom_renderer(self):
+        """ Custom renderers are called synchronously """
+        t = template.Template("", renderer=lambda t, **c: "custom")
+        self.assertEqual("custom", self.render(t))
+
+    @unittest.skipIf(tag.contextvars is None,
+                     "Managers are scoped by thread without contextvars")
+    def test_scoped_managers(self):
+        """ Concurrent tasks can use their own TagManager """
+        async def task(pattern):
+            manager = tag.TagManager()
+            manager.add(pattern)
+            with tag.use_manager(manager):
+                await asyncio.sleep(0.01)
+                t = template.Template("{{ a }} %a%")
+                await asyncio.sleep(0.01)
+                return await t.render_async(a=1)
+        async def main():
+            return await asyncio.gather(task(r"{{ (\w+) }}"), task(r"%(\w+)%"))
+        self.assertListEqual(["1 %a%", "{{ a }} 1"], run(main()))
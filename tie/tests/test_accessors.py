@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+Compiled lookups tests
+"""
+from __future__ import unicode_literals
+
+import unittest
+
+from tie import accessors
+from tie.exceptions import InvalidLookupError
+
+class TestParse(unittest.TestCase):
+
+    def setUp(self): pass
+    def tearDown(self): pass
+
+    def test_parse_name(self):
+        """ Parsing a plain name """
+        self.assertEqual(("foo", ()), accessors.parse("foo"))
+
+    def test_parse_path(self):
+        """ Parsing attribute and item lookups """
+        self.assertEqual(
+            ("user", ((accessors.ATTR, "address"),
+                      (accessors.ITEM, 0),
+                      (accessors.ITEM, "city"),
+                      (accessors.ITEM, -1))),
+            accessors.parse("user.address[0]['city'][ -1 ]"))
+
+    def test_parse_quotes(self):
+        """ Item keys can be single or double quoted """
+        self.assertEqual(("d", ((accessors.ITEM, "a'b"),)),
+                         accessors.parse('d["a\'b"]'))
+        self.assertEqual(("d", ((accessors.ITEM, "a'b"),)),
+                         accessors.parse("d['a\\'b']"))
+
+    def test_parse_invalid(self):
+        """ Anything but plain lookups is rejected """
+        for expr in ["1foo", "foo()", "foo[bar]", "foo.__class__()",
+                     "foo[1+1]", "foo.", "foo[0"]:
+            self.assertRaises(InvalidLookupError, accessors.parse, expr)
+
+class TestAccessor(unittest.TestCase):
+
+    obj = type(str("Dummy"), (), {"items": [{"name": "foo"}]})
+
+    def test_resolve(self):
+        """ Resolving a lookup against a context """
+        a = accessors.Accessor("o.items[0]['name']")
+        self.assertEqual("foo", a.resolve({"o": self.obj}))
+
+    def test_resolve_errors(self):
+        """ Lookup errors are propagated """
+        self.assertRaises(NameError,
+                          accessors.Accessor("o.items").resolve, {})
+        self.assertRaises(AttributeError,
+                          accessors.Accessor("o.dummy").resolve,
+                          {"o": self.obj})
+        self.assertRaises(IndexError,
+                          accessors.Accessor("o.items[1]").resolve,
+                          {"o": self.obj})
+
+    def test_cached_accessors(self):
+        """ Accessors are only compiled once per expression """
+        self.assertIs(accessors.get_accessor("o.items[0]"),
+                      accessors.get_accessor("o.items[0]"))
+
+    def test_memo(self):
+        """ Shared prefixes are only resolved once with a memo """
+        calls = []
+        class Dummy(object):
+            @property
+            def address(self):
+                calls.append(1)
+                return {"city": "Paris", "zip": "75000"}
+        context = {"user": Dummy()}
+        memo = {}
+        city = accessors.Accessor("user.address['city']")
+        zip_ = accessors.Accessor("user.address['zip']")
+        self.assertEqual("Paris", city.resolve(context, memo))
+        self.assertEqual("75000", zip_.resolve(context, memo))
+        self.assertEqual(1, len(calls))
+
+    def test_memo_roots(self):
+        """ Memoised prefixes are only reused for the same root value """
+        memo = {}
+        city = accessors.Accessor("it['addr']['city']")
+        self.assertEqual("Paris", city.resolve(
+            {"it": {"addr": {"city": "Paris"}}}, memo))
+        self.assertEqual("Rome", city.resolve(
+            {"it": {"addr": {"city": "Rome"}}}, memo))
+
+    def test_memo_scope(self):
+        """ Memo scopes are activated and restored """
+        self.assertIsNone(accessors.current_memo())
+        with accessors.MemoScope() as memo:
+            self.assertIs(memo, accessors.current_memo())
+            with accessors.MemoScope() as inner:
+                self.assertIs(inner, accessors.current_memo())
+            self.assertIs(memo, accessors.current_memo())
+        self.assertIsNone(accessors.current_memo())
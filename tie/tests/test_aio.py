@@ -0,0 +1,10 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+asyncio rendering tests
+"""
+import sys
+
+# Test cases use the async syntax, which older interpreters can't even parse
+if sys.version_info[:2] >= (3, 5):
+    from tie.tests.aio_cases import TestRenderAsync
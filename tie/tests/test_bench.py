@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+Benchmark suite tests
+"""
+from __future__ import unicode_literals
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from tie import bench, tag
+from tie.bench import core, report, __main__ as cli
+
+class TestMeasurement(unittest.TestCase):
+
+    def setUp(self): pass
+    def tearDown(self): pass
+
+    def test_percentile(self):
+        """ Percentiles interpolate between closest ranks """
+        values = [1.0, 2.0, 3.0, 4.0, 5.0]
+        self.assertEqual(3.0, core.percentile(values, 50))
+        self.assertEqual(5.0, core.percentile(values, 100))
+        self.assertAlmostEqual(4.96, core.percentile(values, 99))
+
+    def test_measure(self):
+        """ Measures report throughput and latency statistics """
+        calls = []
+        stats = core.measure(lambda: calls.append(1), min_time=0.001,
+                             min_samples=3)
+        self.assertGreaterEqual(stats['samples'], 3)
+        self.assertGreaterEqual(stats['latency_calls'], 3)
+        self.assertEqual(stats['calls'] + stats['latency_calls'] + 1,
+                         len(calls))
+        self.assertLessEqual(stats['p50'], stats['p99'])
+        self.assertAlmostEqual(1.0, stats['ops_per_sec'] * stats['mean'])
+
+    def test_fit_exponent(self):
+        """ Fitted exponents describe the growth of times over params """
+        self.assertAlmostEqual(1.0, core.fit_exponent(
+            [(10, 0.1), (100, 1.0), (1000, 10.0)]))
+        self.assertAlmostEqual(2.0, core.fit_exponent(
+            [(10, 1.0), (100, 100.0)]))
+        self.assertIsNone(core.fit_exponent([(10, 1.0)]))
+
+class TestScenarios(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+    def tearDown(self):
+        tag.get_manager().clear()
+        shutil.rmtree(self.dir)
+
+    def test_scenario_run(self):
+        """ Scenarios measure each case over their params """
+        s = core.Scenario('test', "Test", params=[1, 2, 3], quick_params=[1])
+        @s.case('tie')
+        def tie_case(n):
+            tag.register("%dummy%")
+            self.assertEqual(1, len(tag.get_manager()))
+            return lambda: None
+        s.case('baseline', baseline=True)(lambda n: lambda: None)
+        results = list(s.run(quick=True, min_time=0.001))
+        self.assertListEqual([('test', 'tie', 1, False),
+                              ('test', 'baseline', 1, True)],
+                             [(r['scenario'], r['case'], r['param'],
+                               r['baseline']) for r in results])
+        self.assertEqual(3, len(list(s.run(cases=['tie'], min_time=0.001))))
+        # The global manager is left untouched
+        self.assertEqual(0, len(tag.get_manager()))
+
+    def test_builtin_scenarios(self):
+        """ Built-in scenarios all run """
+        rep = bench.run(quick=True, min_time=0.001, min_samples=1)
+        names = set(r['scenario'] for r in rep['results'])
+        self.assertSetEqual(set(s.name for s in bench.SCENARIOS), names)
+        self.assertTrue(rep['curves'])
+        self.assertRaises(KeyError, bench.get_scenarios, ['nope'])
+
+    def test_compare(self):
+        """ Throughput drops beyond the tolerance are flagged """
+        def rep(*ops):
+            return {'results': [{'scenario': 's', 'case': 'c', 'param': i,
+                                 'ops_per_sec': o} for i, o in enumerate(ops)]}
+        rows = report.compare(rep(100, 100, 100), rep(95, 80, 150),
+                              tolerance=0.1)
+        self.assertListEqual([False, True, False], [r[-1] for r in rows])
+
+    def test_cli(self):
+        """ The command line saves results and gates on regressions """
+        path = os.path.join(self.dir, 'baseline.json')
+        out = io.StringIO()
+        self.assertEqual(0, cli.main(['batch', '--quick', '--min-time',
+                                      '0.001', '--save', path], out))
+        saved = report.load(path)
+        for r in saved['results']:
+            r['ops_per_sec'] *= 100
+        report.save(saved, path)
+        self.assertEqual(1, cli.main(['batch', '--quick', '--min-time',
+                                      '0.001', '--compare', path], out))
+        self.assertIn('REGRESSION', out.getvalue())
+
+if __name__ == "__main__":
+    unittest.main()
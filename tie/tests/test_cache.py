@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+Persistent caches tests
+"""
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from tie import cache, compiler, tag, template
+
+class CountingCache(cache.CompiledCache):
+    """ Records the outcome of each lookup """
+    def __init__(self, directory):
+        super(CountingCache, self).__init__(directory)
+        self.lookups = []
+
+    def load(self, source, tags):
+        hits = super(CountingCache, self).load(source, tags)
+        self.lookups.append(hits is not None)
+        return hits
+
+class CustomMatchTag(tag.Tag):
+    def match(self, tmpl):
+        return super(CustomMatchTag, self).match(tmpl)
+
+class TestCompiledCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = CountingCache(os.path.join(self.dir, 'cache'))
+    def tearDown(self):
+        tag.get_manager().clear()
+        shutil.rmtree(self.dir)
+
+    def test_store_and_load(self):
+        """ Compiled layouts are loaded back from the cache directory """
+        tag.register(r"{{(\w+)}}", r"<<(\w+)>>")
+        src = "Hello {{name}}, <<other>> and {{name}}"
+        first = compiler.compile_template(src, cache=self.cache)
+        second = compiler.compile_template(src, cache=self.cache)
+        self.assertListEqual([False, True], self.cache.lookups)
+        self.assertListEqual(first.segments, second.segments)
+        self.assertListEqual([s.positions for s in first.slots],
+                             [s.positions for s in second.slots])
+        self.assertEqual("Hello joe, bob and joe",
+                         second.render(name="joe", other="bob"))
+
+    def test_new_process(self):
+        """ A new cache instance reuses entries stored by another one """
+        tag.register(r"{{(\w+)}}")
+        compiler.compile_template("a {{name}}", cache=self.cache)
+        other = CountingCache(self.cache.directory)
+        compiler.compile_template("a {{name}}", cache=other)
+        self.assertListEqual([True], other.lookups)
+
+    def test_changed_tags(self):
+        """ Changing the registered tags misses the cache """
+        tag.register(r"{{(\w+)}}")
+        compiler.compile_template("a {{name}}", cache=self.cache)
+        tag.register("a")
+        c = compiler.compile_template("a {{name}}", cache=self.cache)
+        self.assertListEqual([False, False], self.cache.lookups)
+        self.assertEqual(2, len(c.slots))
+
+    def test_changed_source(self):
+        """ Changing the template source misses the cache """
+        tag.register(r"{{(\w+)}}")
+        compiler.compile_template("a {{name}}", cache=self.cache)
+        compiler.compile_template("b {{name}}", cache=self.cache)
+        self.assertListEqual([False, False], self.cache.lookups)
+
+    def test_corrupted_entry(self):
+        """ Unreadable or stale entries are ignored """
+        tag.register(r"{{(\w+)}}")
+        src = "a {{name}}"
+        path = self.cache.get_path(src, tuple(tag.get_manager()))
+        with open(path, 'w') as f:
+            f.write('{"version": 1, "hits": [[0, 0, 8]]}')
+        c = compiler.compile_template(src, cache=self.cache)
+        self.assertEqual("a joe", c.render(name="joe"))
+        with open(path, 'w') as f:
+            f.write('garbage')
+        c = compiler.compile_template(src, cache=self.cache)
+        self.assertEqual("a joe", c.render(name="joe"))
+        self.assertListEqual([False, False], self.cache.lookups)
+
+    def test_custom_match_not_cached(self):
+        """ Tags with a custom match method disable caching """
+        tag.get_manager().add(CustomMatchTag(r"{{(\w+)}}"))
+        compiler.compile_template("a {{name}}", cache=self.cache)
+        compiler.compile_template("a {{name}}", cache=self.cache)
+        self.assertListEqual([False, False], self.cache.lookups)
+        self.assertListEqual([], os.listdir(self.cache.directory))
+
+    def test_clear(self):
+        """ Clearing the cache removes all entries """
+        tag.register(r"{{(\w+)}}")
+        compiler.compile_template("a {{name}}", cache=self.cache)
+        self.cache.clear()
+        self.assertListEqual([], os.listdir(self.cache.directory))
+
+    def test_template_from_file(self):
+        """ Templates created from files use the provided cache """
+        tag.register(r"{{(\w+)}}")
+        path = os.path.join(self.dir, 'tmpl.txt')
+        with open(path, 'w') as f:
+            f.write("Hi {{name}}")
+        for lazy in (False, True):
+            t = template.Template.from_file(path, lazy=lazy,
+                                            compiled_cache=self.cache)
+            self.assertEqual("Hi joe", t.render(name="joe"))
+        self.assertListEqual([False, True], self.cache.lookups)
+
+    def test_directory_watcher(self):
+        """ DirectoryWatcher templates use the watcher's cache """
+        tag.register(r"{{(\w+)}}")
+        with open(os.path.join(self.dir, 'tmpl.txt'), 'w') as f:
+            f.write("Hi {{name}}")
+        watcher = template.DirectoryWatcher(self.dir)
+        watcher.compiled_cache = self.cache
+        self.assertEqual("Hi joe", watcher.tmpl.render(name="joe"))
+        self.assertListEqual([False], self.cache.lookups)
+
+class TestStableRepr(unittest.TestCase):
+
+    def setUp(self): pass
+    def tearDown(self): pass
+
+    def test_simple_values(self):
+        """ Simple values have distinct, stable representations """
+        values = [None, True, 1, 1.0, "1", b"1", (1, "a"), frozenset([1, 2])]
+        reprs = [cache.stable_repr(v) for v in values]
+        self.assertNotIn(None, reprs)
+        self.assertEqual(len(values), len(set(reprs)))
+        self.assertEqual(cache.stable_repr(frozenset(["b", "a"])),
+                         cache.stable_repr(frozenset(["a", "b"])))
+
+    def test_unsupported_values(self):
+        """ Other values have no stable representation """
+        self.assertIsNone(cache.stable_repr(object()))
+        self.assertIsNone(cache.stable_repr((1, object())))
+
+if __name__ == "__main__":
+    unittest.main()
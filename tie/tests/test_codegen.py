@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+Code generation tests
+"""
+from __future__ import unicode_literals
+
+import unittest
+import warnings
+
+from tie import codegen, renderers, tag
+from tie.template import Template
+from tie.exceptions import ContextWarning, InvalidLookupError
+
+class Obj(object):
+    pass
+
+class TestCodegen(unittest.TestCase):
+
+    def setUp(self): pass
+    def tearDown(self):
+        tag.get_manager().clear()
+
+    def render(self, tmpl, **context):
+        """ Render with both the default and codegen renderers """
+        default = Template(tmpl).render(**context)
+        generated = Template(tmpl, renderer=renderers.codegen_renderer)
+        self.assertEqual(default, generated.render(**context))
+        return default
+
+    def test_plain_substitutions(self):
+        """ Plain substitutions are inlined as context lookups """
+        tag.register(r"{{(\w+)}}")
+        t = Template("Hi {{name}}, {{age}} {{name}}")
+        code, _ = codegen.generate(t.compile())
+        self.assertNotIn("process_match", code)
+        self.assertEqual("Hi joe, 42 joe",
+                         self.render(t.template, name="joe", age=42))
+
+    def test_lookups(self):
+        """ Attribute and item lookups match the sub processor's output """
+        tag.register(r"{{([^}]+)}}")
+        o = Obj()
+        o.items = ["a", "b"]
+        o.empty = ""
+        self.assertEqual("b b", self.render("{{o.items[1]}} {{o.items[-1]}}",
+                                            o=o))
+        self.assertEqual("x", self.render("{{o.items}}", **{'o.items': "x"}))
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            self.assertEqual("", self.render("{{o.empty}}", o=o))
+        self.assertEqual(2, len(w))
+
+    def test_missing_variable(self):
+        """ Missing variables render empty and warn """
+        tag.register(r"{{(\w+)}}")
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            self.assertEqual("a  b", self.render("a {{name}} b"))
+        self.assertTrue(all(issubclass(x.category, ContextWarning)
+                            for x in w))
+        self.assertEqual(2, len(w))
+
+    def test_invalid_lookup(self):
+        """ Invalid lookups still raise on render """
+        tag.register(r"{{([^}]+)}}")
+        t = Template("{{a.1}}", renderer=renderers.codegen_renderer)
+        self.assertRaises(InvalidLookupError, t.render, a=1)
+
+    def test_custom_processors(self):
+        """ Other tags still call their processor """
+        tag.register(r"{{(\w+)}}")
+        tag.register(tag.Tag(r"<(\w+)>",
+                             processor=lambda m, **c: m.group(1).upper()))
+        cached = tag.Tag(r"\[(\w+)\]", cached=True)
+        tag.get_manager().add(cached)
+        self.assertEqual("FOO 1 2", self.render("<foo> {{a}} [b]", a=1, b=2))
+        self.assertEqual(1, cached.cache.hits)
+
+    def test_literals(self):
+        """ Literal segments are reproduced exactly """
+        tag.register(r"{{(\w+)}}")
+        tmpl = "'\"\\ \n\té {{a}} ''' \"\"\""
+        self.assertEqual(tmpl.replace("{{a}}", "x"), self.render(tmpl, a="x"))
+
+    def test_function_rebuilt_on_recompile(self):
+        """ Generated functions follow changes of the registered tags """
+        tag.register(r"{{(\w+)}}")
+        t = Template("{{a}} <a>", renderer=renderers.codegen_renderer)
+        self.assertEqual("1 <a>", t.render(a=1))
+        tag.register(r"<(\w+)>")
+        self.assertEqual("1 1", t.render(a=1))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+Template compilation tests
+"""
+from __future__ import unicode_literals
+
+import os
+import re
+import sys
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from tie import compiler
+from tie import tag
+from tie.template import Template, TemplateManager, DirectoryWatcher
+from tie.exceptions import TemplateError
+
+# Scoped inline flags, needed to fuse patterns with flags, appeared in 3.6
+SCOPED_FLAGS = sys.version_info[:2] >= (3, 6)
+
+class TestCompileTemplate(unittest.TestCase):
+
+    def setUp(self): pass
+    def tearDown(self):
+        tag.get_manager().clear()
+
+    def test_no_tags(self):
+        """ A template without any tag compiles to a single literal segment """
+        tag.register("%dummy%")
+        c = compiler.compile_template("dummydumdum")
+        self.assertListEqual(["dummydumdum"], c.segments)
+        self.assertListEqual([], c.slots)
+
+    def test_segments(self):
+        """ Literal segments and tag placeholders are kept in order """
+        tag.register("%dummy%")
+        c = compiler.compile_template("foo %dummy% bar %dummy%")
+        self.assertListEqual(["foo ", "%dummy%", " bar ", "%dummy%"],
+                             c.segments)
+
+    def test_repeated_tags_share_a_slot(self):
+        """ Repeated occurences of a tag are evaluated through a single slot """
+        tag.register("%dummy%", "%dumdum%")
+        c = compiler.compile_template("%dummy% %dumdum% %dummy%")
+        self.assertEqual(2, len(c.slots))
+        self.assertListEqual([0, 4], c.slots[0].positions)
+        self.assertListEqual([2], c.slots[1].positions)
+
+    def test_overlapping_matches(self):
+        """ Overlapping matches are resolved in favor of the leftmost one, then of the first registered tag """
+        tag.register("%dum", "%dummy%", "my% ")
+        c = compiler.compile_template("%dummy% ")
+        self.assertListEqual(["%dum", "my% "], c.segments)
+
+    def test_render(self):
+        """ Rendering a compiled template """
+        tag.register("%dummy%")
+        c = compiler.compile_template("foo %dummy% bar %dummy%")
+        self.assertEqual("foo a bar a", c.render(**{"%dummy%": "a"}))
+        self.assertEqual("foo b bar b", c.render(**{"%dummy%": "b"}))
+
+    def test_validity(self):
+        """ Compiled templates are invalidated when the registered tags change """
+        m = tag.get_manager()
+        tag.register("%dummy%")
+        c = compiler.compile_template("foo %dummy%")
+        self.assertTrue(c.is_valid(m))
+        self.assertFalse(c.is_valid(tag.TagManager()))
+        tag.register("foo")
+        self.assertFalse(c.is_valid(m))
+
+    def test_validity_unversioned_manager(self):
+        """ Tags of managers without a version are compared one by one """
+        class DummyManager(object):
+            tags = [tag.Tag("%dummy%")]
+            def __iter__(self): return iter(self.tags)
+        m = DummyManager()
+        c = compiler.compile_template("foo %dummy%", m)
+        self.assertTrue(c.is_valid(m))
+        m.tags = m.tags + [tag.Tag("foo")]
+        self.assertFalse(c.is_valid(m))
+
+    def test_validity_custom_manager(self):
+        """ Versions of managers redefining tag storage aren't trusted """
+        class DummyManager(tag.TagManager):
+            def __init__(self):
+                super(DummyManager, self).__init__()
+                self.tags = []
+            def add(self, tag_obj): self.tags.append(self._check_tag(tag_obj))
+            def __iter__(self): return iter(self.tags)
+        m = DummyManager()
+        m.add("%dummy%")
+        c = compiler.compile_template("foo %dummy%", m)
+        self.assertIsNone(c.version)
+        self.assertTrue(c.is_valid(m))
+        m.add("foo")
+        self.assertFalse(c.is_valid(m))
+        self.assertIsNotNone(compiler.manager_version(tag.PriorityTagManager()))
+
+class TestScanner(unittest.TestCase):
+
+    def hits(self, scanner, source):
+        """ Helper """
+        return [(t, m.group(0)) for t, m in scanner.scan(source)]
+
+    def test_fused_scan(self):
+        """ Fusable tags are scanned in a single pass """
+        tags = (tag.Tag("%dummy%"), tag.Tag(r"{{ (\w+) }}"))
+        s = compiler.Scanner(tags)
+        self.assertListEqual([], s.separate)
+        self.assertListEqual([(tags[1], "{{ foo }}"), (tags[0], "%dummy%")],
+                             self.hits(s, "{{ foo }} and %dummy%"))
+
+    def test_tag_match_objects(self):
+        """ Hits are dispatched with the owning tag's own match objects """
+        tags = (tag.Tag("%dummy%"), tag.Tag(r"{{ (\w+) }}"))
+        s = compiler.Scanner(tags)
+        (t, m), = s.scan("bla {{ foo }}")
+        self.assertIs(tags[1].regexp, m.re)
+        self.assertEqual(("foo",), m.groups())
+
+    def test_flags(self):
+        """ Tags' flags are kept when fusing their patterns """
+        tags = (tag.Tag("%dummy%", flags=re.I),
+                tag.Tag("{{ \\w+ # comment\n }}", flags=re.X))
+        s = compiler.Scanner(tags)
+        if SCOPED_FLAGS:
+            self.assertListEqual([], s.separate)
+        self.assertListEqual(["%DUMMY%", "{{foo}}"],
+                             [m.group(0) for _, m in s.scan("%DUMMY% {{foo}}")])
+
+    def test_priority_on_overlaps(self):
+        """ The first tag wins when several tags match at the same position """
+        tags = (tag.Tag("%dum"), tag.Tag("%dummy%"))
+        s = compiler.Scanner(tags)
+        self.assertListEqual([(tags[0], "%dum")], self.hits(s, "%dummy%"))
+        s = compiler.Scanner(tuple(reversed(tags)))
+        self.assertListEqual([(tags[1], "%dummy%")], self.hits(s, "%dummy%"))
+
+    def test_unfusable_tags(self):
+        """ Tags which can't be fused are scanned separately """
+        class CustomTag(tag.Tag):
+            def match(self, template):
+                return super(CustomTag, self).match(template)
+        tags = (tag.Tag("%dummy%"),
+                tag.Tag(r"(['\"])\w+\1"),
+                CustomTag("--dumdum--"))
+        s = compiler.Scanner(tags)
+        self.assertListEqual([1, 2], s.separate)
+        self.assertListEqual(
+            [(tags[2], "--dumdum--"), (tags[1], "'foo'"),
+             (tags[0], "%dummy%")],
+            self.hits(s, "--dumdum-- 'foo' %dummy%"))
+
+    def test_duplicate_group_names(self):
+        """ Tags reusing group names of previous tags are scanned separately """
+        tags = (tag.Tag(r"%(?P<name>\w+)%"), tag.Tag(r"{(?P<name>\w+)}"),
+                tag.Tag(r"\$(?P<other>\w+)"))
+        s = compiler.Scanner(tags)
+        self.assertListEqual([1], s.separate)
+        self.assertListEqual([0, 2], s.fused)
+        self.assertListEqual(
+            [(tags[1], "{foo}"), (tags[0], "%bar%"), (tags[2], "$baz")],
+            self.hits(s, "{foo} %bar% $baz"))
+
+    def test_delimited_scan(self):
+        """ Tags starting with a literal string are found by string searches """
+        tags = (tag.DelimitedTag("{{", "}}"), tag.Tag(r"<%(\w+)%>"),
+                tag.Tag(r"\$(\w+)"), tag.Tag(r"<%(\w+)%>", flags=re.I))
+        s = compiler.Scanner(tags)
+        self.assertListEqual([(0, "{{"), (1, "<%")], s.delimited)
+        if SCOPED_FLAGS:
+            self.assertListEqual([], s.separate)
+        (t, m), = s.scan("bla {{ foo }}")
+        self.assertIs(tags[0].regexp, m.re)
+        self.assertEqual(("foo",), m.groups())
+        self.assertListEqual(
+            [(tags[1], "<%a%>"), (tags[2], "$b"), (tags[0], "{{ c }}")],
+            self.hits(s, "<%a%> $b {{ c }}"))
+
+    def test_delimited_overlaps(self):
+        """ Overlaps between delimited and other tags resolve as when fused """
+        tags = (tag.Tag("%dum"), tag.Tag(r"\W(y)\W"), tag.Tag(r"my% (\w)"))
+        s = compiler.Scanner(tags)
+        self.assertListEqual([0, 2], [i for i, _ in s.delimited])
+        self.assertListEqual(
+            [(tags[0], "%dum"), (tags[2], "my% a"), (tags[1], "%y%")],
+            self.hits(s, "%dummy% a %y%"))
+
+    def test_delimited_and_empty_matches(self):
+        """ Empty matches of fused tags are ignored alongside delimited tags """
+        tags = (tag.Tag(r"x*"), tag.Tag(r"{{(\w+)}}"))
+        s = compiler.Scanner(tags)
+        self.assertListEqual([(1, "{{")], s.delimited)
+        self.assertListEqual([(tags[1], "{{name}}"), (tags[0], "xx")],
+                             self.hits(s, "a {{name}} xx b"))
+
+    def test_empty_matches_and_later_tags(self):
+        """ Empty matches don't hide later tags' hits at the same position """
+        tags = (tag.Tag(r"x*"), tag.Tag(r"<(\w+)>"), tag.DelimitedTag("{{", "}}"))
+        s = compiler.Scanner(tags)
+        self.assertListEqual([0], s.separate)
+        self.assertListEqual([(tags[1], "<b>"), (tags[2], "{{d}}")],
+                             self.hits(s, "a <b> c {{d}}"))
+        # Patterns only matching the empty string somewhere are still fused
+        tags = (tag.Tag(r"x*(?=<)"), tag.Tag(r"<(\w+)>"))
+        s = compiler.Scanner(tags)
+        self.assertListEqual([], s.separate)
+        self.assertListEqual([(tags[1], "<b>"), (tags[0], "x")],
+                             self.hits(s, "a <b> x<c"))
+        s = compiler.Scanner(tags + (tag.DelimitedTag("{{", "}}"),))
+        self.assertListEqual([(tags[1], "<b>"), (tags[0], "x")],
+                             self.hits(s, "a <b> x<c"))
+
+    def test_literal_prefix(self):
+        """ Literal prefixes of patterns """
+        for pattern, prefix in ((r"{{(\w+)}}", "{{"), (r"\[\[\w+", "[["),
+                                ("ab*c", "a"), ("a{2}", ""), ("ab|cd", ""),
+                                (r"(?:ab)c", ""), ("a.b", "a")):
+            self.assertEqual(prefix, compiler.literal_prefix(pattern))
+
+class TestIncludes(unittest.TestCase):
+
+    def setUp(self):
+        self.templates = TemplateManager()
+        tag.register(r"{{(\w+)}}",
+                     tag.IncludeTag(r"{% include (\w+) %}", self.templates))
+    def tearDown(self):
+        tag.get_manager().clear()
+
+    def test_inlined(self):
+        """ Included templates are inlined into the compiled form """
+        self.templates.add(Template("<h1>{{title}}</h1>", name='header'))
+        t = Template("{% include header %} {{title}} {% include header %}")
+        c = t.compile()
+        self.assertListEqual(["<h1>", "{{title}}", "</h1>", " ", "{{title}}",
+                              " ", "<h1>", "{{title}}", "</h1>"], c.segments)
+        self.assertEqual(1, len(c.slots))
+        self.assertEqual("<h1>a</h1> a <h1>a</h1>", t.render(title="a"))
+
+    def test_nested(self):
+        """ Included templates may include others """
+        self.templates.add(Template("[{{x}}]", name='inner'))
+        self.templates.add(Template("({% include inner %})", name='outer'))
+        t = Template("{% include outer %}!")
+        self.assertEqual("([1])!", t.render(x=1))
+
+    def test_cycle(self):
+        """ Include cycles raise a TemplateError """
+        self.templates.add(Template("{% include b %}", name='a'))
+        self.templates.add(Template("{% include a %}", name='b'))
+        t = Template("{% include a %}")
+        self.assertRaises(TemplateError, t.compile)
+        self.assertRaises(TemplateError, self.templates.a.compile)
+
+    def test_missing(self):
+        """ Including an unknown template raises a TemplateError """
+        self.assertRaises(TemplateError, Template("{% include foo %}").compile)
+
+    def test_invalidation(self):
+        """ Changing an included template recompiles the including one """
+        partial = Template("v1", name='partial')
+        self.templates.add(partial)
+        t = Template("{% include partial %}")
+        self.assertEqual("v1", t.render())
+        partial.template = "v2"
+        self.assertEqual("v2", t.render())
+        self.templates.add(Template("v3", name='partial'))
+        self.assertEqual("v3", t.render())
+
+    def test_watcher_reload(self):
+        """ Templates included from a DirectoryWatcher follow file changes """
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'footer.txt')
+            with open(path, 'w') as f:
+                f.write("footer {{x}}")
+            watcher = DirectoryWatcher(tmp)
+            tag.get_manager().clear()
+            tag.register(r"{{(\w+)}}",
+                         tag.IncludeTag(r"{% include (\w+) %}", watcher))
+            t = Template("body {% include footer %}")
+            self.assertEqual("body footer 1", t.render(x=1))
+            with open(path, 'w') as f:
+                f.write("new footer {{x}}")
+            self.assertEqual(1, len(watcher.reload_changed()))
+            self.assertEqual("body new footer 1", t.render(x=1))
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_watcher_reload_cycle(self):
+        """ Include cycles introduced by reloaded templates raise a TemplateError """
+        tmp = tempfile.mkdtemp()
+        try:
+            for name, source in (('page', "page {% include head %}"),
+                                 ('head', "head {{x}}")):
+                with open(os.path.join(tmp, name + '.txt'), 'w') as f:
+                    f.write(source)
+            watcher = DirectoryWatcher(tmp)
+            watcher.check_interval = 0
+            tag.get_manager().clear()
+            tag.register(r"{{(\w+)}}",
+                         tag.IncludeTag(r"{% include (\w+) %}", watcher))
+            self.assertEqual("page head 1", watcher['page'].render(x=1))
+            with open(os.path.join(tmp, 'head.txt'), 'w') as f:
+                f.write("head {% include page %}")
+            page = watcher['page']
+            self.assertRaises(TemplateError, page.render, x=1)
+            try:
+                page.render(x=1)
+            except TemplateError as e:
+                self.assertIn("Include cycle", str(e))
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_runtime_processor(self):
+        """ Include tags render included templates when not compiled """
+        from tie import renderers
+        self.templates.add(Template("<{{x}}>", name='part'))
+        t = Template("{% include part %}",
+                     renderer=renderers.substitution_renderer)
+        self.assertEqual("<1>", t.render(x=1))
+
+    def test_pickle(self):
+        """ Include tags can be pickled """
+        self.templates.add(Template("<{{x}}>", name='part'))
+        include_tag = pickle.loads(pickle.dumps(list(tag.get_manager())[1]))
+        self.assertEqual("part", include_tag.get_template("part").name)
+        self.assertIs(include_tag, include_tag.processor.__self__)
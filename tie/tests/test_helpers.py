@@ -1,8 +1,11 @@
 #!/usr/bin/env python
 #-*- coding:utf-8 -*-
 """ Helper functions tests """
-import unittest
+import os
 import re
+import shutil
+import tempfile
+import unittest
 
 from tie import helpers
 
@@ -43,3 +46,57 @@ class TestRegexHelpers(unittest.TestCase):
         self.assertEqual("val",  helpers.get_single_group(m, "val"))
         self.assertEqual("val",  helpers.get_single_group(m, 2))
 
+
+class TestListFiles(unittest.TestCase):
+    """ Tests for list_files """
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        for path in ['a.txt', 'b.html', 'sub/c.txt', 'sub/d.html',
+                     'sub/subsub/e.txt']:
+            path = os.path.join(self.dir, path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            open(path, 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def listed(self, **kwargs):
+        """ Helper """
+        return sorted(os.path.relpath(p, self.dir)
+                      for p in helpers.list_files(self.dir, **kwargs))
+
+    def test_list_files(self):
+        """ Listing files, without recursion by default """
+        self.assertListEqual(['a.txt', 'b.html'], self.listed())
+
+    def test_list_files_recursive(self):
+        """ Listing files recursively """
+        self.assertListEqual(
+            ['a.txt', 'b.html', os.path.join('sub', 'c.txt'),
+             os.path.join('sub', 'd.html'),
+             os.path.join('sub', 'subsub', 'e.txt')],
+            self.listed(recursive=True))
+
+    def test_list_files_pattern(self):
+        """ Glob patterns apply at every depth """
+        self.assertListEqual(
+            ['a.txt', os.path.join('sub', 'c.txt'),
+             os.path.join('sub', 'subsub', 'e.txt')],
+            self.listed(recursive=True, pattern='*.txt'))
+
+    def test_list_files_suffixes(self):
+        """ Suffix filters apply at every depth """
+        self.assertListEqual(
+            ['b.html', os.path.join('sub', 'd.html')],
+            self.listed(recursive=True, suffixes='.html'))
+        self.assertEqual(5, len(self.listed(recursive=True,
+                                            suffixes=['.html', '.txt'])))
+
+    def test_list_files_relative(self):
+        """ Relative pathes apply at every depth """
+        files = list(helpers.list_files(self.dir, recursive=True,
+                                        abspathes=False))
+        self.assertEqual(5, len(files))
+        self.assertFalse(any(os.path.isabs(f) for f in files))
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+Incremental rendering tests
+"""
+from __future__ import unicode_literals
+
+import unittest
+
+from tie import tag
+from tie.live import LiveTemplate, Change
+from tie.template import Template
+
+class Obj(object):
+    pass
+
+class TestLiveTemplate(unittest.TestCase):
+
+    def setUp(self):
+        tag.register(r"{{ (.+?) }}")
+    def tearDown(self):
+        tag.get_manager().clear()
+
+    def apply(self, previous, changes):
+        """ Patch ``previous`` with ``changes``, using their old offsets """
+        for c in reversed(changes):
+            previous = previous[:c.old_start] + c.value + previous[c.old_end:]
+        return previous
+
+    def test_first_update(self):
+        """ The whole output changes on first update """
+        live = LiveTemplate("a={{ a }}")
+        self.assertEqual(("a=1", [Change(0, 3, 0, 0, "a=1")]),
+                         live.update(a=1))
+
+    def test_process_override(self):
+        """ Tags redefining Tag.process are honoured by rendering whole """
+        class Upper(tag.Tag):
+            def process(self, template, **context):
+                out = super(Upper, self).process(template, **context)
+                return dict((k, v.upper()) for k, v in out.items())
+        manager = tag.TagManager()
+        manager.add(Upper(r"<(\w+)>"))
+        live = LiveTemplate("hi <name>", manager)
+        self.assertEqual("hi BOB", live.update(name="bob")[0])
+        self.assertEqual(("hi BOB", []), live.update(name="bob"))
+        self.assertEqual(("hi AL", [Change(0, 5, 0, 6, "hi AL")]),
+                         live.update(name="al"))
+
+    def test_changed_spans(self):
+        """ Only changed slots are reported, with new and old offsets """
+        live = LiveTemplate("a={{ a }} b={{ b }} a={{ a }}")
+        first, _ = live.update(a=1, b=2)
+        out, changes = live.update(a=100, b=2)
+        self.assertEqual("a=100 b=2 a=100", out)
+        self.assertListEqual([Change(2, 5, 2, 3, "100"),
+                              Change(12, 15, 10, 11, "100")], changes)
+        self.assertEqual(out, self.apply(first, changes))
+        self.assertEqual((out, []), live.update(a=100, b=2, c=3))
+
+    def test_only_changed_slots_evaluated(self):
+        """ Slots whose dependencies didn't change aren't evaluated """
+        calls = []
+        def proc(m, **c):
+            calls.append(m.group(1))
+            return str(c[m.group(1)])
+        tag.register(tag.Tag(r"<(\w+)>", processor=proc,
+                             depends=lambda m: (m.group(1),)))
+        live = LiveTemplate("<a> <b>")
+        live.update(a=1, b=2)
+        live.update(a=1, b=3)
+        self.assertListEqual(["a", "b", "b"], calls)
+
+    def test_unknown_dependencies(self):
+        """ Slots with unknown dependencies are always evaluated """
+        tag.register(tag.Tag(r"<(\w+)>",
+                             processor=lambda m, **c: str(c["n"])))
+        live = LiveTemplate("<x> {{ a }}")
+        live.update(n=1, a=1)
+        out, changes = live.update(n=2, a=1)
+        self.assertEqual("2 1", out)
+        self.assertListEqual([Change(0, 1, 0, 1, "2")], changes)
+
+    def test_mark_dirty(self):
+        """ Objects mutated in place are re-evaluated once marked dirty """
+        user = Obj()
+        user.name = "bob"
+        live = LiveTemplate("{{ user.name }}")
+        live.update(user=user)
+        user.name = "alice"
+        self.assertEqual(("bob", []), live.update(user=user))
+        live.mark_dirty("user")
+        self.assertEqual("alice", live.update(user=user)[0])
+
+    def test_recompilation(self):
+        """ The whole output changes when the template is recompiled """
+        t = Template("{{ a }} <a>")
+        live = LiveTemplate(t)
+        live.update(a=1)
+        tag.register(r"<(\w+)>")
+        self.assertEqual(("1 1", [Change(0, 3, 0, 5, "1 1")]),
+                         live.update(a=1))
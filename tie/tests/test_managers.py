@@ -7,6 +7,10 @@ from __future__ import unicode_literals
 
 import os
 import sys
+import time
+import shutil
+import tempfile
+import threading
 
 if sys.version_info[:2] < (2, 7):
     import unittest2 as unittest
@@ -15,6 +19,7 @@ else:
 
 from tie import tag 
 from tie import template
+from tie import reloader
 
 Tag      = tag.Tag
 Template = template.Template
@@ -44,6 +49,31 @@ class TestTagManager(unittest.TestCase):
         tm = tag.get_manager()
         self.assertEqual(tm, tag._manager)
 
+    def test_use_manager(self):
+        """ Scoping a TagManager to the current context """
+        tm = tag.TagManager()
+        with tag.use_manager(tm):
+            self.assertIs(tm, tag.get_manager())
+            tag.register("dummy")
+            # Other threads keep using the global manager
+            seen = []
+            th = threading.Thread(target=lambda: seen.append(tag.get_manager()))
+            th.start()
+            th.join()
+            self.assertListEqual([tag._manager], seen)
+        self.assertIs(tag._manager, tag.get_manager())
+        self.assertEqual(1, len(tm))
+        self.assertEqual(0, len(tag._manager))
+
+    def test_use_manager_render(self):
+        """ Templates render with the tags of the current context """
+        tm = tag.TagManager()
+        tm.add("%dummy%")
+        t = Template("%dummy%")
+        with tag.use_manager(tm):
+            self.assertEqual("foo", t.render(**{"%dummy%": "foo"}))
+        self.assertEqual("%dummy%", t.render(**{"%dummy%": "foo"}))
+
     def test_global_cache_clear(self):
         """ Clearing all registered tags' cache """
         tag.register(
@@ -59,7 +89,17 @@ class TestTagManager(unittest.TestCase):
             )
         m.clear_cache()
         for t in m:
-            self.assertEqual({}, t.cache)
+            self.assertEqual(0, len(t.cache))
+
+    def test_version(self):
+        """ Managers' version changes with their registered tags """
+        m = tag.TagManager()
+        v = m.version
+        m.add("dummy")
+        self.assertNotEqual(v, m.version)
+        v = m.version
+        m.clear()
+        self.assertNotEqual(v, m.version)
 
 class TestPriorityTagManager(unittest.TestCase):
 
@@ -103,6 +143,19 @@ class TestPriorityTagManager(unittest.TestCase):
         )
         tag_patterns = [t.regexp.pattern for t in tag.get_manager()]
         self.assertListEqual(tag_patterns, ["mudmud", "dummy", "dumdum"])
+
+    def test_ordering_cache(self):
+        """ Tags' order is only computed when tags change """
+        tag.register(("dummy", 4), ("dumdum", 7))
+        m = tag.get_manager()
+        ordered = m._ordered
+        self.assertIs(ordered, m._ordered)
+        self.assertEqual(2, len(m))
+        v = m.version
+        tag.register(("mudmud", 0))
+        self.assertNotEqual(v, m.version)
+        self.assertListEqual(["mudmud", "dummy", "dumdum"],
+                             [t.regexp.pattern for t in m])
         
 class TestRegistration(unittest.TestCase):
 
@@ -186,6 +239,31 @@ class TemplateTagManager(unittest.TestCase):
         """ Accessing a non registered name should raise an AttributeError like any non existing attribute """
         self.assertRaises(AttributeError, getattr, self.manager, 'dummy')
 
+    def test_mapping_access(self):
+        """ Accessing templates like in a dictionnary """
+        self.assertIs(self.templates[1], self.manager['bar'])
+        self.assertRaises(KeyError, lambda: self.manager['dummy'])
+        self.assertTrue('baz' in self.manager)
+        self.assertFalse('dummy' in self.manager)
+        self.assertIs(self.templates[0], self.manager.get('foo'))
+        self.assertIsNone(self.manager.get('dummy'))
+        self.assertEqual(3, len(self.manager))
+
+    def test_duplicate_names(self):
+        """ Adding a template with an already registered name replaces it """
+        t = Template('new bar', name='bar')
+        self.manager.add(t)
+        self.assertIs(t, self.manager.bar)
+        self.assertListEqual([self.templates[0], t, self.templates[2]],
+                             list(self.manager))
+
+    def test_unnamed_templates(self):
+        """ Unnamed templates are only reachable through iteration """
+        self.manager.add('unnamed')
+        self.manager.add('unnamed too')
+        self.assertEqual(5, len(self.manager))
+        self.assertFalse('' in self.manager)
+
 class DirectoryWatcher(unittest.TestCase):
 
     root_dir    = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
@@ -257,6 +335,15 @@ class DirectoryWatcher(unittest.TestCase):
         actual = sorted(list(m.list_watched_templates(basenames=True)))
         self.assertListEqual(expected, actual)
 
+    def test_list_watched_templates_extensions(self):
+        """ Listing only templates with some extensions """
+        m = template.DirectoryWatcher('tie/tests')
+        m.extensions = '.txt'
+        self.assertTrue(all(p.endswith('.txt')
+                            for p in m.list_watched_templates()))
+        self.assertTrue('foo' in m.get_index())
+        self.assertFalse('test_template' in m.get_index())
+
     def test_list_watched_templates_non_recursive(self):
         """ No recursion when listing templates if flag is false """
         m = template.DirectoryWatcher(self.watched_dir)
@@ -279,6 +366,15 @@ class DirectoryWatcher(unittest.TestCase):
         self.assertEqual(1, len(m._template_list))
         self.assertEqual(m._template_list[0].name, 'foo')
 
+    def test_load_lazy_template(self):
+        """ Templates are loaded lazily by default """
+        m = template.DirectoryWatcher(self.watched_dir)
+        t = m._load_template('foo')
+        self.assertFalse(t.loaded)
+        m.lazy = False
+        t = m._load_template('bar')
+        self.assertTrue(t.loaded)
+
     def test_load_invalid_template(self):
         """ Raise TemplateError if trying to load an invalid template """
         m = template.DirectoryWatcher(self.watched_dir)
@@ -299,6 +395,16 @@ class DirectoryWatcher(unittest.TestCase):
         self.assertIsNotNone(t)
         self.assertEqual('foo', t.name)
 
+    def test_mapping_access(self):
+        """ Accessing watched templates like in a dictionnary """
+        m = template.DirectoryWatcher(self.watched_dir)
+        self.assertTrue('foo' in m)
+        self.assertEqual('foo', m['foo'].name)
+        self.assertRaises(KeyError, lambda: m['oof'])
+        self.assertRaises(KeyError, lambda: m['dirs'])
+        self.assertIsNone(m.get('oof'))
+        self.assertFalse('oof' in m)
+
     def test_get_template_error(self):
         """ Trying to get a non-existing template should raise a TemplateError """
         m = template.DirectoryWatcher(self.watched_dir)
@@ -312,3 +418,148 @@ class DirectoryWatcher(unittest.TestCase):
         ])
         actual = sorted([t.name for t in m])
         self.assertListEqual(actual, expected)
+
+    def test_index(self):
+        """ Watched templates are indexed by name """
+        m = template.DirectoryWatcher(self.watched_dir)
+        index = m.get_index()
+        self.assertListEqual(['bar', 'baz', 'dummy', 'foo'], sorted(index))
+        self.assertEqual(
+            os.path.abspath(os.path.join(self.watched_dir, 'subdir',
+                                         'dummy.txt')),
+            index['dummy'])
+        self.assertIs(index, m.get_index())
+
+    def test_index_shadowing(self):
+        """ Templates from the first watched directories shadow the next ones """
+        tmp = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(tmp, 'foo.txt'), 'w') as f:
+                f.write('shadowed foo')
+            m = template.DirectoryWatcher(tmp, self.watched_dir)
+            self.assertEqual('shadowed foo', m.foo.template)
+            m = template.DirectoryWatcher(self.watched_dir, tmp)
+            self.assertNotEqual('shadowed foo', m.foo.template)
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_index_invalidation(self):
+        """ The index is rebuilt when watched directories change, or on demand """
+        tmp = tempfile.mkdtemp()
+        try:
+            m = template.DirectoryWatcher(self.watched_dir)
+            self.assertFalse('qux' in m.get_index())
+            with open(os.path.join(tmp, 'qux.txt'), 'w') as f:
+                f.write('qux')
+            m.add_directory(tmp)
+            self.assertTrue('qux' in m.get_index())
+            with open(os.path.join(tmp, 'quux.txt'), 'w') as f:
+                f.write('quux')
+            self.assertFalse('quux' in m.get_index())
+            m.reindex()
+            self.assertTrue('quux' in m.get_index())
+            m.recursive = False
+            self.assertFalse('dummy' in m.get_index())
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_names(self):
+        """ Listing watched templates' names """
+        m = template.DirectoryWatcher(self.watched_dir)
+        self.assertListEqual(['bar', 'baz', 'dummy', 'foo'], m.names())
+        self.assertEqual(0, len(m._template_list))
+
+class DirectoryWatcherReloading(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.write('foo', 'foo {{ a }}')
+        self.watcher = template.DirectoryWatcher(self.dir)
+        tag.register(r"{{ (\w+) }}")
+
+    def tearDown(self):
+        self.watcher.stop_reloading()
+        tag.get_manager().clear()
+        shutil.rmtree(self.dir)
+
+    def write(self, name, contents):
+        """ Helper """
+        with open(os.path.join(self.dir, name + '.txt'), 'w') as f:
+            f.write(contents)
+
+    def wait_for(self, predicate, timeout=5):
+        """ Helper """
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if predicate():
+                return True
+            time.sleep(0.01)
+        return False
+
+    def test_no_checks_by_default(self):
+        """ Loaded templates are kept forever by default """
+        self.assertEqual('foo 1', self.watcher.foo(a=1))
+        self.write('foo', 'changed foo {{ a }}')
+        self.assertEqual('foo 1', self.watcher.foo(a=1))
+
+    def test_check_on_access(self):
+        """ Templates are checked for changes on access """
+        self.watcher.check_interval = 0
+        self.assertEqual('foo 1', self.watcher.foo(a=1))
+        self.write('foo', 'changed foo {{ a }}')
+        self.assertEqual('changed foo 1', self.watcher.foo(a=1))
+
+    def test_check_interval(self):
+        """ Templates are checked at most once per interval """
+        self.watcher.check_interval = 3600
+        self.assertEqual('foo 1', self.watcher.foo(a=1))
+        self.write('foo', 'changed foo {{ a }}')
+        self.assertEqual('foo 1', self.watcher.foo(a=1))
+
+    def test_new_template(self):
+        """ New files are found on misses when checking for changes """
+        self.watcher.check_interval = 0
+        self.watcher.get_index()
+        self.write('bar', 'bar')
+        self.assertEqual('bar', self.watcher.bar())
+
+    def test_reload_changed(self):
+        """ Reloading changed templates keeps them compiled """
+        foo = self.watcher.foo
+        foo(a=1)
+        self.assertListEqual([], self.watcher.reload_changed())
+        self.write('foo', 'changed foo {{ a }}')
+        self.assertListEqual([foo], self.watcher.reload_changed())
+        self.assertIsNotNone(foo._compiled)
+        self.assertEqual('changed foo 1', foo(a=1))
+
+    def test_removed_template(self):
+        """ Templates whose file was removed keep their last version """
+        self.watcher.check_interval = 0
+        self.assertEqual('foo 1', self.watcher.foo(a=1))
+        os.remove(os.path.join(self.dir, 'foo.txt'))
+        self.assertEqual('foo 1', self.watcher.foo(a=1))
+
+    def test_stat_reloader(self):
+        """ Background reloading by polling """
+        foo = self.watcher.foo
+        foo(a=1)
+        self.watcher.start_reloading('stat', interval=0.01)
+        self.write('foo', 'changed foo {{ a }}')
+        self.assertTrue(self.wait_for(lambda: foo(a=1) == 'changed foo 1'))
+
+    @unittest.skipUnless(reloader.inotify_available(), "inotify unavailable")
+    def test_inotify_reloader(self):
+        """ Background reloading with inotify """
+        foo = self.watcher.foo
+        foo(a=1)
+        self.watcher.start_reloading('inotify', interval=0.01)
+        self.write('foo', 'changed foo {{ a }}')
+        self.assertTrue(self.wait_for(lambda: foo(a=1) == 'changed foo 1'))
+        self.write('bar', 'bar')
+        self.assertTrue(self.wait_for(
+            lambda: 'bar' in self.watcher.get_index()))
+
+    def test_invalid_backend(self):
+        """ Unknown reloading backends are rejected """
+        self.assertRaises(ValueError, self.watcher.start_reloading, 'dummy')
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+Performance counters tests
+"""
+from __future__ import unicode_literals
+
+import threading
+import unittest
+
+from tie import metrics, renderers, tag
+from tie.template import Template
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+    def tearDown(self):
+        metrics.disable()
+        metrics.reset()
+        tag.get_manager().clear()
+
+    def get(self, kind, label):
+        """ Return the snapshot entry labelled ``label`` """
+        for d in metrics.snapshot()[kind]:
+            if d[kind[:-1]] == label:
+                return d
+
+    def test_disabled(self):
+        """ Nothing is recorded while disabled """
+        tag.register(r"{{(\w+)}}")
+        Template("{{a}}", name='t').render(a=1)
+        self.assertEqual({'tags': [], 'templates': []}, metrics.snapshot())
+
+    def test_tag_counters(self):
+        """ Tags record matches and processor calls """
+        t = tag.Tag(r"{{(\w+)}}")
+        tag.register(t)
+        tmpl = Template("{{a}} {{b}} {{a}}", name='t')
+        with metrics.collect():
+            tmpl.render(a=1, b=2)
+            tmpl.render(a=1, b=2)
+        stats = self.get('tags', str(t))
+        self.assertEqual(6, stats['matches'])
+        self.assertEqual(4, stats['calls'])
+        self.assertGreater(stats['total_time'], 0)
+        self.assertGreaterEqual(stats['total_time'], stats['max_time'])
+        self.assertFalse(metrics.enabled)
+
+    def test_compiled_before_enabling(self):
+        """ Matches are counted per render, even if compiled beforehand """
+        t = tag.Tag(r"{{(\w+)}}")
+        tag.register(t)
+        tmpl = Template("{{a}} {{a}}")
+        tmpl.render(a=1)
+        with metrics.collect():
+            tmpl.render(a=1)
+        stats = self.get('tags', str(t))
+        self.assertEqual(2, stats['matches'])
+        self.assertEqual(1, stats['calls'])
+
+    def test_cache_counters(self):
+        """ Cached tags record their cache hits and misses """
+        t = tag.Tag(r"{{(\w+)}}", cached=True)
+        tag.register(t)
+        tmpl = Template("{{a}}")
+        with metrics.collect():
+            tmpl.render(a=1)
+            tmpl.render(a=1)
+            tmpl.render(a=2)
+        stats = self.get('tags', str(t))
+        self.assertEqual(1, stats['cache_hits'])
+        self.assertEqual(2, stats['cache_misses'])
+        self.assertEqual(2, stats['calls'])
+
+    def test_template_counters(self):
+        """ Templates record their renders """
+        tag.register(r"{{(\w+)}}")
+        tmpl = Template("{{a}}", name='tmpl')
+        with metrics.collect():
+            for _ in range(3):
+                tmpl.render(a=1)
+        stats = self.get('templates', 'tmpl')
+        self.assertEqual(3, stats['renders'])
+        self.assertAlmostEqual(stats['total_time'] / 3, stats['mean_time'])
+
+    def test_substitution_renderer(self):
+        """ Tags processed over whole templates record their matches """
+        t = tag.Tag(r"{{(\w+)}}")
+        tag.register(t)
+        tmpl = Template("{{a}} {{a}}",
+                        renderer=renderers.substitution_renderer)
+        with metrics.collect():
+            tmpl.render(a=1)
+        stats = self.get('tags', str(t))
+        self.assertEqual(2, stats['matches'])
+        self.assertEqual(1, stats['calls'])
+
+    def test_codegen_renderer(self):
+        """ Inlined substitutions are recorded while enabled """
+        t = tag.Tag(r"{{(\w+)}}")
+        tag.register(t)
+        tmpl = Template("{{a}}", renderer=renderers.codegen_renderer)
+        with metrics.collect():
+            self.assertEqual("1", tmpl.render(a=1))
+        self.assertEqual(1, self.get('tags', str(t))['calls'])
+
+    def test_threads(self):
+        """ Concurrent renders don't lose counts """
+        t = tag.Tag(r"{{(\w+)}}")
+        tag.register(t)
+        tmpl = Template("{{a}} {{b}}", name='tmpl')
+        def work():
+            for _ in range(200):
+                tmpl.render(a=1, b=2)
+        with metrics.collect():
+            threads = [threading.Thread(target=work) for _ in range(4)]
+            for th in threads:
+                th.start()
+            for th in threads:
+                th.join()
+        self.assertEqual(1600, self.get('tags', str(t))['calls'])
+        self.assertEqual(800, self.get('templates', 'tmpl')['renders'])
+
+    def test_reset(self):
+        """ Resetting discards recorded metrics """
+        tag.register(r"{{(\w+)}}")
+        with metrics.collect():
+            Template("{{a}}").render(a=1)
+            metrics.reset()
+        self.assertEqual({'tags': [], 'templates': []}, metrics.snapshot())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+Parallel rendering tests
+"""
+from __future__ import unicode_literals
+
+import pickle
+import unittest
+
+from tie import tag
+from tie import template
+
+def register_tags():
+    """ Worker setup callable """
+    tag.register(r"%(\w+)%")
+
+def upper(match, **context):
+    """ Picklable custom processor """
+    return context[match.group(1)].upper()
+
+class TestRenderMany(unittest.TestCase):
+
+    def setUp(self):
+        tag.register(r"{{ (\w+) }}")
+    def tearDown(self):
+        tag.get_manager().clear()
+
+    contexts = [{"name": "n%i" % i, "i": i} for i in range(20)]
+
+    def expected(self, t, **base):
+        """ Helper """
+        out = []
+        for c in self.contexts:
+            ctx = dict(base)
+            ctx.update(c)
+            out.append(t.render(**ctx))
+        return out
+
+    def test_render_many(self):
+        """ Rendering many contexts over a process pool, in order """
+        t = template.Template("{{ greeting }} {{ name }} #{{ i }}")
+        self.assertListEqual(self.expected(t, greeting="hi"),
+                             t.render_many(self.contexts, workers=2,
+                                           greeting="hi"))
+
+    def test_render_many_serial(self):
+        """ A single worker renders in the current process """
+        t = template.Template("{{ name }}")
+        self.assertListEqual(self.expected(t),
+                             t.render_many(self.contexts, workers=1))
+
+    def test_render_many_custom_processor(self):
+        """ Custom picklable processors are shipped to the workers """
+        tag.register(tag.Tag(r"\[(\w+)\]", processor=upper))
+        t = template.Template("[name] {{ i }}")
+        self.assertListEqual(self.expected(t),
+                             t.render_many(self.contexts, workers=2,
+                                           chunksize=3))
+
+    def test_render_many_setup(self):
+        """ Tags can be registered by a setup callable in each worker """
+        t = template.Template("%name%")
+        self.assertListEqual([c["name"] for c in self.contexts],
+                             t.render_many(self.contexts, workers=2,
+                                           setup=register_tags))
+
+    def test_manager_render_many(self):
+        """ Rendering jobs over several managed templates """
+        m = template.TemplateManager()
+        m.add(template.Template("{{ name }}", name="foo"))
+        m.add(template.Template("<{{ i }}>", name="bar"))
+        jobs = [("foo" if i % 2 else "bar", c)
+                for i, c in enumerate(self.contexts)]
+        expected = [getattr(m, n).render(**c) for n, c in jobs]
+        self.assertListEqual(expected, m.render_many(jobs, workers=2))
+
+class TestPickling(unittest.TestCase):
+
+    def tearDown(self):
+        tag.get_manager().clear()
+
+    def test_pickle_template(self):
+        """ Compiled templates are dropped when pickling """
+        tag.register(r"{{ (\w+) }}")
+        t = template.Template("{{ foo }}")
+        t.compile()
+        t2 = pickle.loads(pickle.dumps(t))
+        self.assertEqual("bar", t2(foo="bar"))
+
+    def test_pickle_tag(self):
+        """ Cached results are dropped when pickling """
+        t = tag.Tag("dummy", cached=True, cache_size=12)
+        t.process("dummy", dummy="foo")
+        t2 = pickle.loads(pickle.dumps(t))
+        self.assertEqual(0, len(t2.cache))
+        self.assertEqual(12, t2.cache.maxsize)
@@ -9,6 +9,7 @@ import re
 
 from tie import utils
 from tie import processors
+from tie import exceptions
 
 class TestProcessorSub(unittest.TestCase):
 
@@ -112,3 +113,15 @@ class TestProcessorSubAttrLookup(unittest.TestCase):
         match = re.search("%(.+)%", "my item: %o.d%")
         self.assertRaises(AttributeError, processors.sub, match, **{'o':self.o})
 
+
+    def test_attribute_lookup_no_eval(self):
+        """ Attribute lookup - Only plain lookups are supported """
+        match = re.search("%(.+)%", "my item: %o.a.__class__()%")
+        self.assertRaises(exceptions.InvalidLookupError, processors.sub, match,
+                          **{'o':self.o})
+
+    def test_attribute_lookup_dotted_key(self):
+        """ Attribute lookup - Context keys take precedence over lookups """
+        match = re.search("%(.+)%", "my item: %o.a%")
+        res = processors.sub(match, **{'o.a': 'foo', 'o': self.o})
+        self.assertEqual('foo', res)
@@ -5,8 +5,12 @@ Template rendererd tests
 """
 from __future__ import unicode_literals
 
+import os
+import shutil
+import tempfile
 import unittest
 from tie import renderers
+from tie import processors
 from tie import template
 from tie import tag
 
@@ -42,6 +46,33 @@ class TestDefaultRenderer(unittest.TestCase):
         }
         self.assertEqual("dummyval, foo & bar", self.render(tmpl, **args))
 
+    def test_process_override(self):
+        """ Tags redefining Tag.process are honoured """
+        class Upper(tag.Tag):
+            def process(self, template, **context):
+                out = super(Upper, self).process(template, **context)
+                return dict((k, v.upper()) for k, v in out.items())
+        tag.register(Upper(r"{{(\w+)}}"))
+        tmpl = template.Template("hi {{name}}")
+        self.assertEqual("hi BOB", self.render(tmpl, name="bob"))
+        self.assertEqual("hi BOB", renderers.codegen_renderer(tmpl, name="bob"))
+        self.assertListEqual(["hi BOB"], tmpl.render_batch({"name": ["bob"]}))
+        self.assertEqual("hi BOB", ''.join(tmpl.render_iter(name="bob")))
+
+    def test_nested_sub_lookups(self):
+        """ Processors substituting other contexts don't reuse memoised lookups """
+        class Addr(object):
+            def __init__(self, city): self.city = city
+        class Item(object):
+            def __init__(self, city): self.addr = Addr(city)
+        def each(match, **context):
+            return ','.join(processors.sub(match, it=item)
+                            for item in context['items'])
+        tag.register(tag.Tag(r"<each \[([\w.]+)\]>", processor=each))
+        tmpl = template.Template("<each [it.addr.city]>")
+        items = [Item("Paris"), Item("Rome")]
+        self.assertEqual("Paris,Rome", self.render(tmpl, items=items))
+
     def test_repeated_tags(self):
         """ Rendering a template containing repeated tags """
         tag.register("--dumdum--")
@@ -49,3 +80,147 @@ class TestDefaultRenderer(unittest.TestCase):
         self.assertEqual("foo, foo & foo",
                          self.render(tmpl, **{"--dumdum--": "foo"}))
 
+    def test_special_characters(self):
+        """ Matched tags containing regex special characters are substituted literally """
+        tag.register(tag.Tag(r"%[\w\[\]().']+%",
+                             processor=lambda m, **c: c[m.group(0)]))
+        tmpl = template.Template("%l[0]% %o.a% %f(x)%")
+        args = {"%l[0]%": "a", "%o.a%": "b", "%f(x)%": "c"}
+        self.assertEqual("a b c", self.render(tmpl, **args))
+
+class TestSubstitutionRenderer(TestDefaultRenderer):
+
+    render = staticmethod(renderers.substitution_renderer)
+
+    def test_prefix_tags(self):
+        """ Substituted tags are never shadowed by one of their prefixes """
+        tag.register("--dum", "--dumdum")
+        tmpl = template.Template("--dumdum --dum")
+        args = {"--dum": "foo", "--dumdum": "bar"}
+        self.assertEqual("bar foo", self.render(tmpl, **args))
+
+class TestSubstitutionRegex(unittest.TestCase):
+
+    def test_escaped(self):
+        """ Substituted strings are matched literally """
+        rgx = renderers.substitution_regex(["a.b", "l[0]"])
+        self.assertIsNone(rgx.search("axb l0"))
+        self.assertEqual("l[0]", rgx.search("l[0]").group(0))
+
+    def test_cached(self):
+        """ Regexes are cached on the set of substituted strings """
+        rgx = renderers.substitution_regex(["foo", "bar"])
+        self.assertIs(rgx, renderers.substitution_regex(["bar", "foo"]))
+
+class TestCachedRenderer(unittest.TestCase):
+
+    def setUp(self):
+        tag.register(r"{{(\w+)}}")
+        self.dir = tempfile.mkdtemp()
+        self.store = os.path.join(self.dir, 'store')
+        self.calls = []
+    def tearDown(self):
+        tag.get_manager().clear()
+        shutil.rmtree(self.dir)
+
+    def counting(self, tmpl, **context):
+        self.calls.append(context)
+        return renderers.default_renderer(tmpl, **context)
+
+    def renderer(self, **kwargs):
+        kwargs.setdefault('directory', self.store)
+        return renderers.CachedRenderer(self.counting, **kwargs)
+
+    def test_memory(self):
+        """ Outputs are cached on the referenced variables only """
+        t = template.Template("{{a}}", renderer=self.renderer())
+        self.assertEqual("1", t.render(a=1, other=object()))
+        self.assertEqual("1", t.render(a=1, other=object()))
+        self.assertEqual("2", t.render(a=2))
+        self.assertEqual(2, len(self.calls))
+
+    def test_disk(self):
+        """ Outputs stored on disk survive the renderer """
+        t = template.Template("{{a}}", renderer=self.renderer())
+        t.render(a="x")
+        t2 = template.Template("{{a}}", renderer=self.renderer())
+        self.assertEqual("x", t2.render(a="x"))
+        self.assertEqual(1, len(self.calls))
+
+    def test_content_changes(self):
+        """ Changing the template or the tags misses the cache """
+        r = self.renderer()
+        t = template.Template("{{a}}", renderer=r)
+        t.render(a=1)
+        t.template = "{{a}}!"
+        self.assertEqual("1!", t.render(a=1))
+        tag.register(r"<(\w+)>")
+        t.render(a=1)
+        self.assertEqual(3, len(self.calls))
+
+    def test_uncacheable(self):
+        """ Only simple immutable values are cached """
+        t = template.Template("{{a}}", renderer=self.renderer())
+        t.render(a=[1])
+        t.render(a=[1])
+        self.assertEqual(2, len(self.calls))
+        value = object()
+        t.render(a=value)
+        t.render(a=value)
+        self.assertEqual(4, len(self.calls))
+        self.assertEqual(0, len(os.listdir(self.store)))
+
+    def test_value_types(self):
+        """ Equal values of different types are cached apart """
+        t = template.Template("{{a}}", renderer=self.renderer(directory=None))
+        self.assertListEqual(["1", "True", "1.0"],
+                             [t.render(a=a) for a in (1, True, 1.0)])
+
+    def test_ttl(self):
+        """ Expired outputs are rendered again """
+        t = template.Template("{{a}}", renderer=self.renderer(ttl=0))
+        t.render(a=1)
+        t.render(a=1)
+        self.assertEqual(2, len(self.calls))
+
+    def test_disk_budget(self):
+        """ The disk store is pruned to its size budget """
+        t = template.Template("{{a}}" * 10, renderer=self.renderer(
+            max_bytes=100))
+        for i in range(20):
+            t.render(a="%05i" % i)
+        self.assertLessEqual(sum(os.path.getsize(os.path.join(self.store, f))
+                                 for f in os.listdir(self.store)), 100)
+
+    def test_invalidate(self):
+        """ Invalidating a template drops its outputs only """
+        r = self.renderer()
+        t1 = template.Template("{{a}}", renderer=r)
+        t2 = template.Template("{{a}}.", renderer=r)
+        t1.render(a=1)
+        t2.render(a=1)
+        r.invalidate(t1)
+        t1.render(a=1)
+        t2.render(a=1)
+        self.assertEqual(3, len(self.calls))
+        r.invalidate()
+        self.assertEqual(0, len(os.listdir(self.store)))
+
+    def test_watcher(self):
+        """ Templates reloaded by a watched DirectoryWatcher are invalidated """
+        tmpl_dir = os.path.join(self.dir, 'templates')
+        os.mkdir(tmpl_dir)
+        path = os.path.join(tmpl_dir, 'page.txt')
+        with open(path, 'w') as f:
+            f.write("v1 {{a}}")
+        r = self.renderer()
+        watcher = template.DirectoryWatcher(tmpl_dir)
+        r.watch(watcher)
+        page = watcher.page
+        page.renderer = r
+        self.assertEqual("v1 1", page.render(a=1))
+        with open(path, 'w') as f:
+            f.write("v2 {{a}}!")
+        watcher.reload_changed()
+        self.assertEqual(0, len(os.listdir(self.store)))
+        self.assertEqual("v2 1!", page.render(a=1))
@@ -15,6 +15,7 @@ else:
 
 from tie import tag 
 from tie import processors
+from tie.exceptions import InvalidTagError
 
 Tag = tag.Tag
 
@@ -65,10 +66,62 @@ class TestTag(unittest.TestCase):
         self.assertEqual(t.processor, dummy_processor)
 
     def test_cache(self):
-        """ Cached tag should keep results in their cache dict """
+        """ Cached tag should keep results in their cache """
         t = Tag('dummy', cached=True)
         t.process('dummy dumdum dummy', **{'dummy': 'value'})
-        self.assertEqual({'dummy': 'value'}, t.cache)
+        self.assertEqual(1, len(t.cache))
+        self.assertEqual({'dummy': 'value'},
+                         t.process('dummy dumdum dummy', **{'dummy': 'value'}))
+        self.assertEqual((1, 1), (t.cache.hits, t.cache.misses))
+
+    def test_cache_context(self):
+        """ Cached results depend on the context values read by the tag """
+        calls = []
+        def processor(m, **context):
+            calls.append(m)
+            return context.get('dummy', '')
+        t = Tag('dummy', cached=True, processor=processor,
+                depends=('dummy',))
+        t.process('dummy', dummy='foo', other=1)
+        self.assertEqual({'dummy': 'bar'}, t.process('dummy', dummy='bar'))
+        self.assertEqual({'dummy': 'foo'}, t.process('dummy', dummy='foo',
+                                                     other=2))
+        self.assertEqual(2, len(calls))
+
+    def test_cache_template(self):
+        """ Cached results depend on the processed template """
+        t = Tag('(\\w+)', cached=True, processor=lambda m, **c: m.string)
+        self.assertEqual({'foo': 'foo'}, t.process('foo'))
+        self.assertEqual({'foo': 'foo foo'}, t.process('foo foo'))
+
+    def test_cache_default_depends(self):
+        """ Tags depend on the whole context unless told otherwise """
+        t = Tag('dummy', cached=True, processor=lambda m, **c: str(len(c)))
+        self.assertEqual({'dummy': '1'}, t.process('dummy', a=1))
+        self.assertEqual({'dummy': '2'}, t.process('dummy', a=1, b=2))
+
+    def test_cache_value_types(self):
+        """ Equal values of different types are cached apart """
+        t = Tag(r'{{(\w+)}}', cached=True)
+        self.assertListEqual(
+            ['1', 'True', '1.0'],
+            [t.process('{{x}}', x=x)['{{x}}'] for x in (1, True, 1.0)])
+
+    def test_cache_unhashable_context(self):
+        """ Results depending on unhashable values are not cached """
+        t = Tag('dummy', cached=True)
+        t.process('dummy', dummy=['foo'])
+        self.assertEqual(0, len(t.cache))
+
+    def test_cache_sub_depends(self):
+        """ The default processor only depends on the looked up variable """
+        o = type(str("Dummy"), (), {"a": 1})
+        t = Tag('%(.+?)%', cached=True)
+        t.process('%o.a% %b%', o=o, b=2, c=3)
+        t.process('%o.a% %b%', o=o, b=2, c=4)
+        self.assertEqual((2, 2), (t.cache.hits, t.cache.misses))
+        t.process('%o.a% %b%', o=o, b=3, c=4)
+        self.assertEqual((3, 3), (t.cache.hits, t.cache.misses))
 
 class TestMatches(unittest.TestCase):
 
@@ -96,6 +149,19 @@ class TestMatches(unittest.TestCase):
         for i, m in enumerate(self.matches_list("%dummy, %dumdum & %mudmud")):
             self.assertEqual(m.group(0), tags[i])
 
+class TestDelimitedTag(unittest.TestCase):
+
+    def test_delimiters(self):
+        """ Delimiters are matched literally around a single word """
+        t = tag.DelimitedTag("[[", "]]")
+        self.assertEqual({'[[ a ]]': '1', '[[b]]': '2'},
+                         t.process("[[ a ]] [[b]] [[c d]] [[]]", a=1, b=2))
+
+    def test_invalid_delimiters(self):
+        """ Delimiters must be non-empty strings """
+        self.assertRaises(InvalidTagError, tag.DelimitedTag, "", "}}")
+        self.assertRaises(InvalidTagError, tag.DelimitedTag, None, "}}")
+
 class TestProcessing(unittest.TestCase):
 
     def test_naive_substituion(self):
@@ -7,8 +7,16 @@ from __future__ import unicode_literals
 
 import unittest
 import os
+import io
+import tempfile
 from tie import template 
 from tie import renderers
+from tie import tag
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 Template = template.Template
 
@@ -38,6 +46,38 @@ class TestTemplate(unittest.TestCase):
         t = Template("mudmud", renderer=dummy_renderer)
         self.assertEqual(dummy_renderer, t.renderer)
 
+class TestCompilation(unittest.TestCase):
+
+    def setUp(self): pass
+    def tearDown(self):
+        tag.get_manager().clear()
+
+    def test_compile_once(self):
+        """ Templates are only compiled once across renders """
+        tag.register("%dummy%")
+        t = Template("foo %dummy%")
+        c = t.compile()
+        self.assertEqual("foo bar", t(**{"%dummy%": "bar"}))
+        self.assertEqual("foo baz", t(**{"%dummy%": "baz"}))
+        self.assertIs(c, t.compile())
+
+    def test_recompile_on_new_tag(self):
+        """ Templates are recompiled when the registered tags change """
+        tag.register("%dummy%")
+        t = Template("foo %dummy%")
+        c = t.compile()
+        tag.register("foo")
+        self.assertIsNot(c, t.compile())
+        self.assertEqual("a b", t(**{"%dummy%": "b", "foo": "a"}))
+
+    def test_recompile_on_new_source(self):
+        """ Changing a template's string discards its compiled form """
+        tag.register("%dummy%")
+        t = Template("foo %dummy%")
+        self.assertEqual("foo bar", t(**{"%dummy%": "bar"}))
+        t.template = "%dummy% foo"
+        self.assertEqual("bar foo", t(**{"%dummy%": "bar"}))
+
 class TestFileTemplate(unittest.TestCase):
 
     tmplpath = os.path.join(os.path.dirname(__file__), "testtemplate.txt")
@@ -67,3 +107,239 @@ class TestFileTemplate(unittest.TestCase):
         """ FileTemplate custom name """
         t = Template.from_file(self.tmplpath, name='customname')
         self.assertEqual('customname', t.name)
+
+class TestStreaming(unittest.TestCase):
+
+    def setUp(self):
+        tag.register(r"{{ (\w+) }}")
+    def tearDown(self):
+        tag.get_manager().clear()
+
+    def test_render_iter(self):
+        """ Streamed chunks join into the rendered template """
+        t = Template("{{ foo }} bar " * 100)
+        t.chunk_size = 64
+        chunks = list(t.render_iter(foo="baz"))
+        self.assertTrue(len(chunks) > 1)
+        self.assertTrue(all(len(c) < 64 + 10 for c in chunks))
+        self.assertEqual(t.render(foo="baz"), "".join(chunks))
+
+    def test_render_iter_lazy(self):
+        """ Slots are evaluated lazily, once each """
+        calls = []
+        def processor(m, **context):
+            calls.append(m.group(1))
+            return m.group(1)
+        tag.register(tag.Tag(r"%(\w+)%", processor=processor))
+        t = Template("%a% " + "x" * 100 + " %b% %a%")
+        t.chunk_size = 10
+        chunks = t.render_iter()
+        first = next(chunks)
+        self.assertListEqual(["a"], calls)
+        self.assertEqual("a " + "x" * 100 + " b a", first + "".join(chunks))
+        self.assertListEqual(["a", "b"], calls)
+
+    def test_render_iter_custom_renderer(self):
+        """ Templates with a custom renderer yield their whole output """
+        t = Template("{{ foo }}", renderer=lambda t, **c: "custom")
+        self.assertListEqual(["custom"], list(t.render_iter(foo="bar")))
+
+    def test_render_to(self):
+        """ Rendering to a file-like object """
+        out = io.StringIO()
+        t = Template("{{ foo }} bar " * 100)
+        t.chunk_size = 64
+        written = t.render_to(out, foo="baz")
+        self.assertEqual(t.render(foo="baz"), out.getvalue())
+        self.assertEqual(len(out.getvalue()), written)
+
+class TestLazyFileTemplate(unittest.TestCase):
+
+    tmplpath = TestFileTemplate.tmplpath
+    tmpl     = TestFileTemplate.tmpl
+
+    def setUp(self): pass
+    def tearDown(self):
+        tag.get_manager().clear()
+
+    def test_lazy_instanciation(self):
+        """ Lazy file templates are only read when needed """
+        t = Template.from_file(self.tmplpath, lazy=True)
+        self.assertTrue(isinstance(t, template.FileTemplate))
+        self.assertFalse(t.loaded)
+        self.assertEqual('testtemplate', t.name)
+        self.assertEqual(self.tmpl, t.template)
+        self.assertTrue(t.loaded)
+
+    def test_lazy_invalid_path(self):
+        """ Lazy file templates still fail early on non-existent pathes """
+        self.assertRaises(IOError, Template.from_file, "dummy", lazy=True)
+
+    def test_lazy_rendering(self):
+        """ Rendering a lazy file template """
+        tag.register(r"{{ (\w+) }}")
+        eager = Template.from_file(self.tmplpath)
+        lazy  = Template.from_file(self.tmplpath, lazy=True)
+        ctx = dict(title="TIE Is Evil", name="Raphi", age=26)
+        self.assertEqual(eager(**ctx), lazy(**ctx))
+
+    def test_lazy_empty_file(self):
+        """ Empty files make empty templates """
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            t = template.FileTemplate(path)
+            self.assertEqual('', t.template)
+        finally:
+            os.remove(path)
+
+    def test_lazy_newlines(self):
+        """ Lazy file templates use universal newlines """
+        fd, path = tempfile.mkstemp()
+        os.write(fd, b"foo\r\nbar\rbaz")
+        os.close(fd)
+        try:
+            t = template.FileTemplate(path, encoding='utf-8')
+            self.assertEqual('foo\nbar\nbaz', t.template)
+        finally:
+            os.remove(path)
+
+class TestBatchRendering(unittest.TestCase):
+
+    def setUp(self):
+        tag.register(r"{{ (.+?) }}")
+    def tearDown(self):
+        tag.get_manager().clear()
+
+    def test_render_batch(self):
+        """ Batch rendering gives the same results as rendering each row """
+        t = Template("{{ greeting }}, {{ name }} ({{ age }})")
+        columns = {"name": ["Bob", "Alice"], "age": [32, 26]}
+        expected = [t(greeting="Hi", name=n, age=a)
+                    for n, a in zip(columns["name"], columns["age"])]
+        self.assertListEqual(expected, t.render_batch(columns, greeting="Hi"))
+
+    def test_render_batch_lookups(self):
+        """ Batch rendering with lookups and custom processors on columns """
+        tag.register(tag.Tag(r"%(\w+)%",
+                     processor=lambda m, **c: c[m.group(1)].upper()))
+        t = Template("{{ user['name'] }} %name%")
+        columns = {"user": [{"name": "bob"}, {"name": "alice"}],
+                   "name": ["foo", "bar"]}
+        self.assertListEqual(["bob FOO", "alice BAR"],
+                             t.render_batch(columns))
+
+    def test_render_batch_constant_slots(self):
+        """ Slots which don't depend on any column are evaluated once """
+        calls = []
+        def processor(m, **context):
+            calls.append(m)
+            return "const"
+        processor.depends = ()
+        tag.register(tag.Tag(r"%(\w+)%", processor=processor))
+        t = Template("%foo% {{ name }}")
+        self.assertListEqual(["const a", "const b", "const c"],
+                             t.render_batch({"name": ["a", "b", "c"]}))
+        self.assertEqual(1, len(calls))
+
+    def test_render_batch_length_mismatch(self):
+        """ Batch columns must have the same length """
+        t = Template("{{ a }} {{ b }}")
+        self.assertRaises(ValueError, t.render_batch, {"a": [1], "b": [1, 2]})
+
+    def test_render_batch_custom_renderer(self):
+        """ Templates with a custom renderer are rendered row by row """
+        t = Template("", renderer=lambda t, **c: "%(a)s-%(b)s" % c)
+        self.assertListEqual(["1-x", "2-x"],
+                             t.render_batch({"a": [1, 2]}, b="x"))
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_render_batch_numpy(self):
+        """ Batch rendering NumPy columns """
+        t = Template("{{ name }}: {{ score }}")
+        columns = {"name": numpy.array(["a", "b"]),
+                   "score": numpy.array([1, 2])}
+        self.assertListEqual(["a: 1", "b: 2"], t.render_batch(columns))
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_render_batch_numpy_scalars(self):
+        """ Batch rendering NumPy columns matches rendering each row """
+        tag.register(tag.Tag(r"\[\[(\w+)\]\]",
+                             processor=lambda m, **c: "%s" % c[m.group(1)]))
+        t = Template("{{ x }} [[x]]")
+        for col in (numpy.array(['2020-01-01T00:00'], 'datetime64[ns]'),
+                    numpy.array([3600], 'timedelta64[s]'),
+                    numpy.array([0.1], 'float32')):
+            self.assertListEqual([t.render(x=col[0])],
+                                 t.render_batch({'x': col}))
+
+class TestVariables(unittest.TestCase):
+
+    def setUp(self):
+        tag.register(r"{{ (.+?) }}")
+    def tearDown(self):
+        tag.get_manager().clear()
+
+    def test_variables(self):
+        """ Templates list the context variables they reference """
+        t = Template("{{ a }} {{ user.name }} {{ items[0] }} {{ a }}")
+        self.assertEqual(frozenset(["a", "user.name", "user", "items[0]",
+                                    "items"]), t.variables)
+        self.assertEqual(frozenset(), Template("nothing").variables)
+
+    def test_unknown_variables(self):
+        """ Processors without declared dependencies make them unknown """
+        tag.register(tag.Tag(r"%(\w+)%", processor=lambda m, **c: ""))
+        self.assertIsNone(Template("{{ a }} %b%").variables)
+        tag.register(tag.Tag(r"<(\w+)>", processor=lambda m, **c: "",
+                             depends=lambda m: (m.group(1),)))
+        self.assertEqual(frozenset(["a", "b"]),
+                         Template("{{ a }} <b>").variables)
+
+    def test_memo(self):
+        """ Outputs are memoised on the referenced variables only """
+        calls = []
+        def counting(tmpl, **context):
+            calls.append(context)
+            return renderers.default_renderer(tmpl, **context)
+        t = Template("{{ a }}", renderer=counting)
+        t.memo_size = 2
+        self.assertEqual("1", t.render(a=1, big=object()))
+        self.assertEqual("1", t.render(a=1, big=object()))
+        self.assertEqual(1, len(calls))
+        self.assertEqual("2", t.render(a=2))
+        self.assertEqual(2, len(calls))
+        # Unhashable values aren't memoised
+        t.render(a=[1])
+        t.render(a=[1])
+        self.assertEqual(4, len(calls))
+
+    def test_memo_value_types(self):
+        """ Memoised outputs are keyed on value types, and mutable values aren't memoised """
+        t = Template("{{ x }} {{ u.name }}")
+        t.memo_size = 8
+        u = type(str("User"), (), {})()
+        u.name = "foo"
+        self.assertListEqual(["1 foo", "True foo", "1.0 foo"],
+                             [t.render(x=x, u=u) for x in (1, True, 1.0)])
+        u.name = "bar"
+        self.assertEqual("1 bar", t.render(x=1, u=u))
+
+    def test_memo_invalidation(self):
+        """ Memoised outputs are dropped when the compiled form changes """
+        t = Template("{{ a }} <a>")
+        t.memo_size = 8
+        self.assertEqual("1 <a>", t.render(a=1))
+        tag.register(r"<(\w+)>")
+        self.assertEqual("1 1", t.render(a=1))
+        t.template = "{{ a }}!"
+        self.assertEqual("1!", t.render(a=1))
+
+    def test_memo_unknown_variables(self):
+        """ Templates with unknown variables are never memoised """
+        tag.register(tag.Tag(r"%(\w+)%",
+                             processor=lambda m, **c: str(c["n"])))
+        t = Template("%x%")
+        t.memo_size = 8
+        self.assertEqual("1", t.render(n=1))
+        self.assertEqual("2", t.render(n=2))
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+""" Internal utilities tests """
+import pickle
+import threading
+import unittest
+
+from tie import utils
+
+class TestLRUCache(unittest.TestCase):
+
+    def setUp(self): pass
+    def tearDown(self): pass
+
+    def test_get_set(self):
+        """ Basic item storage and retrieval """
+        c = utils.LRUCache()
+        c['foo'] = 'bar'
+        self.assertTrue('foo' in c)
+        self.assertEqual('bar', c.get('foo'))
+        self.assertIsNone(c.get('baz'))
+
+    def test_eviction(self):
+        """ Least recently used items are evicted first """
+        c = utils.LRUCache(maxsize=2)
+        c['a'] = 1
+        c['b'] = 2
+        c.get('a')
+        c['c'] = 3
+        self.assertEqual(2, len(c))
+        self.assertTrue('a' in c)
+        self.assertFalse('b' in c)
+
+    def test_clear(self):
+        """ Clearing the cache """
+        c = utils.LRUCache()
+        c['a'] = 1
+        c.clear()
+        self.assertEqual(0, len(c))
+
+    def test_ttl(self):
+        """ Items expire after ttl seconds """
+        now = [0]
+        c = utils.LRUCache(ttl=10, timer=lambda: now[0])
+        c['a'] = 1
+        now[0] = 9
+        self.assertEqual(1, c.get('a'))
+        now[0] = 10
+        self.assertFalse('a' in c)
+        self.assertIsNone(c.get('a'))
+
+    def test_stats(self):
+        """ Hits and misses are counted """
+        c = utils.LRUCache()
+        c['a'] = 1
+        c.get('a')
+        c.get('a')
+        c.get('b')
+        self.assertEqual((2, 1), (c.hits, c.misses))
+        c.reset_stats()
+        self.assertEqual((0, 0), (c.hits, c.misses))
+
+    def test_threads(self):
+        """ Caches can be shared between threads """
+        c = utils.LRUCache(maxsize=16)
+        errors = []
+        def work(offset):
+            try:
+                for i in range(2000):
+                    c[(offset + i) % 32] = i
+                    c.get((offset + i + 1) % 32)
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertListEqual([], errors)
+        self.assertEqual(8000, c.hits + c.misses)
+        self.assertEqual(16, len(c))
+
+    def test_pickle(self):
+        """ Caches can be pickled despite their lock """
+        c = utils.LRUCache()
+        c['a'] = 1
+        c = pickle.loads(pickle.dumps(c))
+        self.assertEqual(1, c.get('a'))
+        c['b'] = 2
@@ -6,9 +6,15 @@ Utilities meant to be exposed to the user should be defined in the helpers.py
 module, not here.
 """
 import sys
+import time
+import threading
+from collections import OrderedDict
 
 PY2 = sys.version_info[0] == 2
 
+# Placeholder for missing values, where None might be a legit one
+MISSING = object()
+
 ### Compatibility String Utils ###
 
 # Handle unicode between Python 2 and 3
@@ -34,3 +40,103 @@ if PY2:
         return cls
 else:
     implements_to_string = lambda x: x
+
+def method_func(obj, name):
+    """
+    Return the underlying function of the ``name`` method of ``obj`` (an
+    instance or a class), so that overriden methods can be told apart.
+    """
+    if not isinstance(obj, type):
+        obj = type(obj)
+    meth = getattr(obj, name)
+    return getattr(meth, '__func__', meth)
+
+### Caching Utils ###
+
+class LRUCache(object):
+    """
+    Minimal mapping keeping at most ``maxsize`` items, evicting the least
+    recently used ones first.
+    If ``ttl`` is set, items older than ``ttl`` seconds are discarded on
+    access.
+    Lookups through the get method are counted in the ``hits`` and ``misses``
+    attributes.
+    Operations are guarded by a per-instance lock, so that caches can be
+    shared between threads.
+    """
+    def __init__(self, maxsize=128, ttl=None, timer=time.time):
+        self.maxsize = maxsize
+        self.ttl     = ttl
+        self.timer   = timer
+        self.hits    = 0
+        self.misses  = 0
+        self._data   = OrderedDict()
+        self._lock   = threading.Lock()
+
+    def __getstate__(self):
+        """Locks can't be pickled, a new one is created on unpickling."""
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the value for ``key`` and mark it as recently used"""
+        with self._lock:
+            try:
+                val, expires = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires <= self.timer():
+                self.misses += 1
+                return default
+            self._data[key] = (val, expires)
+            self.hits += 1
+            return val
+
+    def __setitem__(self, key, val):
+        expires = None if self.ttl is None else self.timer() + self.ttl
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (val, expires)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        try:
+            _, expires = self._data[key]
+        except KeyError:
+            return False
+        return expires is None or expires > self.timer()
+
+    def __len__(self):
+        return len(self._data)
+
+    def keys(self):
+        """Return a list of all keys, least recently used first"""
+        with self._lock:
+            return list(self._data)
+
+    def pop(self, key, default=None):
+        """Remove ``key`` and return its value, or ``default``"""
+        with self._lock:
+            try:
+                val, expires = self._data.pop(key)
+            except KeyError:
+                return default
+        if expires is not None and expires <= self.timer():
+            return default
+        return val
+
+    def clear(self):
+        """Remove all items"""
+        with self._lock:
+            self._data.clear()
+
+    def reset_stats(self):
+        """Reset the hits and misses counters"""
+        self.hits = self.misses = 0